@@ -5,13 +5,25 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from flask import Flask, send_from_directory
 from flask_cors import CORS
+from sqlalchemy import event
 from src.models.user import db
 from src.routes.user import user_bp
 from src.routes.portfolio import portfolio_bp
 from src.routes.portfolio_seed import portfolio_seed_bp
+from src.routes.archive import archive_bp
+from src.routes.seed_data import seed_bp
+from src.routes.jobs import jobs_bp
+from src.routes.media import media_bp
+from src.services.search_index import create_search_index
+from src.services.annotation_index import create_annotation_index
+from src.services.graph_cache import graph_cache
+from src.services.json_provider import FastJSONProvider
+from src.services.compression import init_compression
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'portfolio_secret_key_2024'
+app.json = FastJSONProvider(app)
+init_compression(app)
 
 # Enable CORS for all routes
 CORS(app)
@@ -19,13 +31,40 @@ CORS(app)
 app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(portfolio_bp, url_prefix='/api')
 app.register_blueprint(portfolio_seed_bp, url_prefix='/api')
+app.register_blueprint(archive_bp, url_prefix='/api')
+app.register_blueprint(seed_bp, url_prefix='/api')
+app.register_blueprint(jobs_bp, url_prefix='/api')
+app.register_blueprint(media_bp, url_prefix='/api')
 
 # uncomment if you need to use database
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['GRAPH_CACHE_DIR'] = os.path.join(os.path.dirname(__file__), 'database', 'graph_cache')
+app.config['JOB_OUTPUT_DIR'] = os.path.join(os.path.dirname(__file__), 'database', 'job_output')
+app.config['MEDIA_DIR'] = os.path.join(os.path.dirname(__file__), 'database', 'media')
 db.init_app(app)
+graph_cache.init_app(app)
+
+# Milliseconds a connection waits for another one's write lock before failing
+SQLITE_BUSY_TIMEOUT = 15000
+
+def configure_sqlite(dbapi_connection, connection_record):
+    # WAL lets writers commit while streamed responses and jobs hold read
+    # cursors open; busy_timeout makes concurrent writers queue up
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute(f'PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}')
+    cursor.close()
+
 with app.app_context():
+    event.listen(db.engine, 'connect', configure_sqlite)
     db.create_all()
+    # create_all() skips the indexes of tables that already exist
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+    create_search_index(db.engine)
+    create_annotation_index(db.engine)
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
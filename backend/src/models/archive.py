@@ -23,11 +23,17 @@ class Archive(db.Model):
             'description': self.description,
             'color': self.color,
             'created_at': self.created_at.isoformat() if self.created_at else None,
-            'item_count': len(self.items)
+            'item_count': self.item_count
         }
 
 class ArchiveItem(db.Model):
     __tablename__ = 'archive_items'
+    __table_args__ = (
+        # Keyset pagination of item listings: WHERE archive_id = ? ORDER BY created_at DESC, id DESC
+        db.Index('ix_archive_items_archive_created', 'archive_id', 'created_at', 'id'),
+        # Upsert lookups of bulk ingestion: WHERE archive_id = ? AND code IN (...)
+        db.Index('ix_archive_items_archive_code', 'archive_id', 'code'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     archive_id = db.Column(db.Integer, db.ForeignKey('archives.id'), nullable=False)
@@ -53,7 +59,9 @@ class ArchiveItem(db.Model):
                                 foreign_keys='ItemConnection.source_id',
                                 backref='source_item', lazy=True)
     
-    def to_dict(self):
+    def to_dict(self, annotation_count=None):
+        if annotation_count is None:
+            annotation_count = self.annotation_count
         return {
             'id': self.id,
             'archive_id': self.archive_id,
@@ -66,14 +74,14 @@ class ArchiveItem(db.Model):
             'audio_url': self.audio_url,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'annotation_count': len(self.annotations)
+            'annotation_count': annotation_count
         }
 
 class Annotation(db.Model):
     __tablename__ = 'annotations'
     
     id = db.Column(db.Integer, primary_key=True)
-    item_id = db.Column(db.Integer, db.ForeignKey('archive_items.id'), nullable=False)
+    item_id = db.Column(db.Integer, db.ForeignKey('archive_items.id'), nullable=False, index=True)
     
     # Annotation data
     text = db.Column(db.Text, nullable=False)
@@ -109,8 +117,8 @@ class ItemConnection(db.Model):
     __tablename__ = 'item_connections'
     
     id = db.Column(db.Integer, primary_key=True)
-    source_id = db.Column(db.Integer, db.ForeignKey('archive_items.id'), nullable=False)
-    target_id = db.Column(db.Integer, db.ForeignKey('archive_items.id'), nullable=False)
+    source_id = db.Column(db.Integer, db.ForeignKey('archive_items.id'), nullable=False, index=True)
+    target_id = db.Column(db.Integer, db.ForeignKey('archive_items.id'), nullable=False, index=True)
     
     # Connection metadata
     connection_type = db.Column(db.String(50), nullable=False)  # semantic, temporal, spatial, etc.
@@ -121,7 +129,8 @@ class ItemConnection(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
-    target_item = db.relationship('ArchiveItem', foreign_keys=[target_id])
+    target_item = db.relationship('ArchiveItem', foreign_keys=[target_id],
+                                  backref=db.backref('incoming_connections', lazy=True))
     
     def to_dict(self):
         return {
@@ -138,7 +147,7 @@ class VoiceRecording(db.Model):
     __tablename__ = 'voice_recordings'
     
     id = db.Column(db.Integer, primary_key=True)
-    item_id = db.Column(db.Integer, db.ForeignKey('archive_items.id'), nullable=False)
+    item_id = db.Column(db.Integer, db.ForeignKey('archive_items.id'), nullable=False, index=True)
     
     # Recording data
     audio_url = db.Column(db.String(500), nullable=False)
@@ -169,3 +178,144 @@ class VoiceRecording(db.Model):
             'created_by': self.created_by
         }
 
+class RecordingWaveform(db.Model):
+    __tablename__ = 'recording_waveforms'
+    
+    recording_id = db.Column(db.Integer, db.ForeignKey('voice_recordings.id'), primary_key=True)
+    
+    # Peak pyramid stored as a binary file next to the audio (see services/waveform.py)
+    peaks_file = db.Column(db.String(255), nullable=False)
+    sample_rate = db.Column(db.Integer, nullable=False)
+    channels = db.Column(db.Integer, nullable=False)
+    samples_per_peak = db.Column(db.Integer, nullable=False)  # Finest level; doubles per level
+    levels = db.Column(db.Integer, nullable=False)
+    peak_count = db.Column(db.Integer, nullable=False)  # Peaks at the finest level
+    duration = db.Column(db.Float, nullable=False)
+    word_count = db.Column(db.Integer, nullable=False, default=0)
+    timing_source = db.Column(db.String(20))  # 'provided' or 'estimated'
+    
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'recording_id': self.recording_id,
+            'sample_rate': self.sample_rate,
+            'channels': self.channels,
+            'samples_per_peak': self.samples_per_peak,
+            'levels': [{
+                'level': level,
+                'peaks': -(-self.peak_count // 2 ** level),
+                'seconds_per_peak': self.samples_per_peak * 2 ** level / self.sample_rate
+            } for level in range(self.levels)],
+            'duration': self.duration,
+            'word_count': self.word_count,
+            'timing_source': self.timing_source,
+            'computed_at': self.computed_at.isoformat() if self.computed_at else None
+        }
+
+class RecordingWord(db.Model):
+    __tablename__ = 'recording_words'
+    __table_args__ = (
+        # Phrase lookup by word, and word-under-cursor lookup by time
+        db.Index('ix_recording_words_word', 'recording_id', 'word', 'position'),
+        db.Index('ix_recording_words_time', 'recording_id', 'start_time'),
+    )
+    
+    recording_id = db.Column(db.Integer, db.ForeignKey('voice_recordings.id'), primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)  # Word number in the transcript
+    word = db.Column(db.String(100), nullable=False)  # Normalized (case-folded)
+    char_start = db.Column(db.Integer, nullable=False)  # Offsets in the transcript
+    char_end = db.Column(db.Integer, nullable=False)
+    start_time = db.Column(db.Float, nullable=False)  # Seconds
+    end_time = db.Column(db.Float, nullable=False)
+
+class ItemScore(db.Model):
+    __tablename__ = 'item_scores'
+    
+    item_id = db.Column(db.Integer, db.ForeignKey('archive_items.id'), primary_key=True)
+    
+    # Centrality, recomputed in batch from connections and shared annotations
+    pagerank = db.Column(db.Float, nullable=False, default=0.0)  # Raw PageRank (sums to 1 over the graph)
+    centrality = db.Column(db.Float, nullable=False, default=0.0)  # PageRank scaled to 0-1 (1 = most central)
+    degree = db.Column(db.Integer, nullable=False, default=0)  # Number of connections
+    
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'item_id': self.item_id,
+            'pagerank': self.pagerank,
+            'centrality': self.centrality,
+            'degree': self.degree,
+            'computed_at': self.computed_at.isoformat() if self.computed_at else None
+        }
+
+class ItemSignature(db.Model):
+    __tablename__ = 'item_signatures'
+    
+    item_id = db.Column(db.Integer, db.ForeignKey('archive_items.id'), primary_key=True)
+    
+    # MinHash signatures (uint32 arrays) of the item text shingles and of its annotation concepts
+    content_signature = db.Column(db.LargeBinary, nullable=False)
+    annotation_signature = db.Column(db.LargeBinary, nullable=False)
+    
+    # State of the item when the signatures were computed, to detect stale ones
+    item_updated_at = db.Column(db.DateTime)
+    annotation_state = db.Column(db.String(50))  # "<count>:<max id>"
+    
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ConnectionSuggestion(db.Model):
+    __tablename__ = 'connection_suggestions'
+    __table_args__ = (
+        db.UniqueConstraint('source_id', 'target_id', name='uq_connection_suggestions_pair'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    source_id = db.Column(db.Integer, db.ForeignKey('archive_items.id'), nullable=False)  # Lower item id
+    target_id = db.Column(db.Integer, db.ForeignKey('archive_items.id'), nullable=False)
+    
+    # Proposed connection
+    connection_type = db.Column(db.String(50), nullable=False)  # semantic or thematic
+    strength = db.Column(db.Float, nullable=False)
+    content_similarity = db.Column(db.Float)  # Estimated Jaccard similarity of the text shingles
+    annotation_similarity = db.Column(db.Float)  # Estimated Jaccard similarity of the annotation concepts
+    
+    # Review
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True)  # pending, accepted, rejected
+    connection_id = db.Column(db.Integer, db.ForeignKey('item_connections.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    reviewed_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'source_id': self.source_id,
+            'target_id': self.target_id,
+            'connection_type': self.connection_type,
+            'strength': self.strength,
+            'content_similarity': self.content_similarity,
+            'annotation_similarity': self.annotation_similarity,
+            'status': self.status,
+            'connection_id': self.connection_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'reviewed_at': self.reviewed_at.isoformat() if self.reviewed_at else None
+        }
+
+# Counts as correlated subqueries: deferred, so list queries opt in with
+# undefer() and get the counts of a whole page from the same SELECT
+Archive.item_count = db.column_property(
+    db.select(db.func.count(ArchiveItem.id))
+      .where(ArchiveItem.archive_id == Archive.id)
+      .correlate_except(ArchiveItem)
+      .scalar_subquery(),
+    deferred=True
+)
+
+ArchiveItem.annotation_count = db.column_property(
+    db.select(db.func.count(Annotation.id))
+      .where(Annotation.item_id == ArchiveItem.id)
+      .correlate_except(Annotation)
+      .scalar_subquery(),
+    deferred=True
+)
@@ -0,0 +1,17 @@
+from src.models.user import db
+from datetime import datetime
+
+class CacheGeneration(db.Model):
+    __tablename__ = 'cache_generations'
+
+    # e.g. "archive:3" or "network"; bumped in the same transaction as every write
+    key = db.Column(db.String(100), primary_key=True)
+    generation = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'key': self.key,
+            'generation': self.generation,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
@@ -0,0 +1,42 @@
+from src.models.user import db
+from datetime import datetime
+
+class MediaAsset(db.Model):
+    """An uploaded audio file; doubles as its upload session until complete"""
+    __tablename__ = 'media_assets'
+
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    content_type = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='uploading')  # uploading, complete
+    size = db.Column(db.BigInteger)  # Declared total, if known before the last chunk
+    received = db.Column(db.BigInteger, nullable=False, default=0)
+    sha256 = db.Column(db.String(64))  # Set on completion, used as ETag
+
+    # Where the finished file's URL is written on completion
+    item_id = db.Column(db.Integer, db.ForeignKey('archive_items.id'))
+    recording_id = db.Column(db.Integer, db.ForeignKey('voice_recordings.id'))
+
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+
+    @property
+    def url(self):
+        return f'/api/media/{self.id}'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'content_type': self.content_type,
+            'status': self.status,
+            'size': self.size,
+            'received': self.received,
+            'sha256': self.sha256,
+            'url': self.url if self.status == 'complete' else None,
+            'upload_url': f'/api/media/uploads/{self.id}' if self.status == 'uploading' else None,
+            'item_id': self.item_id,
+            'recording_id': self.recording_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None
+        }
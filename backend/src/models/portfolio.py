@@ -57,15 +57,15 @@ class Project(db.Model):
             'tools': json.loads(self.tools) if self.tools else [],
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
-            'people_count': len(self.people),
-            'outputs_count': len(self.outputs)
+            'people_count': self.people_count,
+            'outputs_count': self.outputs_count
         }
 
 class ProjectPerson(db.Model):
     __tablename__ = 'project_people'
     
     id = db.Column(db.Integer, primary_key=True)
-    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False, index=True)
     name = db.Column(db.String(100), nullable=False)
     role = db.Column(db.String(100))  # Client, Collaborator, Team Member, etc.
     organization = db.Column(db.String(200))
@@ -92,7 +92,7 @@ class ProjectOutput(db.Model):
     __tablename__ = 'project_outputs'
     
     id = db.Column(db.Integer, primary_key=True)
-    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.id'), nullable=False, index=True)
     title = db.Column(db.String(200), nullable=False)
     type = db.Column(db.String(50), nullable=False)  # Report, Prototype, Policy, Design System, etc.
     description = db.Column(db.Text)
@@ -142,3 +142,19 @@ class ProjectConnection(db.Model):
             'created_at': self.created_at.isoformat()
         }
 
+# Child counts, loaded with the project row when a query undefer()s them
+Project.people_count = db.column_property(
+    db.select(db.func.count(ProjectPerson.id))
+      .where(ProjectPerson.project_id == Project.id)
+      .correlate_except(ProjectPerson)
+      .scalar_subquery(),
+    deferred=True
+)
+
+Project.outputs_count = db.column_property(
+    db.select(db.func.count(ProjectOutput.id))
+      .where(ProjectOutput.project_id == Project.id)
+      .correlate_except(ProjectOutput)
+      .scalar_subquery(),
+    deferred=True
+)
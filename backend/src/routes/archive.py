@@ -1,21 +1,72 @@
-from flask import Blueprint, request, jsonify
-from src.models.archive import db, Archive, ArchiveItem, Annotation, ItemConnection, VoiceRecording
+from flask import Blueprint, request, jsonify, current_app, stream_with_context
+from src.models.archive import db, Archive, ArchiveItem, Annotation, ItemConnection, VoiceRecording, ConnectionSuggestion, RecordingWaveform
+from src.services.search_index import build_match_query, search_items, search_annotations, render_snippet
+from src.services.graph_cache import graph_cache, archive_key, archives_generation, current_generation
+from src.services.http_cache import conditional, generation_validators, make_etag, is_not_modified, not_modified_response, add_validators
+from src.services.annotation_index import overlapping_annotation_ids
+from src.services.sparql import SparqlError, parse_query, evaluate, get_triple_store, stream_results_json
+from src.services.rdf_export import EXPORT_FORMATS, SERIALIZERS, archive_last_modified, iter_archive_descriptions
+from src.services.similarity import generate_suggestions, refresh_signatures, accept_suggestions, reject_suggestions
+from src.services.tagger import auto_annotate_archive
+from src.services.streaming import buffered, gzip_stream, json_list_stream
+from src.services.centrality import recompute_item_scores, item_centrality
+from src.services.graph_clusters import CLUSTER_BUILDERS, expand_cluster
+from src.services.graph_layout import layout_graph
+from src.services.projection import ProjectionError, requested_fields, project_dict
+from src.services.serializers import row_serializer, serialize_rows, serialize_in, serialize_in_rows
+from src.services.item_graph import get_item_graph, record_connection
+from src.services.jobs import enqueue, enqueue_once
+from src.services.waveform import WaveformError, TILE_PEAKS, ingest_recording, read_peaks, peaks_for_range, word_at, find_phrase
+from src.routes.jobs import job_accepted
+from src.services.ingest import ingest_items, ingest_annotations, iter_ndjson, iter_json_records
 from datetime import datetime
+import base64
+import binascii
 import json
+import math
 
 archive_bp = Blueprint('archive', __name__)
 
+# Nested lists of item detail, selectable with ?fields= like the item's columns
+ITEM_DETAIL_LISTS = ('annotations', 'connections', 'incoming_connections', 'voice_recordings')
+
+# Item detail carries the first page of these lists (?annotations_limit=...);
+# the rest is paged through /items/<id>/annotations and /items/<id>/voice-recordings
+PAGED_DETAIL_LISTS = ('annotations', 'voice_recordings')
+DETAIL_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Ids per multi-get request (GET /items, POST /items/batch, GET /annotations)
+MAX_MULTI_GET = 1000
+
+# Validators for conditional GETs: everything under an archive shares its cache generation
+def _archive_validators(slug, **_):
+    archive_id = db.session.execute(db.select(Archive.id).where(Archive.slug == slug)).scalar()
+    if archive_id is None:
+        return None
+    return generation_validators([archive_key(archive_id)])
+
+def _item_validators(item_id, **_):
+    archive_id = db.session.execute(db.select(ArchiveItem.archive_id).where(ArchiveItem.id == item_id)).scalar()
+    if archive_id is None:
+        return None
+    return generation_validators([archive_key(archive_id)])
+
 # Archives endpoints
 @archive_bp.route('/archives', methods=['GET'])
+@conditional(lambda: generation_validators(prefix='archive:'))
 def get_archives():
     """Get all archives"""
-    archives = Archive.query.all()
-    return jsonify([archive.to_dict() for archive in archives])
+    # Read everything before the response starts; only the encoding is streamed
+    archives = [archive.to_dict() for archive in Archive.query.options(db.undefer(Archive.item_count)).all()]
+    body = json_list_stream(archives)
+    return current_app.response_class(stream_with_context(buffered(body)), mimetype='application/json')
 
 @archive_bp.route('/archives/<slug>', methods=['GET'])
+@conditional(_archive_validators)
 def get_archive(slug):
     """Get specific archive by slug"""
-    archive = Archive.query.filter_by(slug=slug).first()
+    archive = Archive.query.options(db.undefer(Archive.item_count)).filter_by(slug=slug).first()
     if not archive:
         return jsonify({'error': 'Archive not found'}), 404
     return jsonify(archive.to_dict())
@@ -39,8 +90,9 @@ def create_archive():
 
 # Archive items endpoints
 @archive_bp.route('/archives/<slug>/items', methods=['GET'])
+@conditional(_archive_validators)
 def get_archive_items(slug):
-    """Get all items for an archive"""
+    """Get all items for an archive (page/per_page, or keyset pagination with ?cursor=)"""
     archive = Archive.query.filter_by(slug=slug).first()
     if not archive:
         return jsonify({'error': 'Archive not found'}), 404
@@ -48,18 +100,95 @@ def get_archive_items(slug):
     # Pagination
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
+    with_total = request.args.get('with_total')
+    
+    try:
+        fields = requested_fields('items')
+    except ProjectionError as e:
+        return jsonify({'error': str(e)}), 400
     
-    items = ArchiveItem.query.filter_by(archive_id=archive.id)\
-                           .order_by(ArchiveItem.created_at.desc())\
-                           .paginate(page=page, per_page=per_page, error_out=False)
+    # Rows go straight from the SELECT to dicts; only the selected columns are
+    # read, plus created_at for the cursor
+    serializer = row_serializer('items', fields and tuple(fields), ('created_at',))
+    where = ArchiveItem.archive_id == archive.id
+    statement = serializer.select().where(where)\
+                                   .order_by(ArchiveItem.created_at.desc(), ArchiveItem.id.desc())
+    
+    if 'cursor' in request.args:
+        return _get_archive_items_page(serializer, statement, where, request.args['cursor'], per_page,
+                                       with_total in ('1', 'true'))
+    
+    # Same page/per_page handling as Flask-SQLAlchemy's paginate(error_out=False)
+    page = max(page, 1)
+    per_page = per_page if per_page >= 1 else 20
+    rows = db.session.execute(statement.limit(per_page).offset((page - 1) * per_page)).all()
+    total = _count_items(where) if with_total not in ('0', 'false') else None
     
     return jsonify({
-        'items': [item.to_dict() for item in items.items],
-        'total': items.total,
-        'pages': items.pages,
+        'items': [serializer(row) for row in rows],
+        'total': total,
+        'pages': math.ceil(total / per_page) if total else 0,
         'current_page': page
     })
 
+def _count_items(where):
+    return db.session.execute(db.select(db.func.count(ArchiveItem.id)).where(where)).scalar()
+
+def _get_archive_items_page(serializer, statement, where, cursor, per_page, with_total):
+    """Keyset page of items after cursor, ordered by (created_at, id) descending"""
+    per_page = min(max(per_page, 1), 100)
+    
+    if cursor:
+        try:
+            created_at, item_id = _decode_cursor(cursor)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        statement = statement.where(_after_cursor(created_at, item_id))
+    
+    # Fetch one extra row to know whether there is a next page
+    rows = db.session.execute(statement.limit(per_page + 1)).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    
+    result = {
+        'items': [serializer(row) for row in rows],
+        'next_cursor': _encode_cursor(rows[-1]) if has_more else None,
+        'has_more': has_more,
+        'per_page': per_page
+    }
+    if with_total:
+        result['total'] = _count_items(where)
+    
+    return jsonify(result)
+
+def _after_cursor(created_at, item_id):
+    """Rows after (created_at, id) in descending order, where NULL created_at sorts last"""
+    # A row tuple compared with NULL is NULL, so rows without created_at
+    # (inserted outside the ORM) need their own branch to stay reachable
+    if created_at is None:
+        return db.and_(ArchiveItem.created_at.is_(None), ArchiveItem.id < item_id)
+    return db.or_(
+        db.tuple_(ArchiveItem.created_at, ArchiveItem.id) < (created_at, item_id),
+        ArchiveItem.created_at.is_(None))
+
+def _encode_cursor(item):
+    # created_at may come back as stored text from a serializer's row
+    created_at = item.created_at
+    if created_at is not None and not isinstance(created_at, str):
+        created_at = created_at.isoformat()
+    raw = json.dumps([created_at, item.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def _decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        created_at, item_id = json.loads(raw)
+        if created_at is not None:
+            created_at = datetime.fromisoformat(created_at)
+        return created_at, int(item_id)
+    except (TypeError, ValueError, binascii.Error):
+        raise ValueError('Invalid cursor')
+
 @archive_bp.route('/archives/<slug>/items', methods=['POST'])
 def create_archive_item(slug):
     """Create new archive item"""
@@ -85,18 +214,150 @@ def create_archive_item(slug):
     
     return jsonify(item.to_dict()), 201
 
+@archive_bp.route('/archives/<slug>/items/bulk', methods=['POST'])
+def bulk_create_archive_items(slug):
+    """Stream NDJSON items into an archive, optionally upserting on code"""
+    archive = Archive.query.filter_by(slug=slug).first()
+    if not archive:
+        return jsonify({'error': 'Archive not found'}), 404
+    
+    upsert = request.args.get('upsert') in ('1', 'true')
+    chunk_size = min(max(request.args.get('chunk_size', 1000, type=int), 1), 10000)
+    
+    report = ingest_items(archive.id, request.stream, upsert=upsert, chunk_size=chunk_size)
+    
+    return jsonify(report)
+
+def _parse_ids(values):
+    """Distinct positive ids, in request order, from a list or a comma separated string"""
+    if isinstance(values, str):
+        values = values.split(',')
+    if not isinstance(values, list):
+        raise ValueError("'ids' must be a list of ids")
+    ids = []
+    for value in values:
+        if isinstance(value, str):
+            value = value.strip()
+            if not value:
+                continue
+        try:
+            value = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid id: {value!r}')
+        if value < 1:
+            raise ValueError(f'Invalid id: {value!r}')
+        ids.append(value)
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise ValueError("'ids' is required")
+    if len(ids) > MAX_MULTI_GET:
+        raise ValueError(f'At most {MAX_MULTI_GET} ids per request')
+    return ids
+
+def _multi_get_validators(**_):
+    try:
+        ids = _parse_ids(request.args.get('ids', ''))
+    except ValueError:
+        return None
+    archive_ids = db.session.execute(
+        db.select(ArchiveItem.archive_id).where(ArchiveItem.id.in_(ids))).scalars().all()
+    if len(archive_ids) < len(ids):
+        # A missing id may later be created in any archive
+        return generation_validators(prefix='archive:')
+    return generation_validators({archive_key(archive_id) for archive_id in archive_ids})
+
+def _page_size(name, default=DETAIL_PAGE_SIZE):
+    return min(max(request.args.get(name, default, type=int), 1), MAX_PAGE_SIZE)
+
+def _load_item_details(ids):
+    """Items keyed by id, each with its child lists, in a fixed number of queries.
+
+    Every list is one IN query per batch of ids (see serializers), whatever
+    the number of items; paged lists keep their first page per item through a
+    window function and flag the rest with <list>_has_more.
+    """
+    fields = requested_fields('items', extra=ITEM_DETAIL_LISTS)
+    annotation_fields = requested_fields('annotations', primary=False)
+    
+    columns = fields and tuple(field for field in fields if field not in ITEM_DETAIL_LISTS)
+    items = {data['id']: data for data in serialize_in(row_serializer('items', columns), ArchiveItem.id, ids)}
+    found = list(items)
+    
+    children = [
+        ('annotations', Annotation.item_id, row_serializer(
+            'annotations', annotation_fields and tuple(annotation_fields), ('item_id',)), Annotation.id),
+        ('connections', ItemConnection.source_id, row_serializer('connections'), ItemConnection.id),
+        ('incoming_connections', ItemConnection.target_id, row_serializer('connections'), ItemConnection.id),
+        ('voice_recordings', VoiceRecording.item_id, row_serializer('voice_recordings'), VoiceRecording.id),
+    ]
+    for name, parent, serializer, order_by in children:
+        if fields is not None and name not in fields:
+            continue
+        limit = _page_size(f'{name}_limit') if name in PAGED_DETAIL_LISTS else None
+        for data in items.values():
+            data[name] = []
+        # One row past the page tells whether there is more
+        for data, row in serialize_in_rows(serializer, parent, found, order_by,
+                                           limit_per_value=limit and limit + 1):
+            items[getattr(row, parent.key)][name].append(data)
+        if limit is not None:
+            for data in items.values():
+                data[f'{name}_has_more'] = len(data[name]) > limit
+                del data[name][limit:]
+    return items
+
+def _multi_get_items(ids):
+    try:
+        ids = _parse_ids(ids)
+        items = _load_item_details(ids)
+    except (ValueError, ProjectionError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return jsonify({
+        'items': items,
+        'missing': [item_id for item_id in ids if item_id not in items]
+    })
+
+@archive_bp.route('/items', methods=['GET'])
+@conditional(_multi_get_validators)
+def get_items():
+    """Get several items by id (?ids=1,2,3), keyed by id, each as GET /items/<id> returns it"""
+    return _multi_get_items(request.args.get('ids', ''))
+
+@archive_bp.route('/items/batch', methods=['POST'])
+def get_items_batch():
+    """Same as GET /items for id lists too long for a URL: {"ids": [1, 2, 3]}"""
+    data = request.get_json(silent=True) or {}
+    return _multi_get_items(data.get('ids'))
+
+@archive_bp.route('/annotations', methods=['GET'])
+def get_annotations():
+    """Get several annotations by id (?ids=1,2,3), keyed by id"""
+    try:
+        ids = _parse_ids(request.args.get('ids', ''))
+        fields = requested_fields('annotations')
+    except (ValueError, ProjectionError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    serializer = row_serializer('annotations', fields and tuple(fields))
+    annotations = {data['id']: data for data in serialize_in(serializer, Annotation.id, ids)}
+    
+    return jsonify({
+        'annotations': annotations,
+        'missing': [ann_id for ann_id in ids if ann_id not in annotations]
+    })
+
 @archive_bp.route('/items/<int:item_id>', methods=['GET'])
+@conditional(_item_validators)
 def get_item(item_id):
-    """Get specific item with annotations and connections"""
-    item = ArchiveItem.query.get(item_id)
-    if not item:
+    """Get an item with its annotations, recordings (first pages) and connections in both directions"""
+    try:
+        item_data = _load_item_details([item_id]).get(item_id)
+    except ProjectionError as e:
+        return jsonify({'error': str(e)}), 400
+    if not item_data:
         return jsonify({'error': 'Item not found'}), 404
     
-    item_data = item.to_dict()
-    item_data['annotations'] = [ann.to_dict() for ann in item.annotations]
-    item_data['connections'] = [conn.to_dict() for conn in item.connections]
-    item_data['voice_recordings'] = [rec.to_dict() for rec in item.voice_recordings]
-    
     return jsonify(item_data)
 
 @archive_bp.route('/items/<int:item_id>', methods=['PUT'])
@@ -116,9 +377,81 @@ def update_item(item_id):
     item.updated_at = datetime.utcnow()
     db.session.commit()
     
+    # Keep the similarity signature in step with the edit
+    refresh_signatures([item.id])
+    
     return jsonify(item.to_dict())
 
 # Annotations endpoints
+@archive_bp.route('/items/<int:item_id>/annotations', methods=['GET'])
+def get_item_annotations(item_id):
+    """Get the annotations of an item overlapping the character range [start, end),
+    or without a range, page through all of them (?limit=&offset=, in id order)"""
+    if not db.session.get(ArchiveItem, item_id):
+        return jsonify({'error': 'Item not found'}), 404
+    
+    try:
+        fields = requested_fields('annotations')
+    except ProjectionError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    start = request.args.get('start', type=int)
+    end = request.args.get('end', type=int)
+    annotation_type = request.args.get('type')
+    
+    if start is None and end is None:
+        where = [Annotation.item_id == item_id]
+        if annotation_type:
+            where.append(Annotation.annotation_type == annotation_type)
+        return _child_page('annotations', fields, where, Annotation.id, item_id)
+    
+    limit = min(max(request.args.get('limit', 1000, type=int), 1), 5000)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    
+    if start is None or end is None:
+        return jsonify({'error': "'start' and 'end' are required"}), 400
+    if start >= end:
+        return jsonify({'error': "'start' must be lower than 'end'"}), 400
+    
+    # Range lookup in the R-tree, then load the hits in position order; one
+    # extra id tells whether there is a next page
+    ids = overlapping_annotation_ids(db.session, item_id, start, end, annotation_type=annotation_type,
+                                     limit=limit + 1, offset=offset)
+    has_more = len(ids) > limit
+    ids = ids[:limit]
+    annotations = []
+    if ids:
+        serializer = row_serializer('annotations', fields and tuple(fields))
+        annotations_by_id = {data['id']: data for data in serialize_rows(
+            serializer, serializer.select().where(Annotation.id.in_(ids)))}
+        annotations = [annotations_by_id[ann_id] for ann_id in ids]
+    
+    return jsonify({
+        'item_id': item_id,
+        'start': start,
+        'end': end,
+        'annotations': annotations,
+        'count': len(annotations),
+        'has_more': has_more
+    })
+
+def _child_page(name, fields, where, order_by, item_id):
+    """A limit/offset page of one of an item's child lists, continuing its item detail page"""
+    limit = _page_size('limit')
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    
+    serializer = row_serializer(name, fields and tuple(fields))
+    statement = serializer.select().where(*where).order_by(order_by).limit(limit + 1).offset(offset)
+    rows = list(serialize_rows(serializer, statement))
+    
+    return jsonify({
+        'item_id': item_id,
+        name: rows[:limit],
+        'count': len(rows[:limit]),
+        'offset': offset,
+        'has_more': len(rows) > limit
+    })
+
 @archive_bp.route('/items/<int:item_id>/annotations', methods=['POST'])
 def create_annotation(item_id):
     """Create annotation for item"""
@@ -144,6 +477,25 @@ def create_annotation(item_id):
     
     return jsonify(annotation.to_dict()), 201
 
+@archive_bp.route('/annotations/bulk', methods=['POST'])
+def bulk_create_annotations():
+    """Create many annotations at once (JSON list or NDJSON), validating spans against item content"""
+    chunk_size = min(max(request.args.get('chunk_size', 1000, type=int), 1), 10000)
+    
+    if request.is_json:
+        data = request.get_json()
+        if isinstance(data, dict):
+            data = data.get('annotations')
+        if not isinstance(data, list):
+            return jsonify({'error': 'Expected a list of annotations'}), 400
+        records = iter_json_records(data)
+    else:
+        records = iter_ndjson(request.stream)
+    
+    report = ingest_annotations(records, chunk_size=chunk_size)
+    
+    return jsonify(report)
+
 @archive_bp.route('/annotations/<int:annotation_id>', methods=['DELETE'])
 def delete_annotation(annotation_id):
     """Delete annotation"""
@@ -177,12 +529,93 @@ def create_connection(item_id):
         properties=json.dumps(data.get('properties', {}))
     )
     
+    # Read before the write so the cached adjacency can take just this edge
+    generation = archives_generation()
     db.session.add(connection)
     db.session.commit()
+    record_connection(connection, generation)
+    # Scores follow connections; one queued recompute covers any number of them
+    enqueue_once('scores')
     
     return jsonify(connection.to_dict()), 201
 
+def _item_summaries(item_ids):
+    """id -> {id, title, code, archive_id} for the given items, in one query"""
+    rows = db.session.execute(
+        db.select(ArchiveItem.id, ArchiveItem.title, ArchiveItem.code, ArchiveItem.archive_id)
+          .where(ArchiveItem.id.in_(list(item_ids)))
+    )
+    return {row.id: dict(row._mapping) for row in rows}
+
+@archive_bp.route('/items/<int:item_id>/neighbors', methods=['GET'])
+def get_item_neighbors(item_id):
+    """Items within depth hops of an item, following connections in both directions"""
+    depth = min(max(request.args.get('depth', 1, type=int), 1), 6)
+    limit = min(max(request.args.get('limit', 500, type=int), 1), 5000)
+    
+    graph = get_item_graph()
+    if item_id not in graph.index:
+        return jsonify({'error': 'Item not found'}), 404
+    
+    distances, edges, truncated = graph.k_hop(item_id, depth, limit)
+    items = _item_summaries(distances)
+    neighbors = [dict(items[neighbor_id], distance=distance)
+                 for neighbor_id, distance in distances.items()
+                 if neighbor_id != item_id and neighbor_id in items]
+    
+    return jsonify({
+        'item_id': item_id,
+        'depth': depth,
+        'neighbors': neighbors,
+        'edges': edges,
+        'count': len(neighbors),
+        'truncated': truncated
+    })
+
+@archive_bp.route('/paths', methods=['GET'])
+def get_path():
+    """Shortest connection path between two items (fewest hops, or strongest with weighted=true)"""
+    from_id = request.args.get('from', type=int)
+    to_id = request.args.get('to', type=int)
+    weighted = request.args.get('weighted', 'false').lower() in ('1', 'true', 'yes')
+    
+    if from_id is None or to_id is None:
+        return jsonify({'error': "'from' and 'to' item ids are required"}), 400
+    
+    graph = get_item_graph()
+    if from_id not in graph.index or to_id not in graph.index:
+        return jsonify({'error': 'One or both items not found'}), 404
+    
+    result = graph.shortest_path(from_id, to_id, weighted=weighted)
+    if result is None:
+        return jsonify({'error': 'No path between the items', 'from': from_id, 'to': to_id}), 404
+    
+    path_ids, edges, cost = result
+    items = _item_summaries(path_ids)
+    return jsonify({
+        'from': from_id,
+        'to': to_id,
+        'weighted': weighted,
+        'items': [items[path_id] for path_id in path_ids if path_id in items],
+        'edges': edges,
+        'hops': len(edges),
+        'cost': cost
+    })
+
 # Voice recordings endpoints
+@archive_bp.route('/items/<int:item_id>/voice-recordings', methods=['GET'])
+def get_item_voice_recordings(item_id):
+    """Page through the voice recordings of an item (?limit=&offset=, in id order)"""
+    if not db.session.get(ArchiveItem, item_id):
+        return jsonify({'error': 'Item not found'}), 404
+    
+    try:
+        fields = requested_fields('voice_recordings')
+    except ProjectionError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return _child_page('voice_recordings', fields, [VoiceRecording.item_id == item_id], VoiceRecording.id, item_id)
+
 @archive_bp.route('/items/<int:item_id>/voice-recordings', methods=['POST'])
 def create_voice_recording(item_id):
     """Create voice recording for item"""
@@ -207,6 +640,97 @@ def create_voice_recording(item_id):
     
     return jsonify(recording.to_dict()), 201
 
+@archive_bp.route('/voice-recordings/<int:recording_id>/waveform', methods=['POST'])
+def ingest_voice_recording(recording_id):
+    """Compute waveform peaks and the word-timing index of an uploaded WAV recording"""
+    recording = db.session.get(VoiceRecording, recording_id)
+    if not recording:
+        return jsonify({'error': 'Voice recording not found'}), 404
+    
+    data = request.get_json(silent=True) or {}
+    words = data.get('words')
+    if words is not None and not isinstance(words, list):
+        return jsonify({'error': "'words' must be a list of {start, end} timings"}), 400
+    
+    if data.get('background'):
+        return job_accepted(enqueue('waveform', {'recording': recording.id, 'words': words}))
+    try:
+        return jsonify(ingest_recording(recording, words=words))
+    except WaveformError as e:
+        return jsonify({'error': str(e)}), 422
+
+def _recording_waveform(recording_id):
+    return db.session.get(RecordingWaveform, recording_id)
+
+def _peaks_response(waveform, level, first, peaks):
+    """Peaks as int8 (min, max) pairs: raw bytes if asked for, JSON otherwise"""
+    if request.args.get('format') == 'bin':
+        response = current_app.response_class(peaks.tobytes(), mimetype='application/octet-stream')
+        response.headers['X-Peak-Level'] = str(level)
+        response.headers['X-Peak-Start'] = str(first)
+    else:
+        seconds_per_peak = waveform.samples_per_peak * 2 ** level / waveform.sample_rate
+        response = jsonify({
+            'level': level,
+            'start': first,
+            'seconds_per_peak': seconds_per_peak,
+            'start_time': round(first * seconds_per_peak, 6),
+            'peaks': peaks.tolist()
+        })
+    response.set_etag(f'{waveform.recording_id}-{waveform.computed_at.timestamp()}-{level}-{first}-{len(peaks)}')
+    return response.make_conditional(request)
+
+@archive_bp.route('/voice-recordings/<int:recording_id>/waveform', methods=['GET'])
+def get_voice_recording_waveform(recording_id):
+    """Waveform levels; with ?start=&end= (seconds) and ?width= the peaks of that window"""
+    waveform = _recording_waveform(recording_id)
+    if not waveform:
+        return jsonify({'error': 'Waveform not computed'}), 404
+    
+    start = request.args.get('start', type=float)
+    end = request.args.get('end', type=float)
+    if start is None and end is None:
+        return jsonify(waveform.to_dict())
+    if not all(math.isfinite(value) for value in (start, end) if value is not None):
+        return jsonify({'error': "'start' and 'end' must be finite numbers"}), 400
+    
+    start = max(start or 0.0, 0.0)
+    end = min(end if end is not None else waveform.duration, waveform.duration)
+    if end <= start:
+        return jsonify({'error': "'end' must be after 'start'"}), 400
+    width = min(max(request.args.get('width', 1000, type=int), 1), 10 * TILE_PEAKS)
+    return _peaks_response(waveform, *peaks_for_range(waveform, start, end, width))
+
+@archive_bp.route('/voice-recordings/<int:recording_id>/waveform/<int:level>/<int:tile>', methods=['GET'])
+def get_voice_recording_waveform_tile(recording_id, level, tile):
+    """One tile (TILE_PEAKS peaks) of a waveform level; level 0 is the finest"""
+    waveform = _recording_waveform(recording_id)
+    if not waveform:
+        return jsonify({'error': 'Waveform not computed'}), 404
+    if level >= waveform.levels:
+        return jsonify({'error': f'Level must be below {waveform.levels}'}), 404
+    
+    peaks = read_peaks(waveform, level, tile * TILE_PEAKS, TILE_PEAKS)
+    if not len(peaks):
+        return jsonify({'error': 'Tile out of range'}), 404
+    return _peaks_response(waveform, level, tile * TILE_PEAKS, peaks)
+
+@archive_bp.route('/voice-recordings/<int:recording_id>/seek', methods=['GET'])
+def seek_voice_recording(recording_id):
+    """Time span of a phrase (?q=) in the recording, or the word spoken at a time (?t=)"""
+    if not _recording_waveform(recording_id):
+        return jsonify({'error': 'Waveform not computed'}), 404
+    
+    phrase = request.args.get('q', '').strip()
+    if phrase:
+        limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+        return jsonify({'query': phrase, 'matches': find_phrase(recording_id, phrase, limit)})
+    
+    seconds = request.args.get('t', type=float)
+    if seconds is None or not math.isfinite(seconds):
+        return jsonify({'error': "Pass a phrase (?q=) or a time in seconds (?t=)"}), 400
+    return jsonify({'t': seconds, 'word': word_at(recording_id, seconds)})
+
 # Graph data endpoint
 @archive_bp.route('/archives/<slug>/graph', methods=['GET'])
 def get_archive_graph(slug):
@@ -215,30 +739,81 @@ def get_archive_graph(slug):
     if not archive:
         return jsonify({'error': 'Archive not found'}), 404
     
-    # Get all items and their connections
+    try:
+        item_fields = requested_fields('items')
+        annotation_fields = requested_fields('annotations', primary=False)
+    except ProjectionError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    archive_id = archive.id
+    key = archive_key(archive_id)
+    etag, last_modified = generation_validators([key])
+    if is_not_modified(etag, last_modified):
+        return not_modified_response(etag, last_modified)
+    
+    snapshot = graph_cache.get(key, lambda: build_archive_graph(db.session.get(Archive, archive_id)))
+    payload = snapshot.payload
+    if item_fields or annotation_fields:
+        fieldset = (item_fields and tuple(item_fields), annotation_fields and tuple(annotation_fields))
+        payload = graph_cache.projection(key, snapshot, fieldset,
+                                         lambda payload: _project_graph(payload, item_fields, annotation_fields))
+    response = current_app.response_class(payload, mimetype='application/json')
+    # A snapshot served while another worker rebuilds it can be a generation behind
+    if snapshot.generation != current_generation(key):
+        etag = make_etag(1, snapshot.generation)
+    return add_validators(response, etag, last_modified)
+
+def _project_graph(payload, item_fields, annotation_fields):
+    """Apply sparse fieldsets to the node data of a cached graph snapshot.
+
+    The snapshot is shared by every projection, so it is trimmed after the
+    fact and the result cached next to it (graph_cache.projection).
+    """
+    graph = current_app.json.loads(payload)
+    for node in graph['nodes']:
+        node['data'] = project_dict(node['data'], item_fields if node['type'] == 'item' else annotation_fields)
+    return current_app.json.dumps(graph)
+
+def build_archive_graph(archive):
+    """Build the node/edge graph of an archive with a fixed number of queries"""
+    # Get all items, their annotations and their connections in one query each
     items = ArchiveItem.query.filter_by(archive_id=archive.id).all()
+    annotations = Annotation.query.join(ArchiveItem, Annotation.item_id == ArchiveItem.id)\
+                                  .filter(ArchiveItem.archive_id == archive.id)\
+                                  .order_by(Annotation.id).all()
     connections = ItemConnection.query.join(ArchiveItem, ItemConnection.source_id == ArchiveItem.id)\
                                     .filter(ArchiveItem.archive_id == archive.id).all()
     
-    # Build nodes
+    # Group annotations per item
+    annotations_by_item = {}
+    for annotation in annotations:
+        annotations_by_item.setdefault(annotation.item_id, []).append(annotation)
+    
+    scores = item_centrality([item.id for item in items])
+    
+    # Build nodes and annotation edges in a single pass over the items
     nodes = []
+    annotation_edges = []
     for item in items:
-        # Get annotation types for this item
-        annotation_types = db.session.query(Annotation.annotation_type)\
-                                   .filter_by(item_id=item.id)\
-                                   .distinct().all()
+        item_annotations = annotations_by_item.get(item.id, [])
+        
+        # Distinct annotation types, in order of first appearance
+        annotation_types = list(dict.fromkeys(ann.annotation_type for ann in item_annotations))
+        centrality, degree = scores.get(item.id, (None, None))
         
         node = {
             'id': f"item_{item.id}",
             'label': item.title,
             'type': 'item',
-            'data': item.to_dict(),
-            'annotation_types': [t[0] for t in annotation_types]
+            'data': item.to_dict(annotation_count=len(item_annotations)),
+            'annotation_types': annotation_types,
+            'centrality': centrality,
+            'degree': degree
         }
         nodes.append(node)
         
         # Add annotation nodes
-        for annotation in item.annotations:
+        for annotation in item_annotations:
             ann_node = {
                 'id': f"annotation_{annotation.id}",
                 'label': annotation.text[:50] + "..." if len(annotation.text) > 50 else annotation.text,
@@ -246,11 +821,18 @@ def get_archive_graph(slug):
                 'data': annotation.to_dict()
             }
             nodes.append(ann_node)
+            
+            # Annotation to item connection
+            annotation_edges.append({
+                'id': f"item_ann_{item.id}_{annotation.id}",
+                'source': f"item_{item.id}",
+                'target': f"annotation_{annotation.id}",
+                'type': 'annotation',
+                'strength': annotation.confidence
+            })
     
-    # Build edges
+    # Build edges: item connections first, then annotation edges
     edges = []
-    
-    # Item connections
     for conn in connections:
         edge = {
             'id': f"conn_{conn.id}",
@@ -261,119 +843,324 @@ def get_archive_graph(slug):
             'data': conn.to_dict()
         }
         edges.append(edge)
+    edges.extend(annotation_edges)
     
-    # Annotation to item connections
-    for item in items:
-        for annotation in item.annotations:
-            edge = {
-                'id': f"item_ann_{item.id}_{annotation.id}",
-                'source': f"item_{item.id}",
-                'target': f"annotation_{annotation.id}",
-                'type': 'annotation',
-                'strength': annotation.confidence
-            }
-            edges.append(edge)
+    return layout_graph(archive_key(archive.id), {
+        'nodes': nodes,
+        'edges': edges,
+        'archive': archive.to_dict()
+    })
+
+# Centrality
+@archive_bp.route('/scores/recompute', methods=['POST'])
+def recompute_scores():
+    """Recompute item PageRank/degree from connections and shared annotations"""
+    data = request.get_json(silent=True) or {}
+    if data.get('background'):
+        return job_accepted(enqueue('scores'))
+    return jsonify(recompute_item_scores())
+
+# Dictionary-based auto-annotation
+@archive_bp.route('/archives/<slug>/auto-annotate', methods=['POST'])
+def auto_annotate(slug):
+    """Annotate every item of an archive with terms already annotated elsewhere"""
+    archive = Archive.query.filter_by(slug=slug).first()
+    if not archive:
+        return jsonify({'error': 'Archive not found'}), 404
+    
+    data = request.get_json(silent=True) or {}
+    workers = data.get('workers')
+    if workers is not None and (not isinstance(workers, int) or not 1 <= workers <= 64):
+        return jsonify({'error': "'workers' must be an integer between 1 and 64"}), 400
+    
+    if data.get('background'):
+        return job_accepted(enqueue('auto_annotate', {'archive': archive.slug, 'workers': workers,
+                                                      'dry_run': bool(data.get('dry_run'))}))
+    return jsonify(auto_annotate_archive(archive, workers=workers, dry_run=bool(data.get('dry_run'))))
+
+# Connection suggestions
+@archive_bp.route('/suggestions/generate', methods=['POST'])
+def generate_connection_suggestions():
+    """Propose connections between similar items (MinHash/LSH over text and annotations)"""
+    data = request.get_json(silent=True) or {}
+    min_similarity = data.get('min_similarity', 0.3)
+    if not isinstance(min_similarity, (int, float)) or not 0 < min_similarity <= 1:
+        return jsonify({'error': "'min_similarity' must be a number in (0, 1]"}), 400
+    if data.get('background'):
+        return job_accepted(enqueue('suggestions', {'min_similarity': min_similarity}))
+    return jsonify(generate_suggestions(min_similarity=min_similarity))
+
+@archive_bp.route('/suggestions', methods=['GET'])
+def get_connection_suggestions():
+    """List suggestions for review, strongest first"""
+    status = request.args.get('status', 'pending')
+    min_strength = request.args.get('min_strength', 0.0, type=float)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    
+    query = ConnectionSuggestion.query.filter(ConnectionSuggestion.status == status,
+                                              ConnectionSuggestion.strength >= min_strength)
+    archive_slug = request.args.get('archive')
+    if archive_slug:
+        archive = Archive.query.filter_by(slug=archive_slug).first()
+        if not archive:
+            return jsonify({'error': 'Archive not found'}), 404
+        archive_items = db.select(ArchiveItem.id).where(ArchiveItem.archive_id == archive.id)
+        query = query.filter(db.or_(ConnectionSuggestion.source_id.in_(archive_items),
+                                    ConnectionSuggestion.target_id.in_(archive_items)))
+    
+    total = query.count()
+    suggestions = query.order_by(ConnectionSuggestion.strength.desc(), ConnectionSuggestion.id)\
+                       .limit(limit).offset(offset).all()
+    items = _item_summaries({item_id for suggestion in suggestions
+                             for item_id in (suggestion.source_id, suggestion.target_id)})
+    
+    results = []
+    for suggestion in suggestions:
+        suggestion_data = suggestion.to_dict()
+        suggestion_data['source'] = items.get(suggestion.source_id)
+        suggestion_data['target'] = items.get(suggestion.target_id)
+        results.append(suggestion_data)
     
     return jsonify({
+        'suggestions': results,
+        'total': total,
+        'has_more': offset + len(results) < total
+    })
+
+@archive_bp.route('/suggestions/<int:suggestion_id>/<action>', methods=['POST'])
+def review_connection_suggestion(suggestion_id, action):
+    """Accept (creating the connection) or reject one suggestion"""
+    if action not in ('accept', 'reject'):
+        return jsonify({'error': "Action must be 'accept' or 'reject'"}), 404
+    
+    suggestion = db.session.get(ConnectionSuggestion, suggestion_id)
+    if not suggestion:
+        return jsonify({'error': 'Suggestion not found'}), 404
+    if suggestion.status != 'pending':
+        return jsonify({'error': f'Suggestion already {suggestion.status}'}), 409
+    
+    if action == 'accept':
+        accept_suggestions([suggestion])
+        enqueue_once('scores')
+    else:
+        reject_suggestions([suggestion])
+    return jsonify(suggestion.to_dict())
+
+@archive_bp.route('/suggestions/accept', methods=['POST'])
+def bulk_accept_connection_suggestions():
+    """Accept many pending suggestions: {"ids": [...]} or {"min_strength": x}"""
+    data = request.get_json(silent=True) or {}
+    
+    query = ConnectionSuggestion.query.filter_by(status='pending')
+    if 'ids' in data:
+        if not isinstance(data['ids'], list):
+            return jsonify({'error': "'ids' must be a list"}), 400
+        query = query.filter(ConnectionSuggestion.id.in_(data['ids']))
+    elif 'min_strength' in data:
+        try:
+            min_strength = float(data['min_strength'])
+        except (TypeError, ValueError):
+            return jsonify({'error': "'min_strength' must be a number"}), 400
+        if not math.isfinite(min_strength):
+            return jsonify({'error': "'min_strength' must be a finite number"}), 400
+        query = query.filter(ConnectionSuggestion.strength >= min_strength)
+    else:
+        return jsonify({'error': "Provide 'ids' or 'min_strength'"}), 400
+    
+    accepted = accept_suggestions(query.all())
+    if accepted:
+        enqueue_once('scores')
+    return jsonify({'accepted': accepted})
+
+# Level-of-detail graph
+def _cluster_scope():
+    """Archive id from ?archive=<slug>; (None, None) for all archives, (None, error) for unknown slugs"""
+    slug = request.args.get('archive')
+    if not slug:
+        return None, None
+    archive = Archive.query.filter_by(slug=slug).first()
+    if not archive:
+        return None, (jsonify({'error': 'Archive not found'}), 404)
+    return archive.id, None
+
+@archive_bp.route('/graph/clusters', methods=['GET'])
+def get_graph_clusters():
+    """Aggregated super-nodes of the graph, by archive, annotation type or connection community"""
+    by = request.args.get('by', 'type')
+    if by not in CLUSTER_BUILDERS:
+        return jsonify({'error': f"'by' must be one of: {', '.join(CLUSTER_BUILDERS)}"}), 400
+    limit = min(max(request.args.get('limit', 200, type=int), 1), 1000)
+    
+    archive_id, error = _cluster_scope()
+    if error:
+        return error
+    
+    nodes, edges = CLUSTER_BUILDERS[by](archive_id)
+    total = len(nodes)
+    nodes = nodes[:limit]
+    shown = {node['id'] for node in nodes}
+    edges = [edge for edge in edges if edge['source'] in shown and edge['target'] in shown]
+    
+    return jsonify({
+        'by': by,
+        'archive': request.args.get('archive'),
         'nodes': nodes,
         'edges': edges,
-        'archive': archive.to_dict()
+        'total': total,
+        'has_more': total > len(nodes)
     })
 
+@archive_bp.route('/graph/clusters/<kind>/<key>', methods=['GET'])
+def get_graph_cluster(kind, key):
+    """Expand one super-node into its item/annotation nodes, a page at a time"""
+    limit = min(max(request.args.get('limit', 200, type=int), 1), 1000)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    
+    archive_id, error = _cluster_scope()
+    if error:
+        return error
+    
+    result = expand_cluster(kind, key, archive_id=archive_id, limit=limit, offset=offset)
+    if result is None:
+        return jsonify({'error': 'Cluster not found'}), 404
+    
+    nodes, edges, total = result
+    return jsonify({
+        'cluster': f'{kind}:{key}',
+        'nodes': nodes,
+        'edges': edges,
+        'total': total,
+        'offset': offset,
+        'has_more': offset + limit < total
+    })
+
+# Linked data export
+@archive_bp.route('/archives/<slug>/export.<fmt>', methods=['GET'])
+def export_archive(slug, fmt):
+    """Stream a whole archive as N-Triples (nt), Turtle (ttl) or JSON-LD (jsonld)"""
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unsupported format, use one of: {', '.join(EXPORT_FORMATS)}"}), 404
+    
+    archive = Archive.query.filter_by(slug=slug).first()
+    if not archive:
+        return jsonify({'error': 'Archive not found'}), 404
+    
+    last_modified = archive_last_modified(archive)
+    if last_modified and request.if_modified_since and last_modified <= request.if_modified_since:
+        response = current_app.response_class(status=304)
+        response.last_modified = last_modified
+        return response
+    
+    body = SERIALIZERS[fmt](iter_archive_descriptions(archive))
+    gzip = request.accept_encodings.best_match(['gzip', 'identity']) == 'gzip'
+    body = gzip_stream(body) if gzip else buffered(body)
+    
+    response = current_app.response_class(stream_with_context(body), mimetype=EXPORT_FORMATS[fmt])
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Content-Disposition'] = f'attachment; filename="{archive.slug}.{fmt}"'
+    response.vary.add('Accept-Encoding')
+    if gzip:
+        response.content_encoding = 'gzip'
+    return response
+
 # Search endpoint
 @archive_bp.route('/search', methods=['GET'])
 def search():
-    """Search across all archives"""
+    """Ranked full-text search across all archives"""
     query = request.args.get('q', '')
     archive_slug = request.args.get('archive')
     annotation_type = request.args.get('type')
     
-    if not query:
-        return jsonify({'results': []})
+    # Pagination
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 50, type=int), 1), 100)
+    offset = (page - 1) * per_page
     
-    # Build base query
-    base_query = ArchiveItem.query
+    match = build_match_query(query)
+    if not match:
+        return jsonify({'results': []})
     
+    archive_id = None
     if archive_slug:
         archive = Archive.query.filter_by(slug=archive_slug).first()
         if archive:
-            base_query = base_query.filter_by(archive_id=archive.id)
+            archive_id = archive.id
     
-    # Search in title, description, and content
-    search_filter = db.or_(
-        ArchiveItem.title.contains(query),
-        ArchiveItem.description.contains(query),
-        ArchiveItem.content.contains(query)
-    )
+    item_rows, items_total = search_items(db.session, match, archive_id=archive_id,
+                                          limit=per_page, offset=offset)
+    annotation_rows, annotations_total = search_annotations(db.session, match, archive_id=archive_id,
+                                                            annotation_type=annotation_type,
+                                                            limit=per_page, offset=offset)
     
-    items = base_query.filter(search_filter).limit(50).all()
+    # Load the hits in one query each and restore the ranking order
+    items_by_id = {}
+    if item_rows:
+        serializer = row_serializer('items')
+        items_by_id = {data['id']: data for data in serialize_rows(
+            serializer, serializer.select().where(ArchiveItem.id.in_([row.id for row in item_rows])))}
+    annotations_by_id = {}
+    if annotation_rows:
+        serializer = row_serializer('annotations')
+        annotations_by_id = {data['id']: data for data in serialize_rows(
+            serializer, serializer.select().where(Annotation.id.in_([row.id for row in annotation_rows])))}
     
-    # Also search in annotations
-    annotation_query = Annotation.query.filter(Annotation.text.contains(query))
-    if annotation_type:
-        annotation_query = annotation_query.filter_by(annotation_type=annotation_type)
+    scores = item_centrality(items_by_id)
+    items = []
+    for row in item_rows:
+        item_data = items_by_id[row.id]
+        item_data['score'] = -row.score
+        item_data['centrality'] = scores.get(row.id, (None, None))[0]
+        item_data['snippet'] = render_snippet(row.snippet)
+        items.append(item_data)
     
-    annotations = annotation_query.limit(50).all()
+    annotations = []
+    for row in annotation_rows:
+        ann_data = annotations_by_id[row.id]
+        ann_data['score'] = -row.score
+        ann_data['snippet'] = render_snippet(row.snippet)
+        annotations.append(ann_data)
     
     results = {
-        'items': [item.to_dict() for item in items],
-        'annotations': [ann.to_dict() for ann in annotations],
-        'total': len(items) + len(annotations)
+        'items': items,
+        'annotations': annotations,
+        'total': items_total + annotations_total,
+        'items_total': items_total,
+        'annotations_total': annotations_total,
+        'page': page,
+        'per_page': per_page
     }
     
     return jsonify(results)
 
-# SPARQL-like endpoint for linked data
+# SPARQL endpoint for linked data
 @archive_bp.route('/sparql', methods=['GET', 'POST'])
 def sparql_endpoint():
-    """Simple SPARQL-like endpoint for linked data queries"""
+    """Evaluate a SPARQL SELECT (basic graph pattern, FILTER, LIMIT/OFFSET) over the archives"""
     if request.method == 'POST':
-        query = request.get_json().get('query', '')
+        if request.mimetype == 'application/sparql-query':
+            query = request.get_data(as_text=True)
+        elif request.is_json:
+            query = (request.get_json() or {}).get('query', '')
+        else:
+            query = request.form.get('query', '')
     else:
         query = request.args.get('query', '')
     
-    # This is a simplified implementation
-    # In a real system, you'd use a proper SPARQL engine like Apache Jena
+    if not query.strip():
+        return jsonify({'error': 'Missing query'}), 400
     
-    results = []
+    try:
+        parsed = parse_query(query)
+    except SparqlError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Simple pattern matching for demo purposes
-    if 'SELECT' in query.upper():
-        # Return all items with their annotations as RDF-like triples
-        items = ArchiveItem.query.limit(100).all()
-        
-        for item in items:
-            # Item triples
-            item_uri = f"http://archival-consciousness.org/item/{item.id}"
-            results.append({
-                'subject': item_uri,
-                'predicate': 'http://purl.org/dc/terms/title',
-                'object': item.title
-            })
-            
-            if item.description:
-                results.append({
-                    'subject': item_uri,
-                    'predicate': 'http://purl.org/dc/terms/description',
-                    'object': item.description
-                })
-            
-            # Annotation triples
-            for annotation in item.annotations:
-                ann_uri = f"http://archival-consciousness.org/annotation/{annotation.id}"
-                results.append({
-                    'subject': ann_uri,
-                    'predicate': 'http://www.w3.org/1999/02/22-rdf-syntax-ns#type',
-                    'object': f"http://archival-consciousness.org/ontology/{annotation.annotation_type}"
-                })
-                results.append({
-                    'subject': ann_uri,
-                    'predicate': 'http://archival-consciousness.org/ontology/annotates',
-                    'object': item_uri
-                })
+    store = get_triple_store()
+    try:
+        variables, solutions = evaluate(store, parsed)
+    except SparqlError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify({
-        'results': results,
-        'count': len(results)
-    })
-
+    return current_app.response_class(stream_results_json(variables, solutions),
+                                      mimetype='application/sparql-results+json')
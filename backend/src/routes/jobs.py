@@ -0,0 +1,93 @@
+from flask import Blueprint, request, jsonify, send_file, url_for
+from src.models.job import db, Job, JOB_STATUSES
+from src.services.jobs import TASKS, enqueue, cancel_job, export_path
+import os
+
+jobs_bp = Blueprint('jobs', __name__)
+
+def job_accepted(job):
+    """202 response pointing at the job's status URL"""
+    response = jsonify(job.to_dict())
+    response.status_code = 202
+    response.headers['Location'] = url_for('jobs.get_job', job_id=job.id)
+    return response
+
+@jobs_bp.route('/jobs', methods=['POST'])
+def create_job():
+    """Queue a background job: {"kind": ..., "params": {...}}"""
+    data = request.get_json(silent=True) or {}
+    kind = data.get('kind')
+    params = data.get('params') or {}
+    if kind not in TASKS:
+        return jsonify({'error': f"'kind' must be one of: {', '.join(sorted(TASKS))}"}), 400
+    if not isinstance(params, dict):
+        return jsonify({'error': "'params' must be an object"}), 400
+
+    max_attempts = data.get('max_attempts')
+    if max_attempts is not None and (not isinstance(max_attempts, int) or not 1 <= max_attempts <= 10):
+        return jsonify({'error': "'max_attempts' must be an integer between 1 and 10"}), 400
+
+    return job_accepted(enqueue(kind, params, max_attempts))
+
+@jobs_bp.route('/jobs', methods=['GET'])
+def get_jobs():
+    """List jobs, newest first (?status=, ?kind=)"""
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+
+    query = Job.query
+    status = request.args.get('status')
+    if status:
+        if status not in JOB_STATUSES:
+            return jsonify({'error': f"'status' must be one of: {', '.join(JOB_STATUSES)}"}), 400
+        query = query.filter(Job.status == status)
+    kind = request.args.get('kind')
+    if kind:
+        query = query.filter(Job.kind == kind)
+
+    total = query.count()
+    jobs = query.order_by(Job.id.desc()).limit(limit).offset(offset).all()
+    return jsonify({
+        'jobs': [job.to_dict() for job in jobs],
+        'total': total,
+        'has_more': offset + len(jobs) < total
+    })
+
+@jobs_bp.route('/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status, progress and (once finished) result of a job"""
+    job = db.session.get(Job, job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    response = jsonify(job.to_dict())
+    if job.status in ('queued', 'running'):
+        # Hint for pollers
+        response.headers['Retry-After'] = '1' if job.status == 'running' else '2'
+    return response
+
+@jobs_bp.route('/jobs/<int:job_id>/cancel', methods=['POST'])
+def cancel(job_id):
+    """Cancel a queued job, or ask a running one to stop at its next progress report"""
+    job = db.session.get(Job, job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    if not cancel_job(job):
+        return jsonify({'error': f'Job already {job.status}'}), 409
+    return jsonify(job.to_dict()), 202
+
+@jobs_bp.route('/jobs/<int:job_id>/download', methods=['GET'])
+def download_job_output(job_id):
+    """File written by a finished export job"""
+    job = db.session.get(Job, job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    result = job.to_dict()['result']
+    if job.kind != 'export' or job.status != 'succeeded' or not result:
+        return jsonify({'error': 'Job has no output'}), 404
+
+    path = export_path(job.id, result['format'])
+    if not os.path.exists(path):
+        return jsonify({'error': 'Job output expired'}), 410
+    return send_file(path, mimetype=result['content_type'], as_attachment=True,
+                     download_name=f"{result['archive']}.{result['format']}", conditional=True)
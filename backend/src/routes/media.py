@@ -0,0 +1,129 @@
+from flask import Blueprint, request, jsonify, send_file
+from werkzeug.http import parse_content_range_header
+from src.models.media import db, MediaAsset
+from src.models.archive import ArchiveItem, VoiceRecording
+from src.services.media import MAX_MEDIA_BYTES, UploadError, media_type, media_path, write_chunk, delete_media
+from src.services.jobs import enqueue
+import os
+
+media_bp = Blueprint('media', __name__)
+
+# Recordings in these formats get their waveform computed once uploaded
+WAVEFORM_TYPES = ('audio/wav', 'audio/x-wav', 'audio/wave', 'audio/vnd.wave')
+
+# Finished assets never change, so clients may keep them for a long time
+MEDIA_MAX_AGE = 7 * 24 * 3600
+
+def _upload_response(asset, status, error=None):
+    data = asset.to_dict()
+    if error:
+        data['error'] = error
+    response = jsonify(data)
+    response.status_code = status
+    if asset.received:
+        # Same convention as resumable uploads elsewhere: the bytes already stored
+        response.headers['Range'] = f'bytes=0-{asset.received - 1}'
+    return response
+
+@media_bp.route('/media/uploads', methods=['POST'])
+def create_upload():
+    """Start an upload session: {"filename", "content_type"?, "size"?, "item_id"?, "recording_id"?}"""
+    data = request.get_json(silent=True) or {}
+    filename = os.path.basename(str(data.get('filename') or '').strip())
+    if not filename:
+        return jsonify({'error': "'filename' is required"}), 400
+
+    content_type = media_type(filename, data.get('content_type'))
+    if content_type is None:
+        return jsonify({'error': 'Only audio and video files can be uploaded'}), 415
+
+    size = data.get('size')
+    if size is not None and (not isinstance(size, int) or not 0 < size <= MAX_MEDIA_BYTES):
+        return jsonify({'error': f"'size' must be an integer between 1 and {MAX_MEDIA_BYTES}"}), 400
+
+    item_id = data.get('item_id')
+    if item_id is not None and not db.session.get(ArchiveItem, item_id):
+        return jsonify({'error': 'Item not found'}), 404
+    recording_id = data.get('recording_id')
+    if recording_id is not None and not db.session.get(VoiceRecording, recording_id):
+        return jsonify({'error': 'Voice recording not found'}), 404
+
+    asset = MediaAsset(filename=filename, content_type=content_type, size=size,
+                       item_id=item_id, recording_id=recording_id)
+    db.session.add(asset)
+    db.session.commit()
+
+    response = _upload_response(asset, 201)
+    response.headers['Location'] = asset.to_dict()['upload_url']
+    return response
+
+@media_bp.route('/media/uploads/<int:asset_id>', methods=['GET'])
+def get_upload(asset_id):
+    """Upload status; 'received' is where a resumed upload continues"""
+    asset = db.session.get(MediaAsset, asset_id)
+    if not asset:
+        return jsonify({'error': 'Upload not found'}), 404
+    return _upload_response(asset, 200)
+
+@media_bp.route('/media/uploads/<int:asset_id>', methods=['PUT'])
+def upload_chunk(asset_id):
+    """Store one chunk, sent as the raw body with "Content-Range: bytes start-end/total".
+
+    Without Content-Range the body is the whole file. Answers 202 while bytes
+    are missing and 200 with the finished asset after the last chunk.
+    """
+    asset = db.session.get(MediaAsset, asset_id)
+    if not asset:
+        return jsonify({'error': 'Upload not found'}), 404
+
+    length = request.content_length
+    if length is None:
+        return jsonify({'error': 'Content-Length is required'}), 411
+
+    header = request.headers.get('Content-Range')
+    if header:
+        content_range = parse_content_range_header(header)
+        if content_range is None or content_range.units != 'bytes':
+            return jsonify({'error': 'Malformed Content-Range'}), 400
+        start, end, total = content_range.start, content_range.stop, content_range.length
+        if end - start != length:
+            return jsonify({'error': 'Content-Range does not match Content-Length'}), 400
+    else:
+        start, end, total = 0, length, length
+
+    try:
+        complete = write_chunk(asset, request.stream, start, end, total)
+    except UploadError as e:
+        return _upload_response(asset, e.status, str(e))
+
+    if complete and asset.recording_id and asset.content_type in WAVEFORM_TYPES:
+        enqueue('waveform', {'recording': asset.recording_id})
+    return _upload_response(asset, 200 if complete else 202)
+
+@media_bp.route('/media/<int:asset_id>', methods=['GET'])
+def get_media(asset_id):
+    """Serve a finished asset with Range/206, ETag and If-Modified-Since support"""
+    asset = db.session.get(MediaAsset, asset_id)
+    if not asset or asset.status != 'complete':
+        return jsonify({'error': 'Media not found'}), 404
+
+    path = media_path(asset)
+    if not os.path.exists(path):
+        return jsonify({'error': 'Media file missing'}), 410
+
+    # conditional=True answers Range requests with 206 and validators with 304;
+    # the file itself goes out through wsgi.file_wrapper (sendfile under gunicorn)
+    response = send_file(path, mimetype=asset.content_type, conditional=True, etag=asset.sha256,
+                         last_modified=asset.completed_at, max_age=MEDIA_MAX_AGE,
+                         download_name=asset.filename)
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
+
+@media_bp.route('/media/<int:asset_id>', methods=['DELETE'])
+def remove_media(asset_id):
+    """Delete an asset or abandon an upload"""
+    asset = db.session.get(MediaAsset, asset_id)
+    if not asset:
+        return jsonify({'error': 'Media not found'}), 404
+    delete_media(asset)
+    return '', 204
@@ -1,12 +1,28 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, current_app, stream_with_context
 from src.models.portfolio import Project, ProjectPerson, ProjectOutput, ProjectConnection
 from src.models.user import db
+from src.services.graph_cache import graph_cache, NETWORK_KEY, current_generation
+from src.services.http_cache import conditional, generation_validators, make_etag, is_not_modified, not_modified_response, add_validators
+from src.services.graph_layout import layout_graph
+from src.services.streaming import buffered, json_list_stream
+from src.services.projection import ProjectionError, requested_fields, load_options, serialize, project_dict
+from src.services.serializers import row_serializer, serialize_rows
 from datetime import datetime
 import json
 
 portfolio_bp = Blueprint('portfolio', __name__)
 
+# Nested lists of project detail, selectable with ?fields= like the project's columns
+PROJECT_DETAIL_LISTS = ('people', 'outputs')
+
+TIMELINE_FIELDS = ('id', 'title', 'category', 'role', 'start_date', 'end_date', 'location', 'status')
+
+def _portfolio_validators(**_):
+    """Every portfolio table bumps the network generation on write"""
+    return generation_validators([NETWORK_KEY])
+
 @portfolio_bp.route('/projects', methods=['GET'])
+@conditional(_portfolio_validators)
 def get_projects():
     """Get all projects with optional filtering"""
     category = request.args.get('category')  # PM_Policy, UX_Design
@@ -14,32 +30,45 @@ def get_projects():
     status = request.args.get('status')
     year = request.args.get('year')
     
-    query = Project.query
+    try:
+        fields = requested_fields('projects')
+    except ProjectionError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    serializer = row_serializer('projects', fields and tuple(fields))
+    statement = serializer.select()
     
     if category:
-        query = query.filter(Project.category == category)
+        statement = statement.where(Project.category == category)
     if role:
-        query = query.filter(Project.role.contains(role))
+        statement = statement.where(Project.role.contains(role))
     if status:
-        query = query.filter(Project.status == status)
+        statement = statement.where(Project.status == status)
     if year:
-        query = query.filter(db.extract('year', Project.start_date) == int(year))
+        statement = statement.where(db.extract('year', Project.start_date) == int(year))
     
-    projects = query.order_by(Project.start_date.desc()).all()
+    # Read everything before the response starts; only the encoding is streamed
+    projects = list(serialize_rows(serializer, statement.order_by(Project.start_date.desc())))
     
-    return jsonify({
-        'projects': [project.to_dict() for project in projects],
-        'total': len(projects)
-    })
+    body = json_list_stream(projects, 'projects', count_key='total')
+    return current_app.response_class(stream_with_context(buffered(body)), mimetype='application/json')
 
 @portfolio_bp.route('/projects/<int:project_id>', methods=['GET'])
+@conditional(_portfolio_validators)
 def get_project(project_id):
     """Get detailed project information"""
-    project = Project.query.get_or_404(project_id)
+    try:
+        fields = requested_fields('projects', extra=PROJECT_DETAIL_LISTS)
+    except ProjectionError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    project = Project.query.options(*load_options(Project, fields)).filter_by(id=project_id).first_or_404()
     
-    project_data = project.to_dict()
-    project_data['people'] = [person.to_dict() for person in project.people]
-    project_data['outputs'] = [output.to_dict() for output in project.outputs]
+    project_data = serialize(project, fields)
+    if fields is None or 'people' in fields:
+        project_data['people'] = [person.to_dict() for person in project.people]
+    if fields is None or 'outputs' in fields:
+        project_data['outputs'] = [output.to_dict() for output in project.outputs]
     
     return jsonify(project_data)
 
@@ -74,7 +103,39 @@ def create_project():
 @portfolio_bp.route('/network', methods=['GET'])
 def get_network_data():
     """Get network visualization data"""
-    projects = Project.query.all()
+    try:
+        fields = requested_fields('projects')
+    except ProjectionError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    etag, last_modified = generation_validators([NETWORK_KEY])
+    if is_not_modified(etag, last_modified):
+        return not_modified_response(etag, last_modified)
+    
+    snapshot = graph_cache.get(NETWORK_KEY, build_network_graph)
+    payload = snapshot.payload
+    if fields:
+        payload = graph_cache.projection(NETWORK_KEY, snapshot, tuple(fields),
+                                         lambda payload: _project_network(payload, fields))
+    response = current_app.response_class(payload, mimetype='application/json')
+    # A snapshot served while another worker rebuilds it can be a generation behind
+    if snapshot.generation != current_generation(NETWORK_KEY):
+        etag = make_etag(1, snapshot.generation)
+    return add_validators(response, etag, last_modified)
+
+def _project_network(payload, fields):
+    """The snapshot is shared by every projection: trim the project nodes' data after the fact"""
+    graph = current_app.json.loads(payload)
+    for node in graph['nodes']:
+        if node['type'] == 'project':
+            node['data'] = project_dict(node['data'], fields)
+    return current_app.json.dumps(graph)
+
+def build_network_graph():
+    """Build the project/people network graph"""
+    projects = Project.query.options(db.undefer(Project.people_count),
+                                     db.undefer(Project.outputs_count),
+                                     db.selectinload(Project.people)).all()
     connections = ProjectConnection.query.all()
     
     # Create nodes
@@ -131,7 +192,7 @@ def get_network_data():
             }
             edges.append(edge)
     
-    return jsonify({
+    return layout_graph(NETWORK_KEY, {
         'nodes': nodes,
         'edges': edges,
         'stats': {
@@ -144,6 +205,7 @@ def get_network_data():
     })
 
 @portfolio_bp.route('/categories', methods=['GET'])
+@conditional(_portfolio_validators)
 def get_categories():
     """Get project categories and their counts"""
     categories = db.session.query(
@@ -156,6 +218,7 @@ def get_categories():
     })
 
 @portfolio_bp.route('/skills', methods=['GET'])
+@conditional(_portfolio_validators)
 def get_skills():
     """Get all skills used across projects"""
     projects = Project.query.all()
@@ -179,28 +242,18 @@ def get_skills():
     })
 
 @portfolio_bp.route('/timeline', methods=['GET'])
+@conditional(_portfolio_validators)
 def get_timeline():
     """Get projects timeline data"""
-    projects = Project.query.filter(Project.start_date.isnot(None)).order_by(Project.start_date).all()
-    
-    timeline_data = []
-    for project in projects:
-        timeline_data.append({
-            'id': project.id,
-            'title': project.title,
-            'category': project.category,
-            'role': project.role,
-            'start_date': project.start_date.isoformat(),
-            'end_date': project.end_date.isoformat() if project.end_date else None,
-            'location': project.location,
-            'status': project.status
-        })
+    serializer = row_serializer('projects', TIMELINE_FIELDS)
+    statement = serializer.select().where(Project.start_date.isnot(None)).order_by(Project.start_date)
+    timeline_data = list(serialize_rows(serializer, statement))
     
-    return jsonify({
-        'timeline': timeline_data
-    })
+    body = json_list_stream(timeline_data, 'timeline')
+    return current_app.response_class(stream_with_context(buffered(body)), mimetype='application/json')
 
 @portfolio_bp.route('/stats', methods=['GET'])
+@conditional(_portfolio_validators)
 def get_portfolio_stats():
     """Get portfolio statistics"""
     total_projects = Project.query.count()
@@ -0,0 +1,70 @@
+from sqlalchemy import text
+
+# Two-dimensional R-tree: (item_id, item_id) x (start_pos, end_pos). Pinning
+# the first dimension to one item turns overlap lookups into a single
+# R-tree range search instead of a scan over all annotations of the item.
+ANNOTATION_INDEX_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS annotation_spans USING rtree_i32(
+        id, item_min, item_max, span_min, span_max
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS annotation_spans_ai AFTER INSERT ON annotations
+    WHEN new.start_pos IS NOT NULL AND new.end_pos IS NOT NULL AND new.start_pos <= new.end_pos BEGIN
+        INSERT INTO annotation_spans (id, item_min, item_max, span_min, span_max)
+        VALUES (new.id, new.item_id, new.item_id, new.start_pos, new.end_pos);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS annotation_spans_ad AFTER DELETE ON annotations BEGIN
+        DELETE FROM annotation_spans WHERE id = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS annotation_spans_au AFTER UPDATE OF item_id, start_pos, end_pos ON annotations BEGIN
+        DELETE FROM annotation_spans WHERE id = old.id;
+        INSERT INTO annotation_spans (id, item_min, item_max, span_min, span_max)
+        SELECT new.id, new.item_id, new.item_id, new.start_pos, new.end_pos
+        WHERE new.start_pos IS NOT NULL AND new.end_pos IS NOT NULL AND new.start_pos <= new.end_pos;
+    END
+    """,
+]
+
+BACKFILL_SQL = """
+    INSERT INTO annotation_spans (id, item_min, item_max, span_min, span_max)
+    SELECT id, item_id, item_id, start_pos, end_pos FROM annotations
+    WHERE start_pos IS NOT NULL AND end_pos IS NOT NULL AND start_pos <= end_pos
+"""
+
+def create_annotation_index(engine):
+    """Create the annotation span R-tree and its triggers, backfilling it on first run"""
+    with engine.begin() as conn:
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'annotation_spans'"
+        )).scalar()
+
+        for statement in ANNOTATION_INDEX_DDL:
+            conn.execute(text(statement))
+
+        if not exists:
+            conn.execute(text(BACKFILL_SQL))
+
+def overlapping_annotation_ids(session, item_id, start, end, annotation_type=None, limit=1000, offset=0):
+    """Ids of the item's annotations whose [start_pos, end_pos) overlaps [start, end), by position"""
+    filters = ''
+    params = {'item_id': item_id, 'start': start, 'end': end, 'limit': limit, 'offset': offset}
+    if annotation_type:
+        filters = 'AND a.annotation_type = :annotation_type'
+        params['annotation_type'] = annotation_type
+
+    return session.execute(text(f"""
+        SELECT a.id
+        FROM annotation_spans s
+        JOIN annotations a ON a.id = s.id
+        WHERE s.item_min <= :item_id AND s.item_max >= :item_id
+          AND s.span_min < :end AND s.span_max > :start
+          {filters}
+        ORDER BY a.start_pos, a.id
+        LIMIT :limit OFFSET :offset
+    """), params).scalars().all()
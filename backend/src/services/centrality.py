@@ -0,0 +1,161 @@
+from sqlalchemy import text
+from src.models.archive import db, ArchiveItem, Annotation, ItemConnection, ItemScore
+from src.services.graph_cache import archive_keys_for_items, bump_generations
+from datetime import datetime
+import numpy as np
+import time
+
+DAMPING = 0.85
+TOLERANCE = 1e-8
+MAX_ITERATIONS = 200
+
+# Item-to-annotation edges count for less than explicit connections
+ANNOTATION_EDGE_WEIGHT = 0.5
+
+# Scores that moved less than this (on the 0-1 centrality scale) are not rewritten
+WRITE_THRESHOLD = 1e-4
+
+def pagerank(node_count, sources, targets, weights, start=None, unknown=None):
+    """Weighted PageRank by power iteration over an edge list; returns (scores, iterations).
+
+    start warm-starts the iteration; nodes flagged in the unknown mask get
+    their start value from one propagation step of the known ones.
+    """
+    out_weight = np.bincount(sources, weights=weights, minlength=node_count)
+    dangling = out_weight == 0
+    share = weights / np.where(dangling, 1.0, out_weight)[sources]
+
+    def step(scores):
+        spread = np.bincount(targets, weights=scores[sources] * share, minlength=node_count)
+        return DAMPING * (spread + scores[dangling].sum() / node_count) + (1 - DAMPING) / node_count
+
+    if start is None:
+        scores = np.full(node_count, 1.0 / node_count)
+    else:
+        scores = np.array(start, dtype=np.float64)
+        if unknown is not None and unknown.any():
+            scores[unknown] = 0.0
+            scores[unknown] = step(scores)[unknown]
+        scores /= scores.sum()
+
+    for iteration in range(1, MAX_ITERATIONS + 1):
+        updated = step(scores)
+        delta = np.abs(updated - scores).sum()
+        scores = updated
+        if delta < TOLERANCE:
+            break
+    return scores, iteration
+
+def _load_graph():
+    """Items, connections and item-annotation links as an undirected weighted edge list.
+
+    Annotations are grouped into concepts (same type and entity URI, or same
+    text without one) so items that mention the same thing are linked through
+    a shared concept node.
+    """
+    item_ids = np.fromiter(db.session.execute(db.select(ArchiveItem.id).order_by(ArchiveItem.id)).scalars(),
+                           dtype=np.int64)
+
+    connections = db.session.execute(db.select(
+        ItemConnection.source_id, ItemConnection.target_id, db.func.coalesce(ItemConnection.strength, 1.0))).all()
+    connections = np.array(connections, dtype=np.float64).reshape(-1, 3)
+    source_ids = connections[:, 0].astype(np.int64)
+    target_ids = connections[:, 1].astype(np.int64)
+    known = np.isin(source_ids, item_ids) & np.isin(target_ids, item_ids) & (source_ids != target_ids)
+    sources = np.searchsorted(item_ids, source_ids[known])
+    targets = np.searchsorted(item_ids, target_ids[known])
+    strengths = np.clip(connections[known, 2], 0.05, None)
+    degree = np.bincount(np.concatenate([sources, targets]), minlength=len(item_ids))
+
+    concept = db.func.coalesce(Annotation.entity_uri, db.func.lower(Annotation.text))
+    mentions = db.session.execute(
+        db.select(Annotation.item_id, Annotation.annotation_type + ':' + concept).distinct()).all()
+    if mentions:
+        mention_items = np.array([item_id for item_id, _ in mentions], dtype=np.int64)
+        _, concept_index = np.unique([key for _, key in mentions], return_inverse=True)
+        known_items = np.isin(mention_items, item_ids)
+        mention_sources = np.searchsorted(item_ids, mention_items[known_items])
+        mention_targets = len(item_ids) + concept_index[known_items]
+        concept_count = int(concept_index.max()) + 1
+    else:
+        mention_sources = mention_targets = np.zeros(0, dtype=np.int64)
+        concept_count = 0
+
+    edge_sources = np.concatenate([sources, targets, mention_sources, mention_targets])
+    edge_targets = np.concatenate([targets, sources, mention_targets, mention_sources])
+    edge_weights = np.concatenate([strengths, strengths,
+                                   np.full(len(mention_sources) * 2, ANNOTATION_EDGE_WEIGHT)])
+    return item_ids, concept_count, edge_sources, edge_targets, edge_weights, degree
+
+def recompute_item_scores():
+    """Recompute PageRank and degree of every item and store the ones that changed.
+
+    Warm-starts from the stored scores, so small edge changes need far fewer
+    iterations, and only rows whose scores moved are written. Archives whose
+    scores changed get their graph snapshots invalidated.
+    """
+    started = time.perf_counter()
+    item_ids, concept_count, sources, targets, weights, degree = _load_graph()
+    if not len(item_ids):
+        return {'items': 0, 'iterations': 0, 'updated': 0, 'elapsed_seconds': 0.0}
+
+    previous = {row.item_id: row for row in db.session.execute(
+        db.select(ItemScore.item_id, ItemScore.pagerank, ItemScore.centrality, ItemScore.degree))}
+    node_count = len(item_ids) + concept_count
+    start = unknown = None
+    if previous:
+        # Concept scores are not stored; they are derived from their items
+        start = np.full(node_count, 1.0 / node_count)
+        unknown = np.ones(node_count, dtype=bool)
+        for i, item_id in enumerate(item_ids.tolist()):
+            if item_id in previous and previous[item_id].pagerank > 0:
+                start[i] = previous[item_id].pagerank
+                unknown[i] = False
+
+    scores, iterations = pagerank(node_count, sources, targets, weights, start, unknown)
+    item_scores = scores[:len(item_ids)]
+    centrality = item_scores / item_scores.max()
+
+    now = datetime.utcnow()
+    rows = []
+    for item_id, rank, scaled, item_degree in zip(item_ids.tolist(), item_scores.tolist(),
+                                                  centrality.tolist(), degree.tolist()):
+        old = previous.get(item_id)
+        if old is None or abs(old.centrality - scaled) > WRITE_THRESHOLD or old.degree != item_degree:
+            rows.append({'item_id': item_id, 'pagerank': rank, 'centrality': scaled,
+                         'degree': item_degree, 'computed_at': now})
+
+    connection = db.session.connection()
+    if rows:
+        connection.execute(text(
+            "INSERT INTO item_scores (item_id, pagerank, centrality, degree, computed_at) "
+            "VALUES (:item_id, :pagerank, :centrality, :degree, :computed_at) "
+            "ON CONFLICT(item_id) DO UPDATE SET pagerank = excluded.pagerank, "
+            "centrality = excluded.centrality, degree = excluded.degree, computed_at = excluded.computed_at"
+        ), rows)
+    stale = set(previous) - set(item_ids.tolist())
+    if stale:
+        connection.execute(db.delete(ItemScore).where(ItemScore.item_id.in_(stale)))
+    changed = [row['item_id'] for row in rows]
+    bump_generations(connection, archive_keys_for_items(connection, changed))
+    db.session.commit()
+
+    return {
+        'items': len(item_ids),
+        'concepts': concept_count,
+        'edges': len(sources) // 2,
+        'iterations': iterations,
+        'updated': len(rows),
+        'removed': len(stale),
+        'elapsed_seconds': round(time.perf_counter() - started, 3)
+    }
+
+def item_centrality(item_ids):
+    """{item_id: (centrality, degree)} for the given items that have been scored"""
+    if not item_ids:
+        return {}
+    rows = db.session.execute(
+        db.select(ItemScore.item_id, ItemScore.centrality, ItemScore.degree)
+          .where(ItemScore.item_id.in_(list(item_ids)))
+    )
+    return {row.item_id: (row.centrality, row.degree) for row in rows}
@@ -0,0 +1,85 @@
+from flask import request
+from src.services.streaming import brotli, brotli_stream, gzip_stream
+from collections import OrderedDict
+import gzip
+import threading
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/ld+json', 'application/n-triples',
+                      'application/sparql-results+json', 'application/javascript', 'application/xml',
+                      'image/svg+xml')
+
+# Responses with an ETag are compressed once per encoding and kept up to this many bytes
+COMPRESSED_CACHE_BYTES = 32 * 1024 * 1024
+
+_cache_lock = threading.Lock()
+_cache = OrderedDict()
+_cache_bytes = 0
+
+def _compressible(mimetype):
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+def _compress(encoding, data, config):
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['COMPRESS_BROTLI_QUALITY'])
+    return gzip.compress(data, compresslevel=config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+def _cached_compress(key, encoding, data, config):
+    """Compressed body, reused while the same (ETag, encoding) is requested again"""
+    global _cache_bytes
+    with _cache_lock:
+        body = _cache.get(key)
+        if body is not None:
+            _cache.move_to_end(key)
+            return body
+
+    body = _compress(encoding, data, config)
+    if len(body) < COMPRESSED_CACHE_BYTES // 4:
+        with _cache_lock:
+            if key not in _cache:
+                _cache[key] = body
+                _cache_bytes += len(body)
+            while _cache_bytes > COMPRESSED_CACHE_BYTES:
+                _, evicted = _cache.popitem(last=False)
+                _cache_bytes -= len(evicted)
+    return body
+
+def init_compression(app):
+    """Compress JSON/text responses above a size threshold with the best encoding the client accepts"""
+    app.config.setdefault('COMPRESS_MIN_BYTES', 1024)
+    app.config.setdefault('COMPRESS_GZIP_LEVEL', 6)
+    # Quality 4-5 compresses better than gzip -6 at a similar speed; 11 is for static assets
+    app.config.setdefault('COMPRESS_BROTLI_QUALITY', 5)
+    encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+    @app.after_request
+    def compress_response(response):
+        if (response.status_code != 200 or response.direct_passthrough or request.method == 'HEAD'
+                or 'Content-Encoding' in response.headers or not _compressible(response.mimetype)):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(encodings)
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            stream = brotli_stream if encoding == 'br' else gzip_stream
+            level = app.config['COMPRESS_BROTLI_QUALITY' if encoding == 'br' else 'COMPRESS_GZIP_LEVEL']
+            response.response = stream(response.response, level)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < app.config['COMPRESS_MIN_BYTES']:
+                return response
+            etag, weak = response.get_etag()
+            if etag:
+                body = _cached_compress((request.full_path, etag, encoding), encoding, data, app.config)
+            else:
+                body = _compress(encoding, data, app.config)
+            response.set_data(body)
+
+        response.content_encoding = encoding
+        # Same content, different bytes: the validator stays usable but only for weak comparison
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,291 @@
+from flask import current_app
+from sqlalchemy import event, select, text
+from sqlalchemy.orm import Session
+from src.models.user import db
+from src.models.cache import CacheGeneration
+from src.models.archive import Archive, ArchiveItem, Annotation, ItemConnection, VoiceRecording
+from src.models.portfolio import Project, ProjectPerson, ProjectOutput, ProjectConnection
+from collections import OrderedDict, namedtuple
+import fcntl
+import json
+import os
+import threading
+import time
+
+NETWORK_KEY = 'network'
+
+GraphSnapshot = namedtuple('GraphSnapshot', ['generation', 'built_at', 'payload'])
+
+# Projected payloads (sparse fieldsets) kept per snapshot, least recently used dropped first
+MAX_PROJECTIONS = 8
+
+def archive_key(archive_id):
+    return f'archive:{archive_id}'
+
+# Generations
+def current_generation(key):
+    """Current generation of a cache key (0 if it was never written)"""
+    generation = db.session.execute(
+        select(CacheGeneration.generation).where(CacheGeneration.key == key)
+    ).scalar()
+    return generation or 0
+
+def archives_generation():
+    """Token that changes whenever any archive-scoped key is bumped"""
+    return tuple(db.session.execute(text(
+        "SELECT COUNT(*), COALESCE(SUM(generation), 0) FROM cache_generations WHERE key LIKE 'archive:%'"
+    )).one())
+
+def bump_generations(connection, keys):
+    """Invalidate cache keys; call inside the transaction that performs the write"""
+    for key in sorted(set(keys)):
+        connection.execute(text(
+            "INSERT INTO cache_generations (key, generation, updated_at) "
+            "VALUES (:key, 1, CURRENT_TIMESTAMP) "
+            "ON CONFLICT(key) DO UPDATE SET generation = generation + 1, updated_at = CURRENT_TIMESTAMP"
+        ), {'key': key})
+
+def archive_keys_for_items(connection, item_ids):
+    """Cache keys of the archives that own the given items"""
+    if not item_ids:
+        return set()
+    archive_ids = connection.execute(
+        select(ArchiveItem.archive_id).where(ArchiveItem.id.in_(item_ids)).distinct()
+    ).scalars()
+    return {archive_key(archive_id) for archive_id in archive_ids}
+
+def _invalidate_on_flush(session, flush_context):
+    """Bump the generation of every graph touched by the flushed objects"""
+    keys = set()
+    item_ids = set()
+
+    changed = list(session.new) + list(session.deleted) + \
+        [obj for obj in session.dirty if session.is_modified(obj, include_collections=False)]
+    for obj in changed:
+        if isinstance(obj, Archive):
+            keys.add(archive_key(obj.id))
+        elif isinstance(obj, ArchiveItem):
+            keys.add(archive_key(obj.archive_id))
+        elif isinstance(obj, (Annotation, VoiceRecording)):
+            item_ids.add(obj.item_id)
+        elif isinstance(obj, ItemConnection):
+            # Both ends: item detail lists the target's incoming connections
+            item_ids.update((obj.source_id, obj.target_id))
+        elif isinstance(obj, (Project, ProjectPerson, ProjectOutput, ProjectConnection)):
+            keys.add(NETWORK_KEY)
+
+    if not keys and not item_ids:
+        return
+
+    connection = session.connection()
+    keys |= archive_keys_for_items(connection, item_ids)
+    bump_generations(connection, keys)
+
+# Locks
+class _KeyLock:
+    """Per-key lock held across threads (threading.Lock) and workers (flock)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def acquire(self, blocking=True):
+        if not self._thread_lock.acquire(blocking):
+            return False
+        self._file = open(self.path, 'a')
+        try:
+            fcntl.flock(self._file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._file.close()
+            self._file = None
+            self._thread_lock.release()
+            return False
+        return True
+
+    def release(self):
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+        self._thread_lock.release()
+
+class GraphSnapshotCache:
+    """Generation-invalidated graph snapshots shared by all workers through the filesystem.
+
+    Misses are single-flight: one request (in one worker) builds while the
+    others wait for its result. Snapshots past max_age are served stale while
+    a background thread rebuilds them.
+    """
+
+    def __init__(self, app=None):
+        self._memory = {}
+        self._projections = {}
+        self._projections_lock = threading.Lock()
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('GRAPH_CACHE_DIR', os.path.join(app.instance_path, 'graph_cache'))
+        app.config.setdefault('GRAPH_CACHE_MAX_AGE', 300)
+        app.config.setdefault('GRAPH_CACHE_STALE_TTL', 3600)
+        os.makedirs(app.config['GRAPH_CACHE_DIR'], exist_ok=True)
+
+        if not event.contains(Session, 'after_flush', _invalidate_on_flush):
+            event.listen(Session, 'after_flush', _invalidate_on_flush)
+
+    def get(self, key, build):
+        """Return the snapshot for key, building it with build() if needed"""
+        config = current_app.config
+        generation = current_generation(key)
+        entry = self._lookup(key, generation)
+
+        if entry is not None:
+            age = time.time() - entry.built_at
+            if entry.generation == generation and age < config['GRAPH_CACHE_MAX_AGE']:
+                return entry
+
+            if age < config['GRAPH_CACHE_STALE_TTL']:
+                lock = self._lock(key)
+                if not lock.acquire(blocking=False):
+                    # Someone is already rebuilding this key; serve what we have
+                    return entry
+                if entry.generation == generation:
+                    # Only expired by age: revalidate in the background
+                    self._revalidate(key, build, lock)
+                    return entry
+                # Invalidated by a write: rebuild now
+                try:
+                    return self._build(key, build)
+                finally:
+                    lock.release()
+
+        lock = self._lock(key)
+        lock.acquire()
+        try:
+            # Another request may have finished the build while we waited
+            generation = current_generation(key)
+            entry = self._lookup(key, generation)
+            if entry is not None and entry.generation == generation:
+                return entry
+            return self._build(key, build)
+        finally:
+            lock.release()
+
+    def projection(self, key, entry, fieldset, project):
+        """project(entry.payload), memoised per snapshot and hashable fieldset.
+
+        Projections live in memory only and are dropped with their snapshot.
+        """
+        version = (entry.generation, entry.built_at)
+        with self._projections_lock:
+            cached = self._projections.get(key)
+            if cached is not None and cached[0] == version and fieldset in cached[1]:
+                cached[1].move_to_end(fieldset)
+                return cached[1][fieldset]
+
+        payload = project(entry.payload)
+        with self._projections_lock:
+            cached = self._projections.get(key)
+            if cached is None or cached[0] != version:
+                cached = self._projections[key] = (version, OrderedDict())
+            cached[1][fieldset] = payload
+            while len(cached[1]) > MAX_PROJECTIONS:
+                cached[1].popitem(last=False)
+        return payload
+
+    def invalidate(self, key):
+        """Drop the snapshot of key without bumping its generation.
+
+        For changes that only alter the built payload (such as finished layouts);
+        other processes see the missing file on their next lookup.
+        """
+        self._memory.pop(key, None)
+        with self._projections_lock:
+            self._projections.pop(key, None)
+        try:
+            os.remove(self._path(key, '.json'))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        """Drop every snapshot (memory and disk)"""
+        self._memory.clear()
+        with self._projections_lock:
+            self._projections.clear()
+        cache_dir = current_app.config['GRAPH_CACHE_DIR']
+        for name in os.listdir(cache_dir):
+            if name.endswith('.json'):
+                os.remove(os.path.join(cache_dir, name))
+
+    def _path(self, key, suffix):
+        safe_key = key.replace(':', '-').replace('/', '-')
+        return os.path.join(current_app.config['GRAPH_CACHE_DIR'], safe_key + suffix)
+
+    def _lock(self, key):
+        with self._locks_guard:
+            if key not in self._locks:
+                self._locks[key] = _KeyLock(self._path(key, '.lock'))
+            return self._locks[key]
+
+    def _lookup(self, key, generation):
+        entry = self._memory.get(key)
+        if entry is not None and entry.generation == generation:
+            if os.path.exists(self._path(key, '.json')):
+                return entry
+            # Invalidated in another process
+            self._memory.pop(key, None)
+            return None
+
+        # Another worker may have written a newer snapshot
+        disk_entry = self._read(key)
+        if disk_entry is not None and (entry is None or disk_entry.built_at > entry.built_at):
+            self._memory[key] = disk_entry
+            return disk_entry
+        return entry
+
+    def _read(self, key):
+        try:
+            with open(self._path(key, '.json'), 'rb') as f:
+                header = json.loads(f.readline())
+                payload = f.read()
+        except (OSError, ValueError):
+            return None
+        return GraphSnapshot(header['generation'], header['built_at'], payload)
+
+    def _write(self, key, entry):
+        path = self._path(key, '.json')
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            header = {'generation': entry.generation, 'built_at': entry.built_at}
+            f.write(json.dumps(header).encode() + b'\n')
+            f.write(entry.payload)
+        os.replace(tmp_path, path)
+
+    def _build(self, key, build):
+        # Read the generation first so writes during the build invalidate it
+        generation = current_generation(key)
+        data = build()
+        # Serialize exactly like jsonify() so cached and live responses match
+        payload = current_app.json.response(data).get_data()
+        entry = GraphSnapshot(generation, time.time(), payload)
+        self._write(key, entry)
+        self._memory[key] = entry
+        return entry
+
+    def _revalidate(self, key, build, lock):
+        app = current_app._get_current_object()
+
+        def run():
+            try:
+                with app.app_context():
+                    self._build(key, build)
+            except Exception:
+                app.logger.exception('Background rebuild of graph snapshot %s failed', key)
+            finally:
+                lock.release()
+
+        threading.Thread(target=run, daemon=True).start()
+
+graph_cache = GraphSnapshotCache()
@@ -0,0 +1,212 @@
+from src.models.archive import db, Archive, ArchiveItem, Annotation, ItemConnection
+from src.services.item_graph import get_item_graph
+from collections import Counter
+
+ISOLATED = 'isolated'
+
+def _item_archive_scope(archive_id):
+    items = db.select(ArchiveItem.id)
+    if archive_id is not None:
+        items = items.where(ArchiveItem.archive_id == archive_id)
+    return items
+
+def _cluster(kind, key, label, **counts):
+    return dict({'id': f'{kind}:{key}', 'kind': kind, 'key': key, 'label': label}, **counts)
+
+def _super_edge(source, target, count, strength=None):
+    edge = {'id': f'{source}|{target}', 'source': source, 'target': target, 'count': count}
+    if strength is not None:
+        edge['strength'] = round(strength, 3)
+    return edge
+
+# Super-nodes
+def archive_clusters(archive_id=None):
+    """One super-node per archive; super-edges count cross-archive connections"""
+    archives = db.select(Archive.id, Archive.name, Archive.slug, Archive.color)
+    if archive_id is not None:
+        archives = archives.where(Archive.id == archive_id)
+    item_counts = dict(db.session.execute(
+        db.select(ArchiveItem.archive_id, db.func.count()).group_by(ArchiveItem.archive_id)).all())
+    annotation_counts = dict(db.session.execute(
+        db.select(ArchiveItem.archive_id, db.func.count())
+          .join(Annotation, Annotation.item_id == ArchiveItem.id)
+          .group_by(ArchiveItem.archive_id)).all())
+
+    source = db.aliased(ArchiveItem)
+    target = db.aliased(ArchiveItem)
+    pairs = db.session.execute(
+        db.select(source.archive_id, target.archive_id, db.func.count(), db.func.avg(ItemConnection.strength))
+          .join(source, ItemConnection.source_id == source.id)
+          .join(target, ItemConnection.target_id == target.id)
+          .group_by(source.archive_id, target.archive_id)
+    ).all()
+    internal = {a: count for a, b, count, _ in pairs if a == b}
+
+    nodes = [
+        _cluster('archive', row.id, row.name, slug=row.slug, color=row.color,
+                 item_count=item_counts.get(row.id, 0),
+                 annotation_count=annotation_counts.get(row.id, 0),
+                 connection_count=internal.get(row.id, 0))
+        for row in db.session.execute(archives)
+    ]
+    ids = {node['key'] for node in nodes}
+    edges = [_super_edge(f'archive:{a}', f'archive:{b}', count, strength)
+             for a, b, count, strength in pairs if a != b and a in ids and b in ids]
+    return nodes, edges
+
+def type_clusters(archive_id=None):
+    """One super-node per annotation type; super-edges count items annotated with both types"""
+    scope = _item_archive_scope(archive_id)
+    rows = db.session.execute(
+        db.select(Annotation.annotation_type, db.func.count(), db.func.count(db.distinct(Annotation.item_id)))
+          .where(Annotation.item_id.in_(scope))
+          .group_by(Annotation.annotation_type)
+    ).all()
+    nodes = [_cluster('type', annotation_type, annotation_type, annotation_count=count, item_count=items)
+             for annotation_type, count, items in rows]
+
+    item_types = db.select(Annotation.item_id, Annotation.annotation_type)\
+                   .where(Annotation.item_id.in_(scope)).distinct().subquery()
+    a = db.aliased(item_types)
+    b = db.aliased(item_types)
+    pairs = db.session.execute(
+        db.select(a.c.annotation_type, b.c.annotation_type, db.func.count())
+          .join(b, db.and_(a.c.item_id == b.c.item_id, a.c.annotation_type < b.c.annotation_type))
+          .group_by(a.c.annotation_type, b.c.annotation_type)
+    ).all()
+    edges = [_super_edge(f'type:{first}', f'type:{second}', count) for first, second, count in pairs]
+    return nodes, edges
+
+def _scoped_items(archive_id):
+    if archive_id is None:
+        return None
+    return set(db.session.execute(_item_archive_scope(archive_id)).scalars())
+
+def community_clusters(archive_id=None):
+    """One super-node per connection community (label propagation over item connections)"""
+    graph = get_item_graph()
+    communities = graph.communities()
+    scope = _scoped_items(archive_id)
+
+    members = Counter()
+    for item_id, community in communities.items():
+        if scope is None or item_id in scope:
+            members[community if community is not None else ISOLATED] += 1
+
+    annotation_counts = Counter()
+    rows = db.session.execute(
+        db.select(Annotation.item_id, db.func.count())
+          .where(Annotation.item_id.in_(_item_archive_scope(archive_id)))
+          .group_by(Annotation.item_id))
+    for item_id, count in rows:
+        community = communities.get(item_id)
+        annotation_counts[community if community is not None else ISOLATED] += count
+
+    links = Counter()
+    strengths = Counter()
+    for connection_id, source_id, target_id, _, strength in graph.edges():
+        if scope is not None and (source_id not in scope or target_id not in scope):
+            continue
+        first, second = communities.get(source_id), communities.get(target_id)
+        if first != second and first is not None and second is not None:
+            pair = (min(first, second), max(first, second))
+            links[pair] += 1
+            strengths[pair] += strength
+
+    # Communities are named after their smallest item
+    titles = {}
+    named = [community for community in members if community != ISOLATED]
+    if named:
+        titles = dict(db.session.execute(
+            db.select(ArchiveItem.id, ArchiveItem.title).where(ArchiveItem.id.in_(named))).all())
+
+    nodes = [
+        _cluster('community', community,
+                 'Unconnected items' if community == ISOLATED else titles.get(community, f'Community {community}'),
+                 item_count=count, annotation_count=annotation_counts[community])
+        for community, count in members.most_common()
+    ]
+    edges = [_super_edge(f'community:{first}', f'community:{second}', count, strengths[(first, second)] / count)
+             for (first, second), count in links.items()]
+    return nodes, edges
+
+CLUSTER_BUILDERS = {
+    'archive': archive_clusters,
+    'type': type_clusters,
+    'community': community_clusters,
+}
+
+# Expansion
+def _item_node(row):
+    return {'id': f'item_{row.id}', 'label': row.title, 'type': 'item',
+            'archive_id': row.archive_id, 'annotation_count': row.annotation_count}
+
+def _annotation_node(row):
+    label = row.text[:50] + '...' if len(row.text) > 50 else row.text
+    return {'id': f'annotation_{row.id}', 'label': label, 'type': row.annotation_type, 'item_id': row.item_id}
+
+def _item_rows(condition, limit, offset):
+    return db.session.execute(
+        db.select(ArchiveItem.id, ArchiveItem.title, ArchiveItem.archive_id,
+                  ArchiveItem.annotation_count)
+          .where(condition).order_by(ArchiveItem.id).limit(limit).offset(offset)
+    ).all()
+
+def _connection_edges(item_ids):
+    """Connections among the given items"""
+    if not item_ids:
+        return []
+    rows = db.session.execute(
+        db.select(ItemConnection.id, ItemConnection.source_id, ItemConnection.target_id,
+                  ItemConnection.connection_type, ItemConnection.strength)
+          .where(ItemConnection.source_id.in_(item_ids), ItemConnection.target_id.in_(item_ids))
+    )
+    return [{'id': f'conn_{row.id}', 'source': f'item_{row.source_id}', 'target': f'item_{row.target_id}',
+             'type': row.connection_type, 'strength': row.strength} for row in rows]
+
+def expand_cluster(kind, key, archive_id=None, limit=200, offset=0):
+    """Children of one super-node as (nodes, edges, total), a page at a time.
+
+    Archive and community clusters expand to their items and the connections
+    among them; type clusters to their annotations and the items they annotate.
+    Returns None when the cluster does not exist.
+    """
+    if kind == 'archive':
+        if not key.isdigit() or db.session.get(Archive, int(key)) is None:
+            return None
+        condition = ArchiveItem.archive_id == int(key)
+        total = db.session.execute(db.select(db.func.count()).select_from(ArchiveItem).where(condition)).scalar()
+        rows = _item_rows(condition, limit, offset)
+        nodes = [_item_node(row) for row in rows]
+        return nodes, _connection_edges([row.id for row in rows]), total
+
+    if kind == 'community':
+        communities = get_item_graph().communities()
+        scope = _scoped_items(archive_id)
+        wanted = None if key == ISOLATED else int(key) if key.isdigit() else -1
+        item_ids = sorted(item_id for item_id, community in communities.items()
+                          if community == wanted and (scope is None or item_id in scope))
+        if not item_ids:
+            return None
+        rows = _item_rows(ArchiveItem.id.in_(item_ids[offset:offset + limit]), limit, 0)
+        nodes = [_item_node(row) for row in rows]
+        return nodes, _connection_edges([row.id for row in rows]), len(item_ids)
+
+    if kind == 'type':
+        condition = db.and_(Annotation.annotation_type == key,
+                            Annotation.item_id.in_(_item_archive_scope(archive_id)))
+        total = db.session.execute(db.select(db.func.count()).select_from(Annotation).where(condition)).scalar()
+        if not total:
+            return None
+        rows = db.session.execute(
+            db.select(Annotation.id, Annotation.text, Annotation.annotation_type, Annotation.item_id)
+              .where(condition).order_by(Annotation.id).limit(limit).offset(offset)
+        ).all()
+        item_ids = sorted({row.item_id for row in rows})
+        items = _item_rows(ArchiveItem.id.in_(item_ids), len(item_ids), 0) if item_ids else []
+        nodes = [_annotation_node(row) for row in rows] + [_item_node(row) for row in items]
+        edges = [{'id': f'item_ann_{row.item_id}_{row.id}', 'source': f'item_{row.item_id}',
+                  'target': f'annotation_{row.id}', 'type': 'annotation'} for row in rows]
+        return nodes, edges, total
+
+    return None
@@ -0,0 +1,220 @@
+from flask import current_app
+from src.models.job import db, Job
+from src.services.graph_cache import graph_cache
+import numpy as np
+import json
+import os
+import threading
+
+# Ideal edge length, in the same units as the returned coordinates
+EDGE_LENGTH = 60.0
+
+# Above this many nodes repulsion is computed against grid cells instead of every node
+EXACT_REPULSION_LIMIT = 1000
+
+# Largest repulsion grid (cells per side), so a grid iteration is O(n) rather than O(n^2)
+MAX_GRID_SIDE = 64
+
+# Graphs with more nodes are only seeded during a request; the force iterations
+# run in a background 'layout' job, which drops the graph's snapshot when done
+INLINE_LAYOUT_LIMIT = 1000
+
+COLD_ITERATIONS = 300
+WARM_ITERATIONS = 40
+
+GRAVITY = 0.02
+
+def _repulsion_from(pos, sources, k2_mass, softening, chunk):
+    """Sum over sources of k^2 * mass * delta / d^2, as pos * sum(f) - f @ sources"""
+    disp = np.empty_like(pos)
+    for start in range(0, len(pos), chunk):
+        block = pos[start:start + chunk]
+        dx = block[:, 0, None] - sources[None, :, 0]
+        dy = block[:, 1, None] - sources[None, :, 1]
+        force = k2_mass / (dx * dx + dy * dy + softening)
+        disp[start:start + chunk] = block * force.sum(axis=1)[:, None] - force @ sources
+    return disp
+
+def _exact_repulsion(pos, k, chunk=1024):
+    """k^2 / d repulsion between every pair of nodes"""
+    return _repulsion_from(pos, pos, k * k, 0.01, chunk)
+
+def _grid_repulsion(pos, k, chunk=1024):
+    """Repulsion from the centroids of occupied grid cells, weighted by their node count.
+
+    A particle-mesh approximation: O(n * cells) with at most MAX_GRID_SIDE^2
+    cells, instead of O(n^2). Forces are softened by the cell size so a node
+    is not flung by its own cell.
+    """
+    n = len(pos)
+    side = min(max(int(np.sqrt(n) / 2), 4), MAX_GRID_SIDE)
+    lo = pos.min(axis=0)
+    cell_size = max((pos.max(axis=0) - lo).max() / side, 1e-6)
+    cells = np.minimum(((pos - lo) / cell_size).astype(np.int64), side - 1)
+    cell_ids = cells[:, 0] * side + cells[:, 1]
+
+    occupied, inverse, counts = np.unique(cell_ids, return_inverse=True, return_counts=True)
+    centroids = np.zeros((len(occupied), 2))
+    np.add.at(centroids, inverse, pos)
+    centroids /= counts[:, None]
+
+    return _repulsion_from(pos, centroids, k * k * counts, (cell_size / 2) ** 2, chunk)
+
+def force_layout(positions, sources, targets, weights, iterations, temperature, k=EDGE_LENGTH):
+    """Fruchterman-Reingold layout; returns the updated (n, 2) positions"""
+    pos = np.array(positions, dtype=np.float64)
+    n = len(pos)
+    if n < 2:
+        return pos
+    repulsion = _exact_repulsion if n <= EXACT_REPULSION_LIMIT else _grid_repulsion
+    cooling = (0.01 / temperature) ** (1.0 / max(iterations, 1)) if temperature > 0.01 else 1.0
+
+    for _ in range(iterations):
+        disp = repulsion(pos, k)
+
+        # Springs pull connected nodes together, harder for stronger connections
+        delta = pos[sources] - pos[targets]
+        dist = np.sqrt(np.einsum('ij,ij->i', delta, delta)) + 1e-9
+        pull = delta * (dist * weights / k)[:, None]
+        np.subtract.at(disp, sources, pull)
+        np.add.at(disp, targets, pull)
+
+        # Gravity keeps disconnected components from drifting apart
+        disp -= GRAVITY * k * pos / np.sqrt(n)
+
+        length = np.sqrt(np.einsum('ij,ij->i', disp, disp)) + 1e-9
+        pos += disp * (np.minimum(length, temperature) / length)[:, None]
+        temperature *= cooling
+
+    return pos - pos.mean(axis=0)
+
+# Persistence
+_layout_lock = threading.Lock()
+
+def layout_path(key):
+    safe_key = key.replace(':', '-').replace('/', '-')
+    return os.path.join(current_app.config['GRAPH_CACHE_DIR'], safe_key + '.layout.npz')
+
+def load_positions(key):
+    """{node_id: (x, y)} from the last layout of key"""
+    try:
+        with np.load(layout_path(key)) as saved:
+            return dict(zip(saved['ids'].tolist(), saved['positions']))
+    except (OSError, KeyError, ValueError):
+        return {}
+
+def _save(path, **arrays):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+def save_positions(key, node_ids, positions):
+    _save(layout_path(key), ids=np.array(node_ids, dtype=str), positions=positions)
+
+def pending_path(key):
+    return layout_path(key)[:-len('.layout.npz')] + '.pending.npz'
+
+def _defer_layout(key, node_ids, pos, sources, targets, weights, iterations, temperature):
+    """Save the seeded graph for the 'layout' job, queueing one unless it is already queued"""
+    _save(pending_path(key), ids=np.array(node_ids, dtype=str), positions=pos, sources=sources,
+          targets=targets, weights=weights, schedule=np.array([iterations, temperature]))
+
+    params = json.dumps({'key': key})
+    # Own connection, so the caller's session (often mid-request) is left alone
+    with db.engine.begin() as connection:
+        queued = connection.execute(db.select(Job.id).where(
+            Job.kind == 'layout', Job.status == 'queued', Job.params == params)).first()
+        if queued is None:
+            connection.execute(db.insert(Job).values(kind='layout', params=params))
+
+def run_deferred_layout(key):
+    """Run the force iterations of the pending layout of key; None if there is none"""
+    try:
+        with np.load(pending_path(key)) as pending:
+            node_ids = pending['ids'].tolist()
+            pos, sources, targets, weights = (pending['positions'], pending['sources'],
+                                              pending['targets'], pending['weights'])
+            iterations, temperature = pending['schedule'].tolist()
+    except (OSError, KeyError, ValueError):
+        return None
+
+    pos = force_layout(pos, sources, targets, weights, int(iterations), temperature)
+    with _layout_lock:
+        save_positions(key, node_ids, pos)
+    # Only the snapshot of key changes; ETags and other caches stay valid
+    graph_cache.invalidate(key)
+    return {'key': key, 'nodes': len(node_ids), 'iterations': int(iterations)}
+
+def layout_graph(key, graph):
+    """Add x/y coordinates to graph['nodes'], warm-starting from the previous layout of key.
+
+    Above INLINE_LAYOUT_LIMIT nodes, nodes keep their saved positions and new
+    ones are only seeded; the iterations are left to a background job.
+    """
+    nodes = graph['nodes']
+    if not nodes:
+        return graph
+    node_ids = [node['id'] for node in nodes]
+    index = {node_id: i for i, node_id in enumerate(node_ids)}
+
+    # Edges to nodes outside the graph (e.g. other archives) do not take part
+    sources, targets, weights = [], [], []
+    for edge in graph['edges']:
+        source, target = index.get(edge['source']), index.get(edge['target'])
+        if source is not None and target is not None and source != target:
+            sources.append(source)
+            targets.append(target)
+            weights.append(edge.get('strength') or 1.0)
+    sources = np.array(sources, dtype=np.int64)
+    targets = np.array(targets, dtype=np.int64)
+    weights = np.clip(np.array(weights, dtype=np.float64), 0.1, 1.0)
+
+    n = len(nodes)
+    rng = np.random.default_rng(n)
+    with _layout_lock:
+        previous = load_positions(key)
+    known = np.array([node_id in previous for node_id in node_ids])
+    pos = np.zeros((n, 2))
+    if known.any():
+        pos[known] = [previous[node_id] for node_id, seen in zip(node_ids, known) if seen]
+
+    if known.sum() >= max(n * 0.5, 1):
+        # Warm start: new nodes go next to their already placed neighbours
+        placed = known.copy()
+        for _ in range(3):
+            pending = np.flatnonzero(~placed)
+            if not len(pending):
+                break
+            total = np.zeros((n, 2))
+            count = np.zeros(n)
+            for a, b in ((sources, targets), (targets, sources)):
+                mask = placed[b] & ~placed[a]
+                np.add.at(total, a[mask], pos[b[mask]])
+                np.add.at(count, a[mask], 1)
+            reached = pending[count[pending] > 0]
+            pos[reached] = total[reached] / count[reached, None]
+            pos[reached] += rng.normal(scale=EDGE_LENGTH / 3, size=(len(reached), 2))
+            placed[reached] = True
+        unplaced = np.flatnonzero(~placed)
+        radius = np.sqrt(n) * EDGE_LENGTH / 2
+        pos[unplaced] = rng.uniform(-radius, radius, size=(len(unplaced), 2))
+        iterations, temperature = WARM_ITERATIONS, EDGE_LENGTH / 4
+    else:
+        radius = np.sqrt(n) * EDGE_LENGTH / 2
+        pos = rng.uniform(-radius, radius, size=(n, 2))
+        iterations, temperature = COLD_ITERATIONS, radius / 4
+
+    # The iterations run unlocked, so other graphs are not held up behind them
+    if n <= INLINE_LAYOUT_LIMIT:
+        pos = force_layout(pos, sources, targets, weights, iterations, temperature)
+        with _layout_lock:
+            save_positions(key, node_ids, pos)
+    elif not known.all():
+        with _layout_lock:
+            _defer_layout(key, node_ids, pos, sources, targets, weights, iterations, temperature)
+
+    for node, (x, y) in zip(nodes, pos.round(1).tolist()):
+        node['x'] = x
+        node['y'] = y
+    return graph
@@ -0,0 +1,84 @@
+from flask import current_app, request
+from sqlalchemy import text
+from src.models.user import db
+from datetime import datetime, timezone
+from functools import wraps
+import hashlib
+
+# Browsers revalidate every time (a 304 costs one indexed lookup); shared
+# caches such as the nginx front end may reuse a response for a few seconds
+CACHE_CONTROL = 'public, max-age=0, s-maxage=5'
+
+def make_etag(*parts):
+    """ETag of a response: its URL (path and query) plus the given state"""
+    raw = repr((request.full_path,) + parts).encode('utf-8')
+    return hashlib.sha1(raw).hexdigest()
+
+def _as_http_date(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.replace(tzinfo=timezone.utc, microsecond=0)
+
+def generation_validators(keys=None, prefix=None):
+    """(etag, last_modified) for data covered by cache keys, or by every key under a prefix.
+
+    Every write bumps its keys' generations in the same transaction (see
+    graph_cache), deletes and bulk inserts included, so the count and sum of
+    the generations change whenever the data does, with no scan of the data itself.
+    """
+    if prefix is not None:
+        condition, params = "key LIKE :prefix", {'prefix': prefix + '%'}
+    else:
+        keys = sorted(set(keys))
+        if not keys:
+            return make_etag(0, 0), None
+        condition = f"key IN ({', '.join(f':k{i}' for i in range(len(keys)))})"
+        params = {f'k{i}': key for i, key in enumerate(keys)}
+    count, total, updated_at = db.session.execute(text(
+        "SELECT COUNT(*), COALESCE(SUM(generation), 0), MAX(updated_at) "
+        f"FROM cache_generations WHERE {condition}"
+    ), params).one()
+    return make_etag(count, total), _as_http_date(updated_at)
+
+def is_not_modified(etag, last_modified=None):
+    """Whether the client's copy (If-None-Match, else If-Modified-Since) is current"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified is not None:
+        return last_modified <= request.if_modified_since
+    return False
+
+def add_validators(response, etag, last_modified=None):
+    # Weak: the tag stands for the data, whatever encoding or compression carries it
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
+
+def not_modified_response(etag, last_modified=None):
+    return add_validators(current_app.response_class(status=304), etag, last_modified)
+
+def conditional(validators):
+    """Answer 304 before running the view when the client's copy is current.
+
+    validators(**view_args) returns (etag, last_modified), or None to skip
+    validation (e.g. when the resource does not exist). 200 responses get
+    ETag, Last-Modified and Cache-Control.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            current = validators(*args, **kwargs)
+            if current is None:
+                return view(*args, **kwargs)
+            if is_not_modified(*current):
+                return not_modified_response(*current)
+            response = current_app.make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                add_validators(response, *current)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,319 @@
+from src.models.archive import db, ArchiveItem, Annotation
+from src.services.graph_cache import bump_generations, archive_key
+from sqlalchemy.exc import SQLAlchemyError
+from datetime import datetime
+import io
+import json
+import time
+
+# Longest accepted NDJSON line (full transcriptions can be large)
+MAX_LINE_BYTES = 32 * 1024 * 1024
+
+READ_BUFFER_BYTES = 256 * 1024
+
+# Per-line errors beyond this are counted but not listed in the report
+MAX_REPORTED_ERRORS = 1000
+
+# Accepted item fields and their maximum length (None = unbounded text)
+ITEM_FIELDS = {
+    'title': 200,
+    'code': 50,
+    'description': None,
+    'location': 100,
+    'content': None,
+    'image_url': 500,
+    'audio_url': 500,
+}
+
+ANNOTATION_FIELDS = ['item_id', 'text', 'start_pos', 'end_pos', 'annotation_type',
+                     'entity_uri', 'confidence', 'created_by']
+
+def iter_ndjson(stream):
+    """Yield (line_no, record, error) for each non-blank line of an NDJSON stream"""
+    # Werkzeug's input stream is unbuffered: readline() would read byte by byte
+    if isinstance(stream, io.RawIOBase):
+        stream = io.BufferedReader(stream, READ_BUFFER_BYTES)
+    line_no = 0
+    while True:
+        line = stream.readline(MAX_LINE_BYTES + 1)
+        if not line:
+            return
+        line_no += 1
+
+        if len(line) > MAX_LINE_BYTES and not line.endswith(b'\n'):
+            # Skip the remainder of the oversized line without buffering it
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(MAX_LINE_BYTES)
+            yield line_no, None, f'Line longer than {MAX_LINE_BYTES} bytes'
+            continue
+
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f'Invalid JSON: {e}'
+            continue
+
+        if not isinstance(record, dict):
+            yield line_no, None, 'Expected a JSON object'
+            continue
+
+        yield line_no, record, None
+
+def iter_json_records(records):
+    """Yield (line_no, record, error) for the entries of an already parsed JSON list"""
+    for index, record in enumerate(records, 1):
+        if not isinstance(record, dict):
+            yield index, None, 'Expected a JSON object'
+        else:
+            yield index, record, None
+
+def validate_item(record, partial=False):
+    """Return (row, error): row holds the accepted item fields of record"""
+    unknown = set(record) - set(ITEM_FIELDS)
+    if unknown:
+        return None, f"Unknown fields: {', '.join(sorted(unknown))}"
+
+    if not partial or 'title' in record:
+        title = record.get('title')
+        if not isinstance(title, str) or not title.strip():
+            return None, "'title' is required"
+
+    row = {}
+    for field, max_length in ITEM_FIELDS.items():
+        if field not in record:
+            continue
+        value = record[field]
+        if value is not None and not isinstance(value, str):
+            return None, f"'{field}' must be a string"
+        if value is not None and max_length and len(value) > max_length:
+            return None, f"'{field}' is longer than {max_length} characters"
+        row[field] = value
+    return row, None
+
+class BulkReport:
+    """Counters and per-line errors of one bulk ingestion"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.received = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, line_no, message, record=None):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            error = {'line': line_no, 'error': message}
+            if record is not None:
+                error['record'] = record
+            self.errors.append(error)
+
+    def to_dict(self):
+        elapsed = time.monotonic() - self.started
+        stored = self.inserted + self.updated
+        return {
+            'received': self.received,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(stored / elapsed, 1) if elapsed > 0 else None
+        }
+
+def ingest_items(archive_id, stream, upsert=False, chunk_size=1000):
+    """Insert (or upsert on code) the NDJSON items of stream in chunked transactions"""
+    report = BulkReport()
+    chunk = []
+
+    for line_no, record, error in iter_ndjson(stream):
+        report.received += 1
+        if error:
+            report.error(line_no, error)
+            continue
+
+        row, error = validate_item(record, partial=upsert and bool(record.get('code')))
+        if error:
+            report.error(line_no, error)
+            continue
+
+        chunk.append((line_no, row))
+        if len(chunk) >= chunk_size:
+            _store_chunk(archive_id, chunk, upsert, report)
+            chunk = []
+
+    if chunk:
+        _store_chunk(archive_id, chunk, upsert, report)
+
+    return report.to_dict()
+
+def _store_chunk(archive_id, chunk, upsert, report):
+    """Write one chunk with executemany statements in a single transaction"""
+    now = datetime.utcnow()
+    inserts = []
+    updates = {}
+
+    existing = {}
+    if upsert:
+        codes = {row['code'] for _, row in chunk if row.get('code')}
+        if codes:
+            # Lowest id wins if a code is already duplicated in the archive
+            existing = dict(db.session.execute(
+                db.select(ArchiveItem.code, ArchiveItem.id)
+                  .where(ArchiveItem.archive_id == archive_id, ArchiveItem.code.in_(codes))
+                  .order_by(ArchiveItem.id.desc())
+            ).all())
+
+    pending_by_code = {}
+    stored_lines = []
+    for line_no, row in chunk:
+        code = row.get('code')
+        if upsert and code in existing:
+            # Later lines for the same code override earlier ones
+            updates.setdefault(code, {'id': existing[code]}).update(row, updated_at=now)
+        elif upsert and code and code in pending_by_code:
+            pending_by_code[code].update(row)
+        elif not row.get('title'):
+            # Partial rows are only valid as updates of an existing code
+            report.error(line_no, "'title' is required for new items")
+            continue
+        else:
+            insert_row = dict(row, archive_id=archive_id)
+            inserts.append(insert_row)
+            if upsert and code:
+                pending_by_code[code] = insert_row
+        stored_lines.append(line_no)
+
+    try:
+        if inserts:
+            db.session.execute(db.insert(ArchiveItem), inserts)
+        if updates:
+            db.session.execute(db.update(ArchiveItem), list(updates.values()))
+        bump_generations(db.session.connection(), [archive_key(archive_id)])
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        message = f'Chunk rejected by the database: {e.__class__.__name__}'
+        for line_no in stored_lines:
+            report.error(line_no, message)
+        return
+
+    report.inserted += len(inserts)
+    report.updated += len(updates)
+
+def validate_annotation(record):
+    """Return (row, error) for an annotation record; spans are checked later against content"""
+    unknown = set(record) - set(ANNOTATION_FIELDS)
+    if unknown:
+        return None, f"Unknown fields: {', '.join(sorted(unknown))}"
+
+    item_id = record.get('item_id')
+    if not isinstance(item_id, int) or isinstance(item_id, bool):
+        return None, "'item_id' must be an integer"
+
+    for field in ('text', 'annotation_type'):
+        if not isinstance(record.get(field), str) or not record[field]:
+            return None, f"'{field}' is required"
+
+    for field, max_length in (('annotation_type', 50), ('entity_uri', 500), ('created_by', 100)):
+        value = record.get(field)
+        if value is not None and (not isinstance(value, str) or len(value) > max_length):
+            return None, f"'{field}' must be a string of at most {max_length} characters"
+
+    start_pos, end_pos = record.get('start_pos'), record.get('end_pos')
+    if (start_pos is None) != (end_pos is None):
+        return None, "'start_pos' and 'end_pos' must be given together"
+    if start_pos is not None:
+        if not all(isinstance(pos, int) and not isinstance(pos, bool) for pos in (start_pos, end_pos)):
+            return None, "'start_pos' and 'end_pos' must be integers"
+        if not 0 <= start_pos < end_pos:
+            return None, 'Empty or negative span'
+
+    confidence = record.get('confidence', 1.0)
+    if not isinstance(confidence, (int, float)) or isinstance(confidence, bool) or not 0 <= confidence <= 1:
+        return None, "'confidence' must be a number between 0 and 1"
+
+    row = {field: record.get(field) for field in ANNOTATION_FIELDS}
+    row['confidence'] = float(confidence)
+    row['created_by'] = record.get('created_by') or 'system'
+    return row, None
+
+def ingest_annotations(records, chunk_size=1000):
+    """Validate annotation records (spans included) and insert them in chunked transactions"""
+    report = BulkReport()
+    chunk = []
+
+    for line_no, record, error in records:
+        report.received += 1
+        if error:
+            report.error(line_no, error)
+            continue
+
+        row, error = validate_annotation(record)
+        if error:
+            report.error(line_no, error, record)
+            continue
+
+        chunk.append((line_no, record, row))
+        if len(chunk) >= chunk_size:
+            _store_annotation_chunk(chunk, report)
+            chunk = []
+
+    if chunk:
+        _store_annotation_chunk(chunk, report)
+
+    return report.to_dict()
+
+def _store_annotation_chunk(chunk, report):
+    """Check the spans of one chunk against item content, then insert the valid rows"""
+    item_ids = {row['item_id'] for _, _, row in chunk}
+    items = {
+        item_id: (archive_id, content or '')
+        for item_id, archive_id, content in db.session.execute(
+            db.select(ArchiveItem.id, ArchiveItem.archive_id, ArchiveItem.content)
+              .where(ArchiveItem.id.in_(item_ids))
+        )
+    }
+
+    inserts = []
+    stored_lines = []
+    archive_ids = set()
+    for line_no, record, row in chunk:
+        if row['item_id'] not in items:
+            report.error(line_no, 'Item not found', record)
+            continue
+
+        archive_id, content = items[row['item_id']]
+        if row['start_pos'] is not None:
+            if row['end_pos'] > len(content):
+                report.error(line_no, f'Span ends past the item content ({len(content)} characters)', record)
+                continue
+            if content[row['start_pos']:row['end_pos']] != row['text']:
+                report.error(line_no, 'Span text does not match the item content', record)
+                continue
+
+        inserts.append(row)
+        stored_lines.append(line_no)
+        archive_ids.add(archive_id)
+
+    if not inserts:
+        return
+
+    try:
+        db.session.execute(db.insert(Annotation), inserts)
+        bump_generations(db.session.connection(), [archive_key(archive_id) for archive_id in archive_ids])
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        message = f'Chunk rejected by the database: {e.__class__.__name__}'
+        for line_no in stored_lines:
+            report.error(line_no, message)
+        return
+
+    report.inserted += len(inserts)
@@ -0,0 +1,313 @@
+from src.models.archive import db, ArchiveItem, ItemConnection
+from src.services.graph_cache import archives_generation, archive_keys_for_items
+from array import array
+from collections import deque
+from itertools import chain
+import copy
+import heapq
+import threading
+
+# Fold incremental edges back into the CSR arrays once they reach this share of the graph
+COMPACT_RATIO = 0.1
+
+def edge_cost(strength):
+    """Dijkstra cost of an edge: strong connections are short"""
+    if strength is None:
+        strength = 1.0
+    return 1.0 / max(strength, 1e-6)
+
+class AdjacencyGraph:
+    """Undirected item graph in compressed sparse row form.
+
+    The neighbours of node i are targets[offsets[i]:offsets[i + 1]], with the
+    matching connection ids, types and strengths in the parallel arrays. Edges
+    added after the build live in a small overlay until the next compaction.
+
+    A graph is never changed once it has been built: with_edge() returns a new
+    graph, so readers can keep using the one they hold without locking.
+    """
+
+    def __init__(self, item_ids, edges):
+        self.item_ids = array('q', item_ids)
+        self.index = {item_id: i for i, item_id in enumerate(self.item_ids)}
+        self.types = []
+        self._type_index = {}
+        self._overlay = {}
+        self._overlay_size = 0
+        self._communities = None
+        self._build_csr(edges)
+
+    def _type_code(self, connection_type):
+        code = self._type_index.get(connection_type)
+        if code is None:
+            code = self._type_index[connection_type] = len(self.types)
+            self.types.append(connection_type)
+        return code
+
+    def _node(self, item_id):
+        node = self.index.get(item_id)
+        if node is None:
+            node = self.index[item_id] = len(self.item_ids)
+            self.item_ids.append(item_id)
+        return node
+
+    def _build_csr(self, edges):
+        """edges: (connection_id, source_id, target_id, connection_type, strength)"""
+        half_edges = []
+        for connection_id, source_id, target_id, connection_type, strength in edges:
+            source, target = self._node(source_id), self._node(target_id)
+            code = self._type_code(connection_type)
+            half_edges.append((source, target, connection_id, code, strength))
+            if source != target:
+                half_edges.append((target, source, connection_id, code, strength))
+
+        # Counting sort by source node
+        node_count = len(self.item_ids)
+        offsets = array('q', bytes(8 * (node_count + 1)))
+        for source, *_ in half_edges:
+            offsets[source + 1] += 1
+        for i in range(node_count):
+            offsets[i + 1] += offsets[i]
+
+        size = len(half_edges)
+        targets = array('q', bytes(8 * size))
+        connection_ids = array('q', bytes(8 * size))
+        type_codes = array('H', bytes(2 * size))
+        strengths = array('d', bytes(8 * size))
+        fill = array('q', offsets[:-1])
+        for source, target, connection_id, code, strength in half_edges:
+            slot = fill[source]
+            fill[source] += 1
+            targets[slot] = target
+            connection_ids[slot] = connection_id
+            type_codes[slot] = code
+            strengths[slot] = 1.0 if strength is None else strength
+
+        self.offsets = offsets
+        self.targets = targets
+        self.connection_ids = connection_ids
+        self.type_codes = type_codes
+        self.strengths = strengths
+        self._overlay.clear()
+        self._overlay_size = 0
+
+    @property
+    def edge_count(self):
+        return len(self.targets) + self._overlay_size
+
+    def with_edge(self, connection_id, source_id, target_id, connection_type, strength):
+        """Copy of the graph with one more connection.
+
+        The CSR arrays are shared with this graph; only the overlay, and the
+        node and type tables when they grow, are copied.
+        """
+        graph = copy.copy(self)
+        if source_id not in self.index or target_id not in self.index:
+            graph.item_ids = array('q', self.item_ids)
+            graph.index = dict(self.index)
+        if connection_type not in self._type_index:
+            graph.types = list(self.types)
+            graph._type_index = dict(self._type_index)
+        graph._overlay = dict(self._overlay)
+        graph._communities = None
+
+        source, target = graph._node(source_id), graph._node(target_id)
+        code = graph._type_code(connection_type)
+        strength = 1.0 if strength is None else strength
+        graph._overlay[source] = graph._overlay.get(source, []) + [(target, connection_id, code, strength)]
+        graph._overlay_size += 1
+        if source != target:
+            graph._overlay[target] = graph._overlay.get(target, []) + [(source, connection_id, code, strength)]
+            graph._overlay_size += 1
+
+        if graph._overlay_size > COMPACT_RATIO * max(len(graph.targets), 1000):
+            return AdjacencyGraph(graph.item_ids, list(graph.edges()))
+        return graph
+
+    def edges(self):
+        """Every connection once, as (connection_id, source_id, target_id, type, strength)"""
+        seen = set()
+        for node in range(len(self.item_ids)):
+            for target, connection_id, code, strength in self.neighbours(node):
+                if connection_id not in seen:
+                    seen.add(connection_id)
+                    yield (connection_id, self.item_ids[node], self.item_ids[target],
+                           self.types[code], strength)
+
+    def neighbours(self, node):
+        """(node, connection_id, type_code, strength) for every edge at node"""
+        if node + 1 < len(self.offsets):
+            start, end = self.offsets[node], self.offsets[node + 1]
+            edges = zip(self.targets[start:end], self.connection_ids[start:end],
+                        self.type_codes[start:end], self.strengths[start:end])
+        else:
+            edges = ()
+        overlay = self._overlay.get(node)
+        return chain(edges, overlay) if overlay else edges
+
+    def communities(self, max_rounds=20):
+        """{item_id: community} from weighted label propagation, memoised until the next edge.
+
+        A community is named after its smallest item id; items without
+        connections get None.
+        """
+        if self._communities is not None:
+            return self._communities
+
+        node_count = len(self.item_ids)
+        labels = list(range(node_count))
+        # Fixed visiting order keeps the result stable between rebuilds
+        order = sorted(range(node_count), key=lambda node: (self.item_ids[node] * 2654435761) % 4294967296)
+        for _ in range(max_rounds):
+            changed = False
+            for node in order:
+                votes = {}
+                for target, _, _, strength in self.neighbours(node):
+                    if target != node:
+                        votes[labels[target]] = votes.get(labels[target], 0.0) + strength
+                if not votes:
+                    continue
+                best = max(votes.values())
+                label = min(label for label, weight in votes.items() if weight == best)
+                if label != labels[node] and votes.get(labels[node]) != best:
+                    labels[node] = label
+                    changed = True
+            if not changed:
+                break
+
+        names = {}
+        for node in range(node_count):
+            item_id = self.item_ids[node]
+            if labels[node] not in names or item_id < names[labels[node]]:
+                names[labels[node]] = item_id
+        isolated = {node for node in range(node_count) if next(iter(self.neighbours(node)), None) is None}
+        self._communities = {
+            self.item_ids[node]: None if node in isolated else names[labels[node]]
+            for node in range(node_count)
+        }
+        return self._communities
+
+    def _edge_dict(self, source, target, connection_id, code, strength):
+        return {
+            'connection_id': connection_id,
+            'from': self.item_ids[source],
+            'to': self.item_ids[target],
+            'connection_type': self.types[code],
+            'strength': strength,
+        }
+
+    def k_hop(self, item_id, depth, limit):
+        """Breadth-first neighbourhood of item_id up to depth hops.
+
+        Returns ({item_id: distance}, edges, truncated); edges are the BFS tree
+        edges that reached each node.
+        """
+        start = self.index[item_id]
+        distances = {start: 0}
+        edges = []
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            if distances[node] == depth:
+                continue
+            for target, connection_id, code, strength in self.neighbours(node):
+                if target in distances:
+                    continue
+                if len(distances) > limit:
+                    return self._ids(distances), edges, True
+                distances[target] = distances[node] + 1
+                edges.append(self._edge_dict(node, target, connection_id, code, strength))
+                queue.append(target)
+        return self._ids(distances), edges, False
+
+    def _ids(self, distances):
+        return {self.item_ids[node]: distance for node, distance in distances.items()}
+
+    def shortest_path(self, from_id, to_id, weighted=False):
+        """Shortest path as (item_ids, edges, cost), or None when the items are not connected.
+
+        Unweighted paths minimise hops (BFS); weighted ones minimise the sum of
+        1 / strength (Dijkstra).
+        """
+        start, goal = self.index[from_id], self.index[to_id]
+        previous = {start: None}
+
+        if weighted:
+            costs = {start: 0.0}
+            heap = [(0.0, start)]
+            while heap:
+                cost, node = heapq.heappop(heap)
+                if node == goal:
+                    break
+                if cost > costs[node]:
+                    continue
+                for target, connection_id, code, strength in self.neighbours(node):
+                    new_cost = cost + edge_cost(strength)
+                    if new_cost < costs.get(target, float('inf')):
+                        costs[target] = new_cost
+                        previous[target] = (node, connection_id, code, strength)
+                        heapq.heappush(heap, (new_cost, target))
+        else:
+            queue = deque([start])
+            while queue and goal not in previous:
+                node = queue.popleft()
+                for target, connection_id, code, strength in self.neighbours(node):
+                    if target not in previous:
+                        previous[target] = (node, connection_id, code, strength)
+                        queue.append(target)
+
+        if goal not in previous:
+            return None
+
+        nodes, edges = [goal], []
+        while previous[nodes[-1]] is not None:
+            node, connection_id, code, strength = previous[nodes[-1]]
+            edges.append(self._edge_dict(node, nodes[-1], connection_id, code, strength))
+            nodes.append(node)
+        nodes.reverse()
+        edges.reverse()
+        cost = costs[goal] if weighted else float(len(edges))
+        return [self.item_ids[node] for node in nodes], edges, cost
+
+def build_item_graph():
+    """Load every item and connection into an AdjacencyGraph"""
+    item_ids = db.session.execute(db.select(ArchiveItem.id).order_by(ArchiveItem.id)).scalars()
+    edges = db.session.execute(db.select(
+        ItemConnection.id, ItemConnection.source_id, ItemConnection.target_id,
+        ItemConnection.connection_type, ItemConnection.strength
+    ).execution_options(yield_per=5000))
+    return AdjacencyGraph(item_ids, (tuple(edge) for edge in edges))
+
+_graph_lock = threading.Lock()
+_graph = None
+_graph_generation = None
+
+def get_item_graph():
+    """Process-wide item graph, rebuilt when any archive has been written to"""
+    global _graph, _graph_generation
+    generation = archives_generation()
+    with _graph_lock:
+        if _graph is None or _graph_generation != generation:
+            _graph = build_item_graph()
+            _graph_generation = generation
+        return _graph
+
+def record_connection(connection, generation_before):
+    """Apply a just-committed connection to the cached graph instead of rebuilding it.
+
+    generation_before is archives_generation() read in the transaction that
+    created the connection. If nothing but that commit has moved the generation
+    (one bump per archive of its two items) the cached graph is swapped for a
+    copy with the edge; otherwise the next get_item_graph() rebuilds.
+    """
+    global _graph, _graph_generation
+    generation = archives_generation()
+    bumps = len(archive_keys_for_items(db.session.connection(), {connection.source_id, connection.target_id}))
+    with _graph_lock:
+        if _graph is None or _graph_generation != generation_before:
+            return
+        if generation[1] != generation_before[1] + bumps:
+            return
+        _graph = _graph.with_edge(connection.id, connection.source_id, connection.target_id,
+                                  connection.connection_type, connection.strength)
+        _graph_generation = generation
@@ -0,0 +1,352 @@
+from flask import current_app
+from sqlalchemy.exc import OperationalError
+from src.models.job import db, Job
+from src.models.archive import Archive, ArchiveItem, Annotation, ItemConnection, VoiceRecording
+from src.services.search_index import rebuild_search_index
+from src.services.tagger import auto_annotate_archive
+from src.services.similarity import generate_suggestions
+from src.services.centrality import recompute_item_scores
+from src.services.rdf_export import EXPORT_FORMATS, SERIALIZERS, iter_archive_descriptions
+from src.services.streaming import buffered
+from src.services.waveform import WaveformError, ingest_recording
+from src.services.graph_layout import run_deferred_layout
+from datetime import datetime, timedelta
+import inspect
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+
+logger = logging.getLogger(__name__)
+
+# Seconds between idle polls of the queue
+POLL_INTERVAL = 1.0
+
+# Running jobs refresh heartbeat_at this often; after STALE_AFTER without
+# one their worker is presumed dead and the job is retried
+HEARTBEAT_INTERVAL = 15
+STALE_AFTER = 120
+
+# Progress is written at most this often (seconds), cancellation checked with it
+PROGRESS_INTERVAL = 0.5
+
+# Retry n waits RETRY_BACKOFF * 2^(n-1) seconds
+RETRY_BACKOFF = 10
+
+DEFAULT_MAX_ATTEMPTS = 3
+
+class JobCancelled(Exception):
+    """Raised inside a task once its job has been cancelled"""
+
+class JobError(Exception):
+    """A failure retrying will not fix (bad parameters, missing archive)"""
+
+# Task registry: kind -> (function, max attempts)
+TASKS = {}
+
+def task(kind, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Register function(context, **params) as the runner of a job kind"""
+    def register(func):
+        TASKS[kind] = (func, max_attempts)
+        return func
+    return register
+
+class JobContext:
+    """Handed to tasks to report progress; raises JobCancelled when the job was cancelled"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._reported_at = 0.0
+
+    def progress(self, fraction=None, message=None, force=False):
+        now = time.monotonic()
+        if not force and now - self._reported_at < PROGRESS_INTERVAL:
+            return
+        if _holds_write_lock():
+            # Another connection would wait on the task's own lock until busy_timeout
+            return
+        self._reported_at = now
+
+        values = {'heartbeat_at': datetime.utcnow()}
+        if fraction is not None:
+            values['progress'] = min(max(float(fraction), 0.0), 1.0)
+        if message is not None:
+            values['message'] = message[:255]
+        # Own connection, so the task's open transaction is neither committed nor rolled back
+        try:
+            with db.engine.begin() as connection:
+                cancelled = connection.execute(
+                    db.update(Job).where(Job.id == self.job_id).values(**values).returning(Job.cancel_requested)
+                ).scalar()
+        except OperationalError:
+            # The task itself holds the write lock; progress is best effort
+            return
+        if cancelled:
+            raise JobCancelled()
+
+def _holds_write_lock():
+    """Whether the session has uncommitted writes, and so holds SQLite's write lock"""
+    session = db.session()
+    if not session.in_transaction():
+        return False
+    return session.connection().connection.dbapi_connection.in_transaction
+
+def enqueue(kind, params=None, max_attempts=None):
+    """Queue a job and return it; raises ValueError for an unknown kind"""
+    if kind not in TASKS:
+        raise ValueError(f'Unknown job kind: {kind}')
+    job = Job(kind=kind, params=json.dumps(params or {}),
+              max_attempts=max_attempts or TASKS[kind][1], run_after=datetime.utcnow())
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+def enqueue_once(kind, params=None):
+    """Queue a job unless an identical one is still waiting; returns the queued job"""
+    queued = Job.query.filter_by(kind=kind, status='queued', params=json.dumps(params or {})).first()
+    return queued or enqueue(kind, params)
+
+def cancel_job(job):
+    """Cancel a queued job outright, or ask a running one to stop; False if it already finished"""
+    now = datetime.utcnow()
+    cancelled = db.session.execute(
+        db.update(Job).where(Job.id == job.id, Job.status == 'queued')
+          .values(status='cancelled', cancel_requested=True, finished_at=now, message='Cancelled')
+          .execution_options(synchronize_session=False)
+    ).rowcount
+    if not cancelled:
+        cancelled = db.session.execute(
+            db.update(Job).where(Job.id == job.id, Job.status == 'running')
+              .values(cancel_requested=True)
+              .execution_options(synchronize_session=False)
+        ).rowcount
+    db.session.commit()
+    db.session.refresh(job)
+    return bool(cancelled)
+
+# Worker side
+def claim_job(worker):
+    """Atomically move the next due job to running for this worker; None if the queue is empty"""
+    now = datetime.utcnow()
+    next_job = db.select(Job.id).where(Job.status == 'queued', Job.run_after <= now)\
+                 .order_by(Job.run_after, Job.id).limit(1).scalar_subquery()
+    job_id = db.session.execute(
+        db.update(Job).where(Job.id == next_job, Job.status == 'queued')
+          .values(status='running', worker=worker, attempts=Job.attempts + 1,
+                  started_at=now, heartbeat_at=now, error=None)
+          .returning(Job.id)
+          .execution_options(synchronize_session=False)
+    ).scalar()
+    db.session.commit()
+    return db.session.get(Job, job_id) if job_id else None
+
+def _finish(job_id, **values):
+    db.session.execute(
+        db.update(Job).where(Job.id == job_id)
+          .values(finished_at=datetime.utcnow(), **values)
+          .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+def _retry_or_fail(job_id, error):
+    job = db.session.get(Job, job_id)
+    if job.attempts < job.max_attempts and not job.cancel_requested:
+        delay = RETRY_BACKOFF * 2 ** (job.attempts - 1)
+        job.status = 'queued'
+        job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+        job.message = f'Attempt {job.attempts} failed, retrying in {delay}s'
+        job.error = error
+        db.session.commit()
+    else:
+        _finish(job_id, status='failed', error=error)
+
+def run_job(job):
+    """Run a claimed job to completion and record the outcome"""
+    job_id = job.id
+    context = JobContext(job_id)
+    try:
+        if job.kind not in TASKS:
+            raise JobError(f'Unknown job kind: {job.kind}')
+        func = TASKS[job.kind][0]
+        try:
+            arguments = inspect.signature(func).bind(context, **json.loads(job.params or '{}'))
+        except TypeError as e:
+            raise JobError(f'Invalid parameters: {e}')
+        result = func(*arguments.args, **arguments.kwargs)
+    except JobCancelled:
+        db.session.rollback()
+        _finish(job_id, status='cancelled', message='Cancelled')
+    except JobError as e:
+        db.session.rollback()
+        _finish(job_id, status='failed', error=str(e))
+    except Exception:
+        db.session.rollback()
+        logger.exception('Job %s (%s) failed', job_id, job.kind)
+        _retry_or_fail(job_id, traceback.format_exc())
+    else:
+        _finish(job_id, status='succeeded', progress=1.0, result=json.dumps(result))
+
+def recover_stale_jobs():
+    """Requeue (or fail, when out of attempts) running jobs whose worker stopped heart-beating"""
+    cutoff = datetime.utcnow() - timedelta(seconds=STALE_AFTER)
+    stale = db.and_(Job.status == 'running', Job.heartbeat_at < cutoff)
+    requeued = db.session.execute(
+        db.update(Job).where(stale, Job.attempts < Job.max_attempts, Job.cancel_requested.is_(False))
+          .values(status='queued', run_after=datetime.utcnow(), message='Worker lost, retrying')
+          .execution_options(synchronize_session=False)
+    ).rowcount
+    failed = db.session.execute(
+        db.update(Job).where(stale)
+          .values(status='failed', finished_at=datetime.utcnow(), error='Worker lost')
+          .execution_options(synchronize_session=False)
+    ).rowcount
+    db.session.commit()
+    return requeued + failed
+
+def _heartbeat(app, worker_prefix, stop):
+    """Keep the heartbeat of this process's running jobs fresh, whatever the task is doing"""
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        try:
+            with app.app_context():
+                with db.engine.begin() as connection:
+                    connection.execute(
+                        db.update(Job).where(Job.status == 'running', Job.worker.like(worker_prefix + '%'))
+                          .values(heartbeat_at=datetime.utcnow())
+                    )
+        except OperationalError:
+            logger.warning('Heartbeat skipped, database busy')
+
+def _work(app, worker, stop):
+    while not stop.is_set():
+        try:
+            with app.app_context():
+                job = claim_job(worker)
+                if job is not None:
+                    logger.info('%s running job %s (%s)', worker, job.id, job.kind)
+                    run_job(job)
+                    continue
+        except OperationalError:
+            logger.warning('%s could not reach the job table, retrying', worker)
+        stop.wait(POLL_INTERVAL)
+
+def _recover():
+    try:
+        recovered = recover_stale_jobs()
+    except OperationalError:
+        db.session.rollback()
+        logger.warning('Stale job recovery skipped, database busy')
+        return
+    if recovered:
+        logger.info('Recovered %s stale jobs', recovered)
+
+def run_worker(app, threads=2):
+    """Serve the job queue with a pool of worker threads until interrupted"""
+    prefix = f'{socket.gethostname()}:{os.getpid()}/'
+    stop = threading.Event()
+    with app.app_context():
+        _recover()
+
+    pool = [threading.Thread(target=_work, args=(app, f'{prefix}{n}', stop), daemon=True)
+            for n in range(threads)]
+    pool.append(threading.Thread(target=_heartbeat, args=(app, prefix, stop), daemon=True))
+    for thread in pool:
+        thread.start()
+    try:
+        while not stop.wait(STALE_AFTER / 2):
+            with app.app_context():
+                _recover()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        for thread in pool:
+            thread.join()
+
+# Tasks
+def _archive(slug):
+    archive = Archive.query.filter_by(slug=slug).first()
+    if archive is None:
+        raise JobError(f'Archive not found: {slug}')
+    return archive
+
+@task('reindex')
+def reindex_task(context):
+    """Rebuild the full-text search tables"""
+    context.progress(0.0, 'Rebuilding search index', force=True)
+    rebuild_search_index(db.engine)
+    return {'rebuilt': ['archive_items_fts', 'annotations_fts']}
+
+@task('auto_annotate')
+def auto_annotate_task(context, archive, workers=None, dry_run=False):
+    return auto_annotate_archive(_archive(archive), workers=workers, dry_run=dry_run,
+                                 progress=context.progress)
+
+@task('suggestions')
+def suggestions_task(context, min_similarity=0.3):
+    context.progress(0.0, 'Comparing items', force=True)
+    return generate_suggestions(min_similarity=min_similarity)
+
+@task('scores')
+def scores_task(context):
+    context.progress(0.0, 'Computing centrality', force=True)
+    return recompute_item_scores()
+
+@task('waveform')
+def waveform_task(context, recording, words=None):
+    """Peaks and word index of a voice recording"""
+    voice_recording = db.session.get(VoiceRecording, recording)
+    if voice_recording is None:
+        raise JobError(f'Voice recording not found: {recording}')
+    try:
+        return ingest_recording(voice_recording, words=words, progress=context.progress)
+    except WaveformError as e:
+        raise JobError(str(e))
+
+@task('layout')
+def layout_task(context, key):
+    """Force iterations of a graph layout too large to run during a request"""
+    context.progress(0.0, 'Laying out graph', force=True)
+    result = run_deferred_layout(key)
+    if result is None:
+        raise JobError(f'No pending layout for {key}')
+    return result
+
+def export_path(job_id, fmt):
+    return os.path.join(current_app.config['JOB_OUTPUT_DIR'], f'job-{job_id}.{fmt}')
+
+@task('export', max_attempts=2)
+def export_task(context, archive, fmt='nt'):
+    """Serialize an archive to a file, served by GET /jobs/<id>/download"""
+    if fmt not in EXPORT_FORMATS:
+        raise JobError(f"Unsupported format, use one of: {', '.join(EXPORT_FORMATS)}")
+    archive = _archive(archive)
+    item_ids = db.select(ArchiveItem.id).where(ArchiveItem.archive_id == archive.id)
+    counts = db.session.execute(db.select(
+        db.select(db.func.count()).select_from(ArchiveItem)
+          .where(ArchiveItem.archive_id == archive.id).scalar_subquery(),
+        db.select(db.func.count()).select_from(Annotation)
+          .where(Annotation.item_id.in_(item_ids)).scalar_subquery(),
+        db.select(db.func.count()).select_from(ItemConnection)
+          .where(ItemConnection.source_id.in_(item_ids)).scalar_subquery(),
+    )).one()
+    # One description per archive, item and annotation, two per connection
+    total = 1 + counts[0] + counts[1] + 2 * counts[2]
+
+    def descriptions():
+        for done, description in enumerate(iter_archive_descriptions(archive)):
+            context.progress(done / total, f'Exported {done} of ~{total} resources')
+            yield description
+
+    path = export_path(context.job_id, fmt)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    size = 0
+    with open(path + '.tmp', 'wb') as f:
+        for chunk in buffered(SERIALIZERS[fmt](descriptions())):
+            f.write(chunk)
+            size += len(chunk)
+    os.replace(path + '.tmp', path)
+    return {'archive': archive.slug, 'format': fmt, 'file': os.path.basename(path), 'bytes': size,
+            'content_type': EXPORT_FORMATS[fmt]}
@@ -0,0 +1,161 @@
+from collections import namedtuple
+from urllib.parse import quote
+
+BASE_URI = 'http://archival-consciousness.org/'
+ONTOLOGY = BASE_URI + 'ontology/'
+
+RDF = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+RDFS = 'http://www.w3.org/2000/01/rdf-schema#'
+XSD = 'http://www.w3.org/2001/XMLSchema#'
+DCTERMS = 'http://purl.org/dc/terms/'
+OWL = 'http://www.w3.org/2002/07/owl#'
+
+PREFIXES = {
+    'ac': ONTOLOGY,
+    'rdf': RDF,
+    'rdfs': RDFS,
+    'xsd': XSD,
+    'dcterms': DCTERMS,
+    'owl': OWL,
+}
+
+XSD_STRING = XSD + 'string'
+XSD_INTEGER = XSD + 'integer'
+XSD_DECIMAL = XSD + 'decimal'
+XSD_DOUBLE = XSD + 'double'
+XSD_BOOLEAN = XSD + 'boolean'
+XSD_DATETIME = XSD + 'dateTime'
+XSD_ANYURI = XSD + 'anyURI'
+
+NUMERIC_TYPES = {XSD_INTEGER, XSD_DECIMAL, XSD_DOUBLE}
+
+# RDF terms. Literal values are Python str/int/float; plain strings carry no datatype.
+IRI = namedtuple('IRI', ['value'])
+Literal = namedtuple('Literal', ['value', 'datatype', 'language'], defaults=(None, None))
+
+RDF_TYPE = IRI(RDF + 'type')
+RDF_VALUE = IRI(RDF + 'value')
+
+def archive_uri(archive_id):
+    return IRI(f'{BASE_URI}archive/{archive_id}')
+
+def item_uri(item_id):
+    return IRI(f'{BASE_URI}item/{item_id}')
+
+def annotation_uri(annotation_id):
+    return IRI(f'{BASE_URI}annotation/{annotation_id}')
+
+def connection_uri(connection_id):
+    return IRI(f'{BASE_URI}connection/{connection_id}')
+
+def ontology_term(name):
+    return IRI(ONTOLOGY + quote(name, safe=''))
+
+def _datetime(value):
+    return Literal(value.isoformat(), XSD_DATETIME)
+
+# Descriptions: each returns (subject, [(predicate, object), ...]) for one row.
+# Rows may be ORM instances or Core rows with the same attribute names.
+def describe_archive(archive):
+    statements = [
+        (RDF_TYPE, ontology_term('Archive')),
+        (IRI(DCTERMS + 'title'), Literal(archive.name)),
+        (ontology_term('slug'), Literal(archive.slug)),
+    ]
+    if archive.description:
+        statements.append((IRI(DCTERMS + 'description'), Literal(archive.description)))
+    if archive.created_at:
+        statements.append((IRI(DCTERMS + 'created'), _datetime(archive.created_at)))
+    return archive_uri(archive.id), statements
+
+def describe_item(item, include_content=True):
+    statements = [
+        (RDF_TYPE, ontology_term('ArchiveItem')),
+        (IRI(DCTERMS + 'title'), Literal(item.title)),
+        (IRI(DCTERMS + 'isPartOf'), archive_uri(item.archive_id)),
+    ]
+    if item.code:
+        statements.append((IRI(DCTERMS + 'identifier'), Literal(item.code)))
+    if item.description:
+        statements.append((IRI(DCTERMS + 'description'), Literal(item.description)))
+    if item.location:
+        statements.append((ontology_term('location'), Literal(item.location)))
+    if include_content and item.content:
+        statements.append((ontology_term('content'), Literal(item.content)))
+    if item.image_url:
+        statements.append((ontology_term('imageUrl'), Literal(item.image_url, XSD_ANYURI)))
+    if item.audio_url:
+        statements.append((ontology_term('audioUrl'), Literal(item.audio_url, XSD_ANYURI)))
+    if item.created_at:
+        statements.append((IRI(DCTERMS + 'created'), _datetime(item.created_at)))
+    if item.updated_at:
+        statements.append((IRI(DCTERMS + 'modified'), _datetime(item.updated_at)))
+    return item_uri(item.id), statements
+
+def describe_annotation(annotation):
+    statements = [
+        (RDF_TYPE, ontology_term('Annotation')),
+        (RDF_TYPE, ontology_term(annotation.annotation_type)),
+        (ontology_term('annotates'), item_uri(annotation.item_id)),
+        (RDF_VALUE, Literal(annotation.text)),
+    ]
+    if annotation.start_pos is not None:
+        statements.append((ontology_term('startPos'), Literal(annotation.start_pos, XSD_INTEGER)))
+    if annotation.end_pos is not None:
+        statements.append((ontology_term('endPos'), Literal(annotation.end_pos, XSD_INTEGER)))
+    if annotation.confidence is not None:
+        statements.append((ontology_term('confidence'), Literal(float(annotation.confidence), XSD_DOUBLE)))
+    if annotation.entity_uri:
+        statements.append((IRI(OWL + 'sameAs'), IRI(annotation.entity_uri)))
+    if annotation.created_by:
+        statements.append((IRI(DCTERMS + 'creator'), Literal(annotation.created_by)))
+    return annotation_uri(annotation.id), statements
+
+def describe_connection(connection):
+    statements = [
+        (RDF_TYPE, ontology_term('Connection')),
+        (ontology_term('source'), item_uri(connection.source_id)),
+        (ontology_term('target'), item_uri(connection.target_id)),
+        (ontology_term('connectionType'), Literal(connection.connection_type)),
+    ]
+    if connection.strength is not None:
+        statements.append((ontology_term('strength'), Literal(float(connection.strength), XSD_DOUBLE)))
+    return connection_uri(connection.id), statements
+
+def connection_shortcut(connection):
+    """Direct item-to-item triple for a connection, e.g. item/1 ac:semantic item/2"""
+    return (item_uri(connection.source_id), ontology_term(connection.connection_type),
+            item_uri(connection.target_id))
+
+# N-Triples serialization
+_NT_ESCAPES = str.maketrans({'\\': '\\\\', '"': '\\"', '\n': '\\n', '\r': '\\r'})
+
+# Characters IRIREF does not allow verbatim are written as UCHAR escapes, so
+# user-supplied IRIs (annotation entity_uri) cannot break the output
+_IRI_ESCAPES = str.maketrans({char: '\\u%04X' % ord(char)
+                              for char in [chr(code) for code in range(0x21)] + list('<>"{}|^`\\')})
+
+def literal_lexical(literal):
+    """Lexical form of a literal value"""
+    value = literal.value
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+def iri_to_nt(iri):
+    return '<%s>' % iri.translate(_IRI_ESCAPES)
+
+def term_to_nt(term):
+    if isinstance(term, IRI):
+        return iri_to_nt(term.value)
+    lexical = '"%s"' % literal_lexical(term).translate(_NT_ESCAPES)
+    if term.language:
+        return f'{lexical}@{term.language}'
+    if term.datatype:
+        return f'{lexical}^^{iri_to_nt(term.datatype)}'
+    return lexical
+
+def triple_to_nt(subject, predicate, obj):
+    return f'{term_to_nt(subject)} {term_to_nt(predicate)} {term_to_nt(obj)} .\n'
@@ -0,0 +1,112 @@
+from flask import current_app
+from src.models.media import db
+from src.models.archive import ArchiveItem, VoiceRecording
+from src.services.streaming import STREAM_CHUNK_BYTES
+from datetime import datetime
+import fcntl
+import hashlib
+import mimetypes
+import os
+
+# Only audio/video is stored; anything else could be served back as active content
+MEDIA_TYPE_PREFIXES = ('audio/', 'video/')
+MEDIA_TYPES = ('application/ogg',)
+
+MAX_MEDIA_BYTES = 4 * 1024 ** 3
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def media_type(filename, content_type=None):
+    """Declared or guessed content type, or None if it is not an accepted media type"""
+    content_type = (content_type or mimetypes.guess_type(filename)[0] or '').split(';')[0].strip().lower()
+    if content_type.startswith(MEDIA_TYPE_PREFIXES) or content_type in MEDIA_TYPES:
+        return content_type
+    return None
+
+def media_path(asset):
+    return os.path.join(current_app.config['MEDIA_DIR'], str(asset.id))
+
+def _part_path(asset):
+    return media_path(asset) + '.part'
+
+def write_chunk(asset, stream, start, end, total=None):
+    """Write bytes [start, end) of the upload, read from stream a block at a time.
+
+    The partial file's size is the authority on what has been received, so a
+    retried chunk simply overwrites what it already wrote and a chunk that
+    would leave a gap is refused. Returns True once all total bytes are in.
+    """
+    if asset.status != 'uploading':
+        raise UploadError('Upload already complete', 409)
+    if total is not None:
+        if asset.size is not None and total != asset.size:
+            raise UploadError(f'Total size {total} does not match the declared {asset.size}')
+        if total > MAX_MEDIA_BYTES or end > total:
+            raise UploadError('Upload too large' if total > MAX_MEDIA_BYTES else 'Range ends past the total size')
+    elif end > MAX_MEDIA_BYTES:
+        raise UploadError('Upload too large')
+
+    path = _part_path(asset)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # One writer per upload across threads and worker processes
+    with os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        received = os.fstat(f.fileno()).st_size
+        if start > received:
+            raise UploadError(f'Expected the next chunk to start at byte {received}', 409)
+
+        f.seek(start)
+        position = start
+        while position < end:
+            block = stream.read(min(STREAM_CHUNK_BYTES, end - position))
+            if not block:
+                break
+            f.write(block)
+            position += len(block)
+        f.flush()
+        received = max(received, position)
+
+        asset.received = received
+        if total is not None:
+            asset.size = total
+        db.session.commit()
+        if position < end:
+            raise UploadError(f'Chunk ended at byte {position}, expected {end}')
+
+        if asset.size is None or received < asset.size:
+            return False
+        f.truncate(asset.size)
+        _complete(asset, path)
+        return True
+
+def _complete(asset, part_path):
+    digest = hashlib.sha256()
+    with open(part_path, 'rb') as f:
+        for block in iter(lambda: f.read(STREAM_CHUNK_BYTES), b''):
+            digest.update(block)
+    os.replace(part_path, media_path(asset))
+
+    asset.status = 'complete'
+    asset.sha256 = digest.hexdigest()
+    asset.completed_at = datetime.utcnow()
+    if asset.item_id:
+        item = db.session.get(ArchiveItem, asset.item_id)
+        if item:
+            item.audio_url = asset.url
+    if asset.recording_id:
+        recording = db.session.get(VoiceRecording, asset.recording_id)
+        if recording:
+            recording.audio_url = asset.url
+    db.session.commit()
+
+def delete_media(asset):
+    for path in (media_path(asset), _part_path(asset)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    db.session.delete(asset)
+    db.session.commit()
@@ -0,0 +1,99 @@
+from flask import request
+from src.models.archive import db, ArchiveItem, Annotation, ItemConnection, VoiceRecording
+from src.models.portfolio import Project
+from collections import namedtuple
+from datetime import date
+import json
+
+# Sparse fieldsets: ?fields=a,b keeps only those fields, ?exclude=a,b drops them.
+# fields[type]= / exclude[type]= target a nested or secondary type, e.g.
+# fields[annotations]=text on item detail or on an archive graph.
+# json_fields: Text columns holding JSON, with the value to use when empty
+Fieldset = namedtuple('Fieldset', 'model fields json_fields')
+
+FIELDSETS = {
+    'items': Fieldset(ArchiveItem, ('id', 'archive_id', 'title', 'code', 'description', 'location', 'content',
+                                    'image_url', 'audio_url', 'created_at', 'updated_at', 'annotation_count'), {}),
+    'annotations': Fieldset(Annotation, ('id', 'item_id', 'text', 'start_pos', 'end_pos', 'annotation_type',
+                                         'entity_uri', 'confidence', 'created_at', 'created_by'), {}),
+    'connections': Fieldset(ItemConnection, ('id', 'source_id', 'target_id', 'connection_type', 'strength',
+                                             'properties', 'created_at'), {'properties': dict}),
+    'voice_recordings': Fieldset(VoiceRecording, ('id', 'item_id', 'audio_url', 'transcript', 'duration',
+                                                  'text_start', 'text_end', 'created_at', 'created_by'), {}),
+    'projects': Fieldset(Project, ('id', 'title', 'description', 'role', 'category', 'location', 'start_date',
+                                   'end_date', 'status', 'photos_link', 'project_link', 'research_link',
+                                   'text_link', 'tags', 'skills', 'tools', 'created_at', 'updated_at',
+                                   'people_count', 'outputs_count'), {'tags': list, 'skills': list, 'tools': list}),
+}
+
+_BY_MODEL = {fieldset.model: fieldset for fieldset in FIELDSETS.values()}
+
+class ProjectionError(ValueError):
+    pass
+
+def _split(value):
+    return [name.strip() for name in value.split(',') if name.strip()] if value else []
+
+def requested_fields(name, primary=True, extra=()):
+    """Fields of type name selected by the request, in to_dict() order, or None for all.
+
+    primary: plain fields=/exclude= apply to this type. extra: names beyond the
+    columns the endpoint accepts (e.g. nested lists). 'id' is always kept.
+    """
+    fields = _split(request.args.get(f'fields[{name}]'))
+    exclude = _split(request.args.get(f'exclude[{name}]'))
+    if primary:
+        fields += _split(request.args.get('fields'))
+        exclude += _split(request.args.get('exclude'))
+    if not fields and not exclude:
+        return None
+
+    allowed = FIELDSETS[name].fields + tuple(extra)
+    unknown = sorted(set(fields + exclude) - set(allowed))
+    if unknown:
+        raise ProjectionError(f"Unknown field(s) for {name}: {', '.join(unknown)}")
+    return [field for field in allowed
+            if field == 'id' or ((not fields or field in fields) and field not in exclude)]
+
+def load_options(model, fields, required=()):
+    """Loader options reading only the columns behind fields (plus required ones).
+
+    Everything else, the full `content` text in particular, stays deferred
+    and is never read from disk. Deferred counts are undeferred when asked for.
+    """
+    if fields is None:
+        return []
+    mapper = db.inspect(model)
+    names = set(fields) | set(required)
+    columns, counts = [], []
+    for prop in mapper.column_attrs:
+        if prop.key in names:
+            attr = getattr(model, prop.key)
+            (counts if prop.deferred else columns).append(attr)
+    return [db.load_only(*columns)] + [db.undefer(attr) for attr in counts]
+
+def serialize(obj, fields, **values):
+    """obj.to_dict(**values) restricted to fields, reading only those attributes.
+
+    values overrides attributes the caller already knows (e.g. annotation_count).
+    """
+    if fields is None:
+        return obj.to_dict(**values)
+    fieldset = _BY_MODEL[type(obj)]
+    data = {}
+    for field in fields:
+        if field not in fieldset.fields:
+            continue
+        value = values[field] if values.get(field) is not None else getattr(obj, field)
+        if field in fieldset.json_fields:
+            value = json.loads(value) if value else fieldset.json_fields[field]()
+        elif isinstance(value, date):
+            value = value.isoformat()
+        data[field] = value
+    return data
+
+def project_dict(data, fields):
+    """Restrict an already serialized dict (e.g. from a cached snapshot) to fields"""
+    if fields is None:
+        return data
+    return {field: data[field] for field in fields if field in data}
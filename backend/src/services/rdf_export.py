@@ -0,0 +1,165 @@
+from src.models.archive import db, ArchiveItem, Annotation, ItemConnection
+from src.models.cache import CacheGeneration
+from src.services.graph_cache import archive_key
+from src.services.linked_data import (
+    IRI, Literal, PREFIXES, RDF_TYPE, XSD_STRING, describe_archive, describe_item,
+    describe_annotation, describe_connection, connection_shortcut, literal_lexical, term_to_nt,
+    triple_to_nt
+)
+from datetime import timezone
+import json
+import re
+
+EXPORT_FORMATS = {
+    'nt': 'application/n-triples',
+    'ttl': 'text/turtle',
+    'jsonld': 'application/ld+json',
+}
+
+# Rows read per keyset batch while streaming
+BATCH_SIZE = 500
+
+def archive_last_modified(archive):
+    """Latest write to anything exported for the archive, as an aware UTC datetime.
+
+    None when nothing exported carries a timestamp.
+
+    Includes the archive's cache generation timestamp, which also moves on deletes.
+    """
+    item_ids = db.select(ArchiveItem.id).where(ArchiveItem.archive_id == archive.id)
+    candidates = db.session.execute(db.select(
+        db.select(db.func.max(ArchiveItem.updated_at))
+          .where(ArchiveItem.archive_id == archive.id).scalar_subquery(),
+        db.select(db.func.max(ArchiveItem.created_at))
+          .where(ArchiveItem.archive_id == archive.id).scalar_subquery(),
+        db.select(db.func.max(Annotation.created_at))
+          .where(Annotation.item_id.in_(item_ids)).scalar_subquery(),
+        db.select(db.func.max(ItemConnection.created_at))
+          .where(ItemConnection.source_id.in_(item_ids)).scalar_subquery(),
+        db.select(CacheGeneration.updated_at)
+          .where(CacheGeneration.key == archive_key(archive.id)).scalar_subquery(),
+    )).one()
+
+    values = [value for value in (*candidates, archive.created_at) if value]
+    if not values:
+        return None
+    latest = max(values)
+    # HTTP dates have one-second resolution
+    return latest.replace(tzinfo=timezone.utc, microsecond=0)
+
+def _batched(statement, key):
+    """Rows of statement in key order, read in keyset batches.
+
+    Each batch is fetched completely before its rows are yielded, so no cursor
+    (and no SQLite read lock) stays open while the caller writes to a slow client.
+    """
+    last = None
+    while True:
+        batch = statement.order_by(key).limit(BATCH_SIZE)
+        if last is not None:
+            batch = batch.where(key > last)
+        rows = db.session.execute(batch).all()
+        yield from rows
+        if len(rows) < BATCH_SIZE:
+            return
+        last = rows[-1].id
+
+def iter_archive_descriptions(archive):
+    """Yield (subject, statements) for the archive and everything in it, in keyset batches"""
+    yield describe_archive(archive)
+
+    items = _batched(
+        db.select(ArchiveItem.id, ArchiveItem.archive_id, ArchiveItem.title, ArchiveItem.code,
+                  ArchiveItem.description, ArchiveItem.location, ArchiveItem.content,
+                  ArchiveItem.image_url, ArchiveItem.audio_url, ArchiveItem.created_at,
+                  ArchiveItem.updated_at)
+          .where(ArchiveItem.archive_id == archive.id),
+        ArchiveItem.id
+    )
+    for item in items:
+        yield describe_item(item)
+
+    annotations = _batched(
+        db.select(Annotation.id, Annotation.item_id, Annotation.text, Annotation.start_pos,
+                  Annotation.end_pos, Annotation.annotation_type, Annotation.entity_uri,
+                  Annotation.confidence, Annotation.created_by)
+          .join(ArchiveItem, Annotation.item_id == ArchiveItem.id)
+          .where(ArchiveItem.archive_id == archive.id),
+        Annotation.id
+    )
+    for annotation in annotations:
+        yield describe_annotation(annotation)
+
+    connections = _batched(
+        db.select(ItemConnection.id, ItemConnection.source_id, ItemConnection.target_id,
+                  ItemConnection.connection_type, ItemConnection.strength)
+          .join(ArchiveItem, ItemConnection.source_id == ArchiveItem.id)
+          .where(ArchiveItem.archive_id == archive.id),
+        ItemConnection.id
+    )
+    for connection in connections:
+        yield describe_connection(connection)
+        subject, predicate, obj = connection_shortcut(connection)
+        yield subject, [(predicate, obj)]
+
+# Serializers
+def serialize_ntriples(descriptions):
+    for subject, statements in descriptions:
+        yield ''.join(triple_to_nt(subject, predicate, obj) for predicate, obj in statements)
+
+_PNAME_LOCAL = re.compile(r'[A-Za-z_][\w\-]*$')
+
+def _compact(iri):
+    """Prefixed name for an IRI when one of the known prefixes covers it"""
+    for prefix, namespace in PREFIXES.items():
+        if iri.startswith(namespace) and _PNAME_LOCAL.match(iri[len(namespace):]):
+            return f'{prefix}:{iri[len(namespace):]}'
+    return None
+
+def _turtle_term(term):
+    if isinstance(term, IRI):
+        return _compact(term.value) or term_to_nt(term)
+    if term.datatype and not term.language:
+        datatype = _compact(term.datatype)
+        if datatype:
+            return term_to_nt(Literal(term.value)) + '^^' + datatype
+    return term_to_nt(term)
+
+def serialize_turtle(descriptions):
+    yield ''.join(f'@prefix {prefix}: <{namespace}> .\n' for prefix, namespace in PREFIXES.items())
+    for subject, statements in descriptions:
+        predicates = ' ;\n    '.join(
+            f"{'a' if predicate == RDF_TYPE else _turtle_term(predicate)} {_turtle_term(obj)}"
+            for predicate, obj in statements
+        )
+        yield f'\n{_turtle_term(subject)} {predicates} .\n'
+
+def _jsonld_value(term):
+    if isinstance(term, IRI):
+        return {'@id': term.value}
+    if term.language:
+        return {'@value': term.value, '@language': term.language}
+    if term.datatype and term.datatype != XSD_STRING:
+        return {'@value': literal_lexical(term), '@type': term.datatype}
+    return term.value
+
+def serialize_jsonld(descriptions):
+    yield '{"@context": %s,\n"@graph": [' % json.dumps(PREFIXES)
+    separator = '\n'
+    for subject, statements in descriptions:
+        node = {'@id': subject.value}
+        for predicate, obj in statements:
+            if predicate == RDF_TYPE:
+                node.setdefault('@type', []).append(_compact(obj.value) or obj.value)
+            else:
+                key = _compact(predicate.value) or predicate.value
+                node.setdefault(key, []).append(_jsonld_value(obj))
+        yield separator + json.dumps(node, ensure_ascii=False)
+        separator = ',\n'
+    yield '\n]}\n'
+
+SERIALIZERS = {
+    'nt': serialize_ntriples,
+    'ttl': serialize_turtle,
+    'jsonld': serialize_jsonld,
+}
@@ -0,0 +1,179 @@
+from sqlalchemy import text
+import html
+import re
+
+# External-content FTS5 tables mirror archive_items/annotations; the triggers
+# keep them in sync for every insert, update and delete, including bulk Core
+# statements that never go through the ORM.
+SEARCH_INDEX_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS archive_items_fts USING fts5(
+        title, description, content,
+        content='archive_items', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS archive_items_fts_ai AFTER INSERT ON archive_items BEGIN
+        INSERT INTO archive_items_fts(rowid, title, description, content)
+        VALUES (new.id, new.title, new.description, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS archive_items_fts_ad AFTER DELETE ON archive_items BEGIN
+        INSERT INTO archive_items_fts(archive_items_fts, rowid, title, description, content)
+        VALUES ('delete', old.id, old.title, old.description, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS archive_items_fts_au AFTER UPDATE OF title, description, content ON archive_items BEGIN
+        INSERT INTO archive_items_fts(archive_items_fts, rowid, title, description, content)
+        VALUES ('delete', old.id, old.title, old.description, old.content);
+        INSERT INTO archive_items_fts(rowid, title, description, content)
+        VALUES (new.id, new.title, new.description, new.content);
+    END
+    """,
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS annotations_fts USING fts5(
+        text,
+        content='annotations', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS annotations_fts_ai AFTER INSERT ON annotations BEGIN
+        INSERT INTO annotations_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS annotations_fts_ad AFTER DELETE ON annotations BEGIN
+        INSERT INTO annotations_fts(annotations_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS annotations_fts_au AFTER UPDATE OF text ON annotations BEGIN
+        INSERT INTO annotations_fts(annotations_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO annotations_fts(rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+]
+
+# Column weights for bm25(): title matches count most, then description
+ITEM_WEIGHTS = (10.0, 4.0, 1.0)
+
+# bm25 is scaled by (1 + CENTRALITY_BOOST * centrality), so central items rank higher among comparable matches
+CENTRALITY_BOOST = 0.5
+
+# snippet() wraps matches in control characters that cannot occur in HTML,
+# so the raw text can be escaped before they are turned into <mark> tags
+SNIPPET_OPEN = '\x02'
+SNIPPET_CLOSE = '\x03'
+SNIPPET_ELLIPSIS = '…'
+
+def render_snippet(snippet):
+    """HTML-escape an FTS snippet and mark its matches with <mark> tags"""
+    if snippet is None:
+        return None
+    return html.escape(snippet).replace(SNIPPET_OPEN, '<mark>').replace(SNIPPET_CLOSE, '</mark>')
+
+def create_search_index(engine):
+    """Create the FTS5 tables and triggers, backfilling them on first run"""
+    with engine.begin() as conn:
+        existing = conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND name IN ('archive_items_fts', 'annotations_fts')"
+        )).scalars().all()
+
+        for statement in SEARCH_INDEX_DDL:
+            conn.execute(text(statement))
+
+        # Tables created just now start empty; index the rows already stored
+        if 'archive_items_fts' not in existing:
+            conn.execute(text("INSERT INTO archive_items_fts(archive_items_fts) VALUES ('rebuild')"))
+        if 'annotations_fts' not in existing:
+            conn.execute(text("INSERT INTO annotations_fts(annotations_fts) VALUES ('rebuild')"))
+
+def rebuild_search_index(engine):
+    """Rebuild both FTS5 tables from their content tables"""
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO archive_items_fts(archive_items_fts) VALUES ('rebuild')"))
+        conn.execute(text("INSERT INTO annotations_fts(annotations_fts) VALUES ('rebuild')"))
+
+def build_match_query(query):
+    """Turn free text into an FTS5 MATCH expression (AND of terms, last one as prefix)"""
+    terms = re.findall(r'\w+', query, re.UNICODE)
+    if not terms:
+        return None
+
+    # Quote every term so user input can never be parsed as FTS5 syntax
+    quoted = ['"%s"' % term.replace('"', '""') for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+def search_items(session, match, archive_id=None, limit=20, offset=0):
+    """Return (rows, total) of ranked item hits: rows are (id, score, snippet), boosted by item centrality"""
+    filters = ''
+    params = {'match': match, 'limit': limit, 'offset': offset}
+    if archive_id is not None:
+        filters = 'AND ai.archive_id = :archive_id'
+        params['archive_id'] = archive_id
+
+    rank = 'bm25(archive_items_fts, %s, %s, %s)' % ITEM_WEIGHTS
+    rows = session.execute(text(f"""
+        SELECT ai.id,
+               {rank} * (1 + :boost * COALESCE(s.centrality, 0)) AS score,
+               snippet(archive_items_fts, -1, :open, :close, :ellipsis, 16) AS snippet
+        FROM archive_items_fts
+        JOIN archive_items ai ON ai.id = archive_items_fts.rowid
+        LEFT JOIN item_scores s ON s.item_id = ai.id
+        WHERE archive_items_fts MATCH :match {filters}
+        ORDER BY score
+        LIMIT :limit OFFSET :offset
+    """), dict(params, open=SNIPPET_OPEN, close=SNIPPET_CLOSE, ellipsis=SNIPPET_ELLIPSIS,
+                  boost=CENTRALITY_BOOST)).all()
+
+    total = session.execute(text(f"""
+        SELECT count(*)
+        FROM archive_items_fts
+        JOIN archive_items ai ON ai.id = archive_items_fts.rowid
+        WHERE archive_items_fts MATCH :match {filters}
+    """), params).scalar()
+
+    return rows, total
+
+def search_annotations(session, match, archive_id=None, annotation_type=None, limit=20, offset=0):
+    """Return (rows, total) of ranked annotation hits: rows are (id, score, snippet)"""
+    joins = ''
+    filters = ''
+    params = {'match': match, 'limit': limit, 'offset': offset}
+    if archive_id is not None:
+        joins = 'JOIN archive_items ai ON ai.id = a.item_id'
+        filters += ' AND ai.archive_id = :archive_id'
+        params['archive_id'] = archive_id
+    if annotation_type:
+        filters += ' AND a.annotation_type = :annotation_type'
+        params['annotation_type'] = annotation_type
+
+    rows = session.execute(text(f"""
+        SELECT a.id,
+               bm25(annotations_fts) * (1 + :boost * COALESCE(s.centrality, 0)) AS score,
+               snippet(annotations_fts, 0, :open, :close, :ellipsis, 24) AS snippet
+        FROM annotations_fts
+        JOIN annotations a ON a.id = annotations_fts.rowid
+        LEFT JOIN item_scores s ON s.item_id = a.item_id
+        {joins}
+        WHERE annotations_fts MATCH :match {filters}
+        ORDER BY score
+        LIMIT :limit OFFSET :offset
+    """), dict(params, open=SNIPPET_OPEN, close=SNIPPET_CLOSE, ellipsis=SNIPPET_ELLIPSIS,
+                  boost=CENTRALITY_BOOST)).all()
+
+    total = session.execute(text(f"""
+        SELECT count(*)
+        FROM annotations_fts
+        JOIN annotations a ON a.id = annotations_fts.rowid
+        {joins}
+        WHERE annotations_fts MATCH :match {filters}
+    """), params).scalar()
+
+    return rows, total
@@ -0,0 +1,112 @@
+from src.models.user import db
+from src.services.projection import FIELDSETS
+from functools import lru_cache
+import json
+
+try:
+    import orjson
+except ImportError:  # Optional: the stdlib parser gives the same values
+    orjson = None
+
+_json_loads = orjson.loads if orjson else json.loads
+
+# Ids per IN (...) query: well under SQLite's bound parameter limit
+IN_BATCH_SIZE = 500
+
+class RowSerializer:
+    """Serializes plain result rows of one model into its to_dict() shape.
+
+    The column list and the per-column conversions (ISO dates, JSON text
+    columns) are worked out once per model and fieldset; each row is then a
+    zip() plus a few conversions. Rows come from a Core select() of the
+    columns, so no ORM instance, identity map entry or attribute
+    instrumentation is involved.
+
+    required: extra columns selected after the fields (e.g. for a keyset
+    cursor), readable on the row by name but left out of the output.
+    """
+
+    def __init__(self, name, fields=None, required=(), dialect=None):
+        fieldset = FIELDSETS[name]
+        mapper = db.inspect(fieldset.model)
+        self.model = fieldset.model
+        self.fields = tuple(fields or fieldset.fields)
+
+        self.columns = []
+        self.converters = []
+        for field in self.fields + tuple(name for name in required if name not in self.fields):
+            column = mapper.column_attrs[field].columns[0]
+            if field not in self.fields:
+                self.columns.append(column.label(field))
+                continue
+            if field in fieldset.json_fields:
+                self.converters.append((field, _json_loads, fieldset.json_fields[field]))
+            elif isinstance(column.type, (db.DateTime, db.Date)):
+                if dialect == 'sqlite':
+                    # SQLite keeps dates as ISO text already: skip parsing them into
+                    # objects only to format them back
+                    if isinstance(column.type, db.DateTime):
+                        self.converters.append((field, _sqlite_isoformat, _none))
+                    column = db.type_coerce(column, db.String)
+                else:
+                    self.converters.append((field, _isoformat, _none))
+            self.columns.append(column.label(field))
+
+    def select(self):
+        return db.select(*self.columns)
+
+    def __call__(self, row):
+        data = dict(zip(self.fields, row))
+        for field, convert, empty in self.converters:
+            value = data[field]
+            data[field] = convert(value) if value else empty()
+        return data
+
+def _none():
+    return None
+
+def _isoformat(value):
+    return value.isoformat()
+
+def _sqlite_isoformat(value):
+    # 'YYYY-MM-DD HH:MM:SS.ffffff' as stored by SQLAlchemy, to datetime.isoformat()
+    value = value.replace(' ', 'T', 1)
+    return value[:-7] if value.endswith('.000000') else value
+
+@lru_cache(maxsize=128)
+def _compiled(dialect, name, fields, required):
+    return RowSerializer(name, fields, required, dialect)
+
+def row_serializer(name, fields=None, required=()):
+    """Compiled serializer for a model's fieldset (fields/required as tuples)"""
+    return _compiled(db.engine.dialect.name, name, fields, required)
+
+def serialize_rows(serializer, statement, yield_per=None):
+    """Execute statement and serialize its rows; streams in batches with yield_per"""
+    if not yield_per:
+        return map(serializer, db.session.execute(statement).all())
+    result = db.session.execute(statement.execution_options(yield_per=yield_per))
+    return (serializer(row) for rows in result.partitions() for row in rows)
+
+def serialize_in_rows(serializer, column, values, order_by=None, limit_per_value=None):
+    """(data, row) for the rows whose column is in values, with one IN query per batch.
+
+    The raw row gives access to required columns left out of the output.
+    limit_per_value keeps only the first rows (in order_by order) of each value,
+    ranked with a window function so it stays one query per batch.
+    """
+    values = list(values)
+    for i in range(0, len(values), IN_BATCH_SIZE):
+        statement = serializer.select().where(column.in_(values[i:i + IN_BATCH_SIZE]))
+        if limit_per_value is not None:
+            rank = db.func.row_number().over(partition_by=column, order_by=order_by).label('_rank')
+            ranked = statement.add_columns(rank).subquery()
+            statement = db.select(*ranked.c).where(ranked.c['_rank'] <= limit_per_value).order_by(ranked.c['_rank'])
+        elif order_by is not None:
+            statement = statement.order_by(order_by)
+        for row in db.session.execute(statement).all():
+            yield serializer(row), row
+
+def serialize_in(serializer, column, values, order_by=None):
+    """Serialize the rows whose column is in values, with one IN query per batch"""
+    return [data for data, row in serialize_in_rows(serializer, column, values, order_by)]
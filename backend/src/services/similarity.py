@@ -0,0 +1,249 @@
+from sqlalchemy import text
+from src.models.archive import db, ArchiveItem, Annotation, ItemConnection, ItemSignature, ConnectionSuggestion
+from datetime import datetime
+import json
+import numpy as np
+import re
+import time
+import zlib
+
+# MinHash over (a * x + b) mod p with fixed coefficients, so signatures are comparable across runs
+MERSENNE_PRIME = (1 << 31) - 1
+CONTENT_PERMUTATIONS = 128
+ANNOTATION_PERMUTATIONS = 64
+SHINGLE_WORDS = 3
+
+_rng = np.random.default_rng(20240611)
+_COEFFICIENTS = _rng.integers(1, MERSENNE_PRIME, size=(2, CONTENT_PERMUTATIONS + ANNOTATION_PERMUTATIONS),
+                              dtype=np.uint64)
+
+EMPTY = np.uint32(0xFFFFFFFF)
+
+# LSH banding: (bands, rows per band). With r rows a pair shares a bucket with
+# probability 1 - (1 - s^r)^b; 32x4 puts the 50% point near s = 0.4.
+CONTENT_BANDS = (32, 4)
+ANNOTATION_BANDS = (16, 4)
+
+# Buckets bigger than this are boilerplate (e.g. empty descriptions) and are skipped
+MAX_BUCKET = 200
+
+MIN_SIMILARITY = 0.3
+
+SIGNATURE_BATCH = 500
+
+_WORD_RE = re.compile(r'\w+')
+
+def _hash(value):
+    return zlib.crc32(value.encode('utf-8')) % MERSENNE_PRIME
+
+def text_shingles(*parts):
+    """Hashed word n-grams of the given text fields"""
+    words = _WORD_RE.findall(' '.join(part for part in parts if part).lower())
+    if len(words) < SHINGLE_WORDS:
+        return {_hash(word) for word in words}
+    return {_hash(' '.join(words[i:i + SHINGLE_WORDS])) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+def minhash(hashes, offset, size):
+    """MinHash signature (uint32 array) of a set of hashes; all EMPTY for an empty set"""
+    if not hashes:
+        return np.full(size, EMPTY, dtype=np.uint32)
+    values = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+    a = _COEFFICIENTS[0, offset:offset + size, None]
+    b = _COEFFICIENTS[1, offset:offset + size, None]
+    return ((a * values[None, :] + b) % MERSENNE_PRIME).min(axis=1).astype(np.uint32)
+
+# Signatures
+def _annotation_states(item_ids=None):
+    """{item_id: "<count>:<max id>"}, which changes whenever annotations are added or removed"""
+    query = db.select(Annotation.item_id, db.func.count(), db.func.max(Annotation.id)).group_by(Annotation.item_id)
+    if item_ids is not None:
+        query = query.where(Annotation.item_id.in_(item_ids))
+    return {item_id: f'{count}:{max_id}' for item_id, count, max_id in db.session.execute(query)}
+
+def stale_item_ids():
+    """Items without a signature, or edited / re-annotated since it was computed"""
+    states = _annotation_states()
+    rows = db.session.execute(
+        db.select(ArchiveItem.id, ArchiveItem.updated_at, ItemSignature.item_updated_at, ItemSignature.annotation_state)
+          .outerjoin(ItemSignature, ItemSignature.item_id == ArchiveItem.id)
+    )
+    return [row.id for row in rows
+            if row.annotation_state is None
+            or row.item_updated_at != row.updated_at
+            or row.annotation_state != states.get(row.id, '0:None')]
+
+def refresh_signatures(item_ids=None):
+    """Recompute the signatures of the given items (default: the stale ones); returns how many"""
+    if item_ids is None:
+        item_ids = stale_item_ids()
+    item_ids = list(item_ids)
+
+    now = datetime.utcnow()
+    for start in range(0, len(item_ids), SIGNATURE_BATCH):
+        batch = item_ids[start:start + SIGNATURE_BATCH]
+        concepts = {}
+        concept = db.func.coalesce(Annotation.entity_uri, db.func.lower(Annotation.text))
+        for item_id, key in db.session.execute(
+                db.select(Annotation.item_id, Annotation.annotation_type + ':' + concept)
+                  .where(Annotation.item_id.in_(batch))):
+            concepts.setdefault(item_id, set()).add(_hash(key))
+        states = _annotation_states(batch)
+
+        rows = []
+        for item in db.session.execute(
+                db.select(ArchiveItem.id, ArchiveItem.title, ArchiveItem.description, ArchiveItem.content,
+                          ArchiveItem.updated_at).where(ArchiveItem.id.in_(batch))):
+            rows.append({
+                'item_id': item.id,
+                'content_signature': minhash(text_shingles(item.title, item.description, item.content),
+                                             0, CONTENT_PERMUTATIONS).tobytes(),
+                'annotation_signature': minhash(concepts.get(item.id, set()),
+                                                CONTENT_PERMUTATIONS, ANNOTATION_PERMUTATIONS).tobytes(),
+                'item_updated_at': item.updated_at,
+                'annotation_state': states.get(item.id, '0:None'),
+                'computed_at': now,
+            })
+        if rows:
+            db.session.execute(text(
+                "INSERT INTO item_signatures (item_id, content_signature, annotation_signature, "
+                "item_updated_at, annotation_state, computed_at) "
+                "VALUES (:item_id, :content_signature, :annotation_signature, "
+                ":item_updated_at, :annotation_state, :computed_at) "
+                "ON CONFLICT(item_id) DO UPDATE SET content_signature = excluded.content_signature, "
+                "annotation_signature = excluded.annotation_signature, item_updated_at = excluded.item_updated_at, "
+                "annotation_state = excluded.annotation_state, computed_at = excluded.computed_at"
+            ), rows)
+    db.session.commit()
+    return len(item_ids)
+
+# Candidate generation
+def _band_candidates(signatures, bands, rows):
+    """Index pairs (i < j) sharing at least one LSH bucket"""
+    present = np.flatnonzero((signatures != EMPTY).any(axis=1))
+    pairs = set()
+    for band in range(bands):
+        block = signatures[present, band * rows:(band + 1) * rows].astype(np.uint64)
+        keys = np.zeros(len(present), dtype=np.uint64)
+        for column in block.T:
+            keys = keys * np.uint64(1000003) ^ column
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        boundaries = np.flatnonzero(np.diff(sorted_keys)) + 1
+        for group in np.split(order, boundaries):
+            if 1 < len(group) <= MAX_BUCKET:
+                members = np.sort(present[group]).tolist()
+                for i, first in enumerate(members):
+                    for second in members[i + 1:]:
+                        pairs.add((first, second))
+    return pairs
+
+def _similarities(signatures, firsts, seconds):
+    """Estimated Jaccard similarity of each (first, second) pair; 0 when either set is empty"""
+    a, b = signatures[firsts], signatures[seconds]
+    similarity = (a == b).mean(axis=1)
+    similarity[(a == EMPTY).all(axis=1) | (b == EMPTY).all(axis=1)] = 0.0
+    return similarity
+
+def generate_suggestions(min_similarity=MIN_SIMILARITY):
+    """Refresh stale signatures, then propose connections for similar, unconnected item pairs"""
+    started = time.perf_counter()
+    refreshed = refresh_signatures()
+
+    rows = db.session.execute(db.select(
+        ItemSignature.item_id, ItemSignature.content_signature, ItemSignature.annotation_signature
+    ).join(ArchiveItem, ArchiveItem.id == ItemSignature.item_id).order_by(ItemSignature.item_id)).all()
+    if len(rows) < 2:
+        return {'items': len(rows), 'signatures_refreshed': refreshed, 'candidates': 0, 'suggested': 0,
+                'elapsed_seconds': round(time.perf_counter() - started, 3)}
+
+    item_ids = [row.item_id for row in rows]
+    content = np.frombuffer(b''.join(row.content_signature for row in rows), dtype=np.uint32)\
+                .reshape(len(rows), CONTENT_PERMUTATIONS)
+    annotations = np.frombuffer(b''.join(row.annotation_signature for row in rows), dtype=np.uint32)\
+                    .reshape(len(rows), ANNOTATION_PERMUTATIONS)
+
+    candidates = _band_candidates(content, *CONTENT_BANDS) | _band_candidates(annotations, *ANNOTATION_BANDS)
+
+    # Pairs that are already connected (either way) or were already reviewed/proposed
+    existing = set()
+    for source_id, target_id in db.session.execute(db.select(ItemConnection.source_id, ItemConnection.target_id)):
+        existing.add((min(source_id, target_id), max(source_id, target_id)))
+    existing.update(tuple(row) for row in db.session.execute(
+        db.select(ConnectionSuggestion.source_id, ConnectionSuggestion.target_id)))
+
+    pairs = np.array([pair for pair in candidates if (item_ids[pair[0]], item_ids[pair[1]]) not in existing],
+                     dtype=np.int64).reshape(-1, 2)
+    content_similarity = _similarities(content, pairs[:, 0], pairs[:, 1])
+    annotation_similarity = _similarities(annotations, pairs[:, 0], pairs[:, 1])
+    strength = np.maximum(content_similarity, annotation_similarity)
+
+    now = datetime.utcnow()
+    suggestions = []
+    for i in np.flatnonzero(strength >= min_similarity).tolist():
+        suggestions.append({
+            'source_id': item_ids[pairs[i, 0]],
+            'target_id': item_ids[pairs[i, 1]],
+            # Shared entities make a semantic link, shared wording a thematic one
+            'connection_type': 'semantic' if annotation_similarity[i] >= content_similarity[i] else 'thematic',
+            'strength': round(float(strength[i]), 3),
+            'content_similarity': round(float(content_similarity[i]), 3),
+            'annotation_similarity': round(float(annotation_similarity[i]), 3),
+            'status': 'pending',
+            'created_at': now,
+        })
+
+    if suggestions:
+        db.session.execute(db.insert(ConnectionSuggestion), suggestions)
+        db.session.commit()
+
+    return {
+        'items': len(item_ids),
+        'signatures_refreshed': refreshed,
+        'candidates': len(candidates),
+        'suggested': len(suggestions),
+        'elapsed_seconds': round(time.perf_counter() - started, 3)
+    }
+
+# Review
+def accept_suggestions(suggestions):
+    """Turn pending suggestions into ItemConnections; returns how many were accepted"""
+    pending = [suggestion for suggestion in suggestions if suggestion.status == 'pending']
+    if not pending:
+        return 0
+
+    now = datetime.utcnow()
+    created = []
+    for suggestion in pending:
+        connection = ItemConnection(
+            source_id=suggestion.source_id,
+            target_id=suggestion.target_id,
+            connection_type=suggestion.connection_type,
+            strength=suggestion.strength,
+            properties=json.dumps({
+                'suggestion_id': suggestion.id,
+                'content_similarity': suggestion.content_similarity,
+                'annotation_similarity': suggestion.annotation_similarity
+            })
+        )
+        db.session.add(connection)
+        created.append((suggestion, connection))
+    db.session.flush()
+
+    for suggestion, connection in created:
+        suggestion.status = 'accepted'
+        suggestion.connection_id = connection.id
+        suggestion.reviewed_at = now
+    db.session.commit()
+    return len(created)
+
+def reject_suggestions(suggestions):
+    """Mark pending suggestions rejected so they are not proposed again"""
+    now = datetime.utcnow()
+    rejected = 0
+    for suggestion in suggestions:
+        if suggestion.status == 'pending':
+            suggestion.status = 'rejected'
+            suggestion.reviewed_at = now
+            rejected += 1
+    db.session.commit()
+    return rejected
@@ -0,0 +1,761 @@
+from src.models.archive import db, Archive, ArchiveItem, Annotation, ItemConnection
+from src.services.graph_cache import archives_generation
+from src.services.linked_data import (
+    IRI, Literal, PREFIXES, RDF_TYPE, NUMERIC_TYPES, XSD_BOOLEAN, XSD_DECIMAL, XSD_DOUBLE,
+    XSD_INTEGER, XSD_STRING, describe_archive, describe_item, describe_annotation,
+    describe_connection, connection_shortcut, literal_lexical
+)
+from collections import Counter, namedtuple
+from functools import lru_cache
+from itertools import islice
+from re import _parser as sre_parse
+import json
+import re
+import threading
+import time
+
+class SparqlError(ValueError):
+    """Raised for queries outside the supported SPARQL subset"""
+
+Var = namedtuple('Var', ['name'])
+
+SparqlQuery = namedtuple('SparqlQuery', ['variables', 'distinct', 'patterns', 'filters', 'limit', 'offset'])
+
+# Triple store
+class TripleStore:
+    """In-memory triples with SPO, POS and OSP permutation indexes"""
+
+    def __init__(self):
+        self.spo = {}
+        self.pos = {}
+        self.osp = {}
+        self.size = 0
+        self._subject_counts = Counter()
+        self._predicate_counts = Counter()
+        self._object_counts = Counter()
+        self._predicate_subjects = Counter()
+
+    def add(self, s, p, o):
+        objects = self.spo.setdefault(s, {}).setdefault(p, set())
+        if o in objects:
+            return
+        if not objects:
+            self._predicate_subjects[p] += 1
+        objects.add(o)
+        self.pos.setdefault(p, {}).setdefault(o, set()).add(s)
+        self.osp.setdefault(o, {}).setdefault(s, set()).add(p)
+        self._subject_counts[s] += 1
+        self._predicate_counts[p] += 1
+        self._object_counts[o] += 1
+        self.size += 1
+
+    def add_description(self, description):
+        subject, statements = description
+        for predicate, obj in statements:
+            self.add(subject, predicate, obj)
+
+    def count(self, s=None, p=None, o=None):
+        """Exact number of triples matching a pattern (None = wildcard)"""
+        if s is not None and p is not None and o is not None:
+            return int(o in self.spo.get(s, {}).get(p, ()))
+        if s is not None and p is not None:
+            return len(self.spo.get(s, {}).get(p, ()))
+        if p is not None and o is not None:
+            return len(self.pos.get(p, {}).get(o, ()))
+        if s is not None and o is not None:
+            return len(self.osp.get(o, {}).get(s, ()))
+        if s is not None:
+            return self._subject_counts[s]
+        if p is not None:
+            return self._predicate_counts[p]
+        if o is not None:
+            return self._object_counts[o]
+        return self.size
+
+    def estimate(self, s, p, o, s_bound=False, o_bound=False):
+        """Expected matches when unknown s/o will be bound by earlier joins"""
+        estimate = self.count(s, p, o)
+        if s is None and s_bound:
+            estimate /= max(self._predicate_subjects[p] if p is not None else len(self.spo), 1)
+        if o is None and o_bound:
+            estimate /= max(len(self.pos.get(p, ())) if p is not None else len(self.osp), 1)
+        return estimate
+
+    def triples(self, s=None, p=None, o=None):
+        """Yield the (s, p, o) triples matching a pattern through the best index"""
+        if s is not None:
+            predicates = self.spo.get(s, {})
+            if p is not None:
+                objects = predicates.get(p, ())
+                if o is not None:
+                    if o in objects:
+                        yield s, p, o
+                    return
+                for obj in objects:
+                    yield s, p, obj
+            elif o is not None:
+                for pred in self.osp.get(o, {}).get(s, ()):
+                    yield s, pred, o
+            else:
+                for pred, objects in predicates.items():
+                    for obj in objects:
+                        yield s, pred, obj
+        elif p is not None:
+            by_object = self.pos.get(p, {})
+            if o is not None:
+                for subj in by_object.get(o, ()):
+                    yield subj, p, o
+            else:
+                for obj, subjects in by_object.items():
+                    for subj in subjects:
+                        yield subj, p, obj
+        elif o is not None:
+            for subj, predicates in self.osp.get(o, {}).items():
+                for pred in predicates:
+                    yield subj, pred, o
+        else:
+            for subj, predicates in self.spo.items():
+                for pred, objects in predicates.items():
+                    for obj in objects:
+                        yield subj, pred, obj
+
+def build_triple_store():
+    """Derive the triple store from archives, items, annotations and connections"""
+    store = TripleStore()
+    session = db.session
+
+    for archive in session.execute(db.select(
+            Archive.id, Archive.name, Archive.slug, Archive.description, Archive.created_at)):
+        store.add_description(describe_archive(archive))
+
+    # Item content stays out of the store: it is large and served by /search
+    item_columns = [ArchiveItem.id, ArchiveItem.archive_id, ArchiveItem.title, ArchiveItem.code,
+                    ArchiveItem.description, ArchiveItem.location, ArchiveItem.image_url,
+                    ArchiveItem.audio_url, ArchiveItem.created_at, ArchiveItem.updated_at]
+    for item in session.execute(db.select(*item_columns).execution_options(yield_per=2000)):
+        store.add_description(describe_item(item, include_content=False))
+
+    annotation_columns = [Annotation.id, Annotation.item_id, Annotation.text, Annotation.start_pos,
+                          Annotation.end_pos, Annotation.annotation_type, Annotation.entity_uri,
+                          Annotation.confidence, Annotation.created_by]
+    for annotation in session.execute(db.select(*annotation_columns).execution_options(yield_per=2000)):
+        store.add_description(describe_annotation(annotation))
+
+    connection_columns = [ItemConnection.id, ItemConnection.source_id, ItemConnection.target_id,
+                          ItemConnection.connection_type, ItemConnection.strength]
+    for connection in session.execute(db.select(*connection_columns)):
+        store.add_description(describe_connection(connection))
+        store.add(*connection_shortcut(connection))
+
+    return store
+
+_store_lock = threading.Lock()
+_store = None
+_store_generation = None
+
+def get_triple_store():
+    """Process-wide triple store, rebuilt when any archive has been written to"""
+    global _store, _store_generation
+    generation = archives_generation()
+    with _store_lock:
+        if _store is None or _store_generation != generation:
+            _store = build_triple_store()
+            _store_generation = generation
+        return _store
+
+# Parser
+TOKEN_RE = re.compile(r'''
+    (?P<ws>\s+|\#[^\n]*)
+  | (?P<iri><[^<>"{}|^`\\\s]*>)
+  | (?P<var>[?$][A-Za-z_]\w*)
+  | (?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+  | (?P<langtag>@[A-Za-z]+(?:-[A-Za-z0-9]+)*)
+  | (?P<number>[+-]?(?:\d+\.\d+|\.\d+|\d+)(?:[eE][+-]?\d+)?)
+  | (?P<pname>(?:[A-Za-z][\w\-]*)?:(?:[\w\-]+(?:\.[\w\-]+)*)?)
+  | (?P<op>\^\^|&&|\|\||!=|<=|>=|[{}().,;*!=<>])
+  | (?P<word>[A-Za-z_]\w*)
+''', re.VERBOSE)
+
+_STRING_ESCAPES = {'t': '\t', 'n': '\n', 'r': '\r', 'b': '\b', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+
+# Function name -> (min, max) number of arguments
+FUNCTIONS = {
+    'REGEX': (2, 3), 'CONTAINS': (2, 2), 'STRSTARTS': (2, 2), 'STRENDS': (2, 2),
+    'LCASE': (1, 1), 'UCASE': (1, 1), 'STR': (1, 1), 'LANG': (1, 1), 'DATATYPE': (1, 1),
+    'BOUND': (1, 1), 'ISIRI': (1, 1), 'ISURI': (1, 1), 'ISLITERAL': (1, 1), 'STRLEN': (1, 1),
+}
+
+# Evaluation runs in-process, so every query gets a time and result budget
+EVAL_TIMEOUT = 10.0
+MAX_SOLUTIONS = 10000
+
+# REGEX patterns are user input run by a backtracking engine; see _check_regex
+MAX_REGEX_LENGTH = 256
+
+def tokenize(query):
+    tokens = []
+    pos = 0
+    while pos < len(query):
+        match = TOKEN_RE.match(query, pos)
+        if not match:
+            raise SparqlError(f'Unexpected character at offset {pos}: {query[pos:pos + 20]!r}')
+        pos = match.end()
+        kind = match.lastgroup
+        if kind != 'ws':
+            tokens.append((kind, match.group()))
+    return tokens
+
+class _Parser:
+    def __init__(self, query):
+        self.tokens = tokenize(query)
+        self.pos = 0
+        self.prefixes = dict(PREFIXES)
+        self.base = ''
+
+    def peek(self, offset=0):
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def next(self):
+        token = self.peek()
+        if token[0] is None:
+            raise SparqlError('Unexpected end of query')
+        self.pos += 1
+        return token
+
+    def accept_word(self, *words):
+        kind, value = self.peek()
+        if kind == 'word' and value.upper() in words:
+            self.pos += 1
+            return value.upper()
+        return None
+
+    def accept_op(self, op):
+        if self.peek() == ('op', op):
+            self.pos += 1
+            return True
+        return False
+
+    def expect_op(self, op):
+        if not self.accept_op(op):
+            raise SparqlError(f"Expected '{op}' but found {self.peek()[1]!r}")
+
+    def parse(self):
+        # Prologue
+        while True:
+            if self.accept_word('PREFIX'):
+                kind, name = self.next()
+                if kind != 'pname' or not name.endswith(':'):
+                    raise SparqlError(f'Invalid prefix declaration {name!r}')
+                self.prefixes[name[:-1]] = self.parse_iri_token()
+            elif self.accept_word('BASE'):
+                self.base = self.parse_iri_token()
+            else:
+                break
+
+        if not self.accept_word('SELECT'):
+            raise SparqlError('Only SELECT queries are supported')
+        distinct = bool(self.accept_word('DISTINCT', 'REDUCED'))
+
+        variables = []
+        if self.accept_op('*'):
+            variables = None
+        else:
+            while self.peek()[0] == 'var':
+                variables.append(self.next()[1][1:])
+            if not variables:
+                raise SparqlError('SELECT needs variables or *')
+
+        self.accept_word('WHERE')
+        patterns, filters = self.parse_group()
+
+        limit = offset = None
+        while True:
+            if self.accept_word('LIMIT'):
+                limit = self.parse_integer()
+            elif self.accept_word('OFFSET'):
+                offset = self.parse_integer()
+            elif self.accept_word('ORDER', 'GROUP'):
+                raise SparqlError('ORDER BY and GROUP BY are not supported')
+            else:
+                break
+
+        if self.peek()[0] is not None:
+            raise SparqlError(f'Unexpected {self.peek()[1]!r} after query')
+
+        return SparqlQuery(variables, distinct, patterns, filters, limit, offset or 0)
+
+    def parse_integer(self):
+        kind, value = self.next()
+        if kind != 'number' or not value.isdigit():
+            raise SparqlError(f'Expected a non-negative integer, found {value!r}')
+        return int(value)
+
+    def parse_iri_token(self):
+        kind, value = self.next()
+        if kind != 'iri':
+            raise SparqlError(f'Expected an IRI, found {value!r}')
+        iri = value[1:-1]
+        if self.base and ':' not in iri:
+            iri = self.base + iri
+        return iri
+
+    def parse_group(self):
+        self.expect_op('{')
+        patterns = []
+        filters = []
+        while not self.accept_op('}'):
+            if self.accept_word('FILTER'):
+                filters.append(self.parse_filter())
+            elif self.accept_word('OPTIONAL', 'UNION', 'MINUS', 'GRAPH', 'BIND', 'VALUES', 'SERVICE'):
+                raise SparqlError('Only basic graph patterns with FILTER are supported')
+            else:
+                patterns.extend(self.parse_triples())
+            self.accept_op('.')
+        return patterns, filters
+
+    def parse_triples(self):
+        subject = self.parse_term()
+        triples = []
+        while True:
+            predicate = self.parse_term(predicate=True)
+            while True:
+                triples.append((subject, predicate, self.parse_term()))
+                if not self.accept_op(','):
+                    break
+            if not self.accept_op(';'):
+                break
+            # Allow a trailing ';' before '.' or '}'
+            if self.peek() in (('op', '.'), ('op', '}')):
+                break
+        return triples
+
+    def parse_term(self, predicate=False):
+        kind, value = self.next()
+        if kind == 'var':
+            return Var(value[1:])
+        if kind == 'iri':
+            iri = value[1:-1]
+            return IRI(self.base + iri if self.base and ':' not in iri else iri)
+        if kind == 'pname':
+            return IRI(self.expand(value))
+        if kind == 'word' and value == 'a' and predicate:
+            return RDF_TYPE
+        if kind == 'word' and value.lower() in ('true', 'false'):
+            return Literal(value.lower() == 'true', XSD_BOOLEAN)
+        if kind == 'string':
+            return self.parse_literal(value)
+        if kind == 'number':
+            return parse_number(value)
+        raise SparqlError(f'Unexpected {value!r} in triple pattern')
+
+    def expand(self, pname):
+        prefix, _, local = pname.partition(':')
+        if prefix not in self.prefixes:
+            raise SparqlError(f'Unknown prefix {prefix!r}')
+        return self.prefixes[prefix] + local
+
+    def parse_literal(self, token):
+        value = re.sub(r'\\(.)', lambda m: _STRING_ESCAPES.get(m.group(1), m.group(1)), token[1:-1])
+        kind, next_value = self.peek()
+        if kind == 'langtag':
+            self.pos += 1
+            return Literal(value, None, next_value[1:].lower())
+        if self.accept_op('^^'):
+            kind, datatype = self.next()
+            if kind == 'iri':
+                datatype = datatype[1:-1]
+            elif kind == 'pname':
+                datatype = self.expand(datatype)
+            else:
+                raise SparqlError(f'Invalid datatype {datatype!r}')
+            return typed_literal(value, datatype)
+        return Literal(value)
+
+    # Filter expressions are nested tuples: ('or', a, b), ('and', a, b), ('not', a),
+    # ('cmp', op, a, b), ('call', NAME, [args]); leaves are Var, IRI or Literal.
+    def parse_filter(self):
+        kind, value = self.peek()
+        if kind == 'word' and value.upper() in FUNCTIONS:
+            return self.parse_primary()
+        self.expect_op('(')
+        expr = self.parse_or()
+        self.expect_op(')')
+        return expr
+
+    def parse_or(self):
+        expr = self.parse_and()
+        while self.accept_op('||'):
+            expr = ('or', expr, self.parse_and())
+        return expr
+
+    def parse_and(self):
+        expr = self.parse_relational()
+        while self.accept_op('&&'):
+            expr = ('and', expr, self.parse_relational())
+        return expr
+
+    def parse_relational(self):
+        expr = self.parse_unary()
+        kind, value = self.peek()
+        if kind == 'op' and value in ('=', '!=', '<', '>', '<=', '>='):
+            self.pos += 1
+            expr = ('cmp', value, expr, self.parse_unary())
+        return expr
+
+    def parse_unary(self):
+        if self.accept_op('!'):
+            return ('not', self.parse_unary())
+        return self.parse_primary()
+
+    def parse_primary(self):
+        if self.accept_op('('):
+            expr = self.parse_or()
+            self.expect_op(')')
+            return expr
+        kind, value = self.peek()
+        if kind == 'word' and value.upper() in FUNCTIONS:
+            self.pos += 1
+            name = value.upper()
+            self.expect_op('(')
+            args = []
+            if not self.accept_op(')'):
+                args.append(self.parse_or())
+                while self.accept_op(','):
+                    args.append(self.parse_or())
+                self.expect_op(')')
+            check_call(name, args)
+            return ('call', name, args)
+        return self.parse_term()
+
+def check_call(name, args):
+    """Reject bad arities and invalid constant regexes before evaluation starts"""
+    low, high = FUNCTIONS[name]
+    if not low <= len(args) <= high:
+        expected = low if low == high else f'{low} or {high}'
+        raise SparqlError(f'{name} takes {expected} argument{"s" if high > 1 else ""}, got {len(args)}')
+    if name == 'BOUND' and not isinstance(args[0], Var):
+        raise SparqlError('BOUND takes one variable')
+    if name == 'REGEX' and all(isinstance(arg, Literal) for arg in args[1:]):
+        flags = literal_lexical(args[2]) if len(args) > 2 else ''
+        try:
+            _compile_regex(literal_lexical(args[1]), flags)
+        except re.error as e:
+            raise SparqlError(f'Invalid regular expression: {e}')
+
+def parse_number(value):
+    if re.fullmatch(r'[+-]?\d+', value):
+        return Literal(int(value), XSD_INTEGER)
+    if 'e' in value.lower():
+        return Literal(float(value), XSD_DOUBLE)
+    return Literal(float(value), XSD_DECIMAL)
+
+def typed_literal(value, datatype):
+    """Literal with its value converted to Python for numeric/boolean datatypes"""
+    try:
+        if datatype == XSD_INTEGER:
+            return Literal(int(value), datatype)
+        if datatype in (XSD_DECIMAL, XSD_DOUBLE):
+            return Literal(float(value), datatype)
+    except ValueError:
+        raise SparqlError(f'Invalid {datatype} literal {value!r}')
+    if datatype == XSD_BOOLEAN:
+        return Literal(value == 'true', datatype)
+    if datatype == XSD_STRING:
+        return Literal(value)
+    return Literal(value, datatype)
+
+def parse_query(query):
+    """Parse a SELECT query with a basic graph pattern, FILTERs, LIMIT and OFFSET"""
+    return _Parser(query).parse()
+
+# Filter evaluation
+class _EvalError(Exception):
+    """Type error or unbound variable: the filter evaluates to false"""
+
+def _expr_vars(expr):
+    if isinstance(expr, Var):
+        return {expr.name}
+    if isinstance(expr, (IRI, Literal)):
+        return set()
+    kind = expr[0]
+    args = expr[2:] if kind == 'cmp' else expr[2] if kind == 'call' else expr[1:]
+    return set().union(*(_expr_vars(arg) for arg in args))
+
+def _value(term):
+    """Python value used for comparisons: numbers, bools, strings or IRIs"""
+    if isinstance(term, Literal):
+        if term.datatype in NUMERIC_TYPES or term.datatype == XSD_BOOLEAN:
+            return term.value
+        return literal_lexical(term)
+    return term
+
+def _ebv(value):
+    """Effective boolean value"""
+    if isinstance(value, (bool, int, float)):
+        return bool(value)
+    if isinstance(value, str):
+        return bool(value)
+    raise _EvalError()
+
+def _string_arg(expr, binding):
+    """Lexical form of a literal argument (typed literals included)"""
+    value = _eval(expr, binding)
+    if not isinstance(value, Literal):
+        raise _EvalError()
+    return literal_lexical(value)
+
+_REPEATS = {sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, sre_parse.POSSESSIVE_REPEAT}
+
+def _subpatterns(value):
+    """Parsed subpatterns nested anywhere in a regex node's argument"""
+    if isinstance(value, sre_parse.SubPattern):
+        yield value
+    elif isinstance(value, (tuple, list)):
+        for part in value:
+            yield from _subpatterns(part)
+
+def _backtracks(tree, repeated=False):
+    """Whether a repeat contains another repeat or an alternation (catastrophic backtracking)"""
+    for op, value in tree:
+        if op in _REPEATS and value[1] > 1:
+            if repeated:
+                return True
+            if _backtracks(value[2], True):
+                return True
+        elif op == sre_parse.BRANCH and repeated:
+            return True
+        elif any(_backtracks(sub, repeated) for sub in _subpatterns(value)):
+            return True
+    return False
+
+def _check_regex(pattern, re_flags):
+    """Refuse patterns whose matching time can explode (ReDoS), raising re.error"""
+    if len(pattern) > MAX_REGEX_LENGTH:
+        raise re.error(f'pattern longer than {MAX_REGEX_LENGTH} characters')
+    if _backtracks(sre_parse.parse(pattern, re_flags)):
+        raise re.error('nested quantifiers and quantified alternations are not supported')
+
+@lru_cache(maxsize=256)
+def _compile_regex(pattern, flags):
+    re_flags = 0
+    for flag in flags:
+        re_flags |= {'i': re.IGNORECASE, 's': re.DOTALL, 'm': re.MULTILINE, 'x': re.VERBOSE}.get(flag, 0)
+    _check_regex(pattern, re_flags)
+    return re.compile(pattern, re_flags)
+
+def _call(name, args, binding):
+    # Arity is checked by the parser (check_call)
+    if name == 'BOUND':
+        return args[0].name in binding
+    if name in ('ISIRI', 'ISURI'):
+        return isinstance(_eval(args[0], binding), IRI)
+    if name == 'ISLITERAL':
+        return isinstance(_eval(args[0], binding), Literal)
+    if name == 'STR':
+        value = _eval(args[0], binding)
+        return Literal(value.value if isinstance(value, IRI) else literal_lexical(value))
+    if name == 'LANG':
+        value = _eval(args[0], binding)
+        if not isinstance(value, Literal):
+            raise _EvalError()
+        return Literal(value.language or '')
+    if name == 'DATATYPE':
+        value = _eval(args[0], binding)
+        if not isinstance(value, Literal):
+            raise _EvalError()
+        return IRI(value.datatype or XSD_STRING)
+
+    text = _string_arg(args[0], binding)
+    if name == 'LCASE':
+        return Literal(text.lower())
+    if name == 'UCASE':
+        return Literal(text.upper())
+    if name == 'STRLEN':
+        return Literal(len(text), XSD_INTEGER)
+
+    other = _string_arg(args[1], binding)
+    if name == 'CONTAINS':
+        return other in text
+    if name == 'STRSTARTS':
+        return text.startswith(other)
+    if name == 'STRENDS':
+        return text.endswith(other)
+    if name == 'REGEX':
+        flags = _string_arg(args[2], binding) if len(args) > 2 else ''
+        try:
+            regex = _compile_regex(other, flags)
+        except re.error:
+            # A pattern bound at evaluation time is an expression error
+            raise _EvalError()
+        return regex.search(text) is not None
+    raise SparqlError(f'Unsupported function {name}')
+
+def _compare(op, left, right):
+    left, right = _value(left), _value(right)
+    numeric = (int, float)
+    if isinstance(left, numeric) and isinstance(right, numeric) or \
+            isinstance(left, str) and isinstance(right, str):
+        if op == '=':
+            return left == right
+        if op == '!=':
+            return left != right
+        if op == '<':
+            return left < right
+        if op == '>':
+            return left > right
+        if op == '<=':
+            return left <= right
+        return left >= right
+    if op in ('=', '!='):
+        if isinstance(left, IRI) or isinstance(right, IRI):
+            return (left == right) == (op == '=')
+    raise _EvalError()
+
+def _eval(expr, binding):
+    if isinstance(expr, Var):
+        if expr.name not in binding:
+            raise _EvalError()
+        return binding[expr.name]
+    if isinstance(expr, (IRI, Literal)):
+        return expr
+    kind = expr[0]
+    if kind in ('or', 'and'):
+        # An error on one side is ignored if the other side decides the result
+        left, right = _try_ebv(expr[1], binding), _try_ebv(expr[2], binding)
+        decisive = kind == 'or'
+        if left is decisive or right is decisive:
+            return decisive
+        if left is None or right is None:
+            raise _EvalError()
+        return not decisive
+    if kind == 'not':
+        return not _ebv(_value(_eval(expr[1], binding)))
+    if kind == 'cmp':
+        return _compare(expr[1], _eval(expr[2], binding), _eval(expr[3], binding))
+    if kind == 'call':
+        return _call(expr[1], expr[2], binding)
+    raise SparqlError(f'Unsupported expression {kind}')
+
+def _try_ebv(expr, binding):
+    """Effective boolean value of expr, or None on error"""
+    try:
+        return _ebv(_value(_eval(expr, binding)))
+    except _EvalError:
+        return None
+
+def _passes(expr, binding):
+    return _try_ebv(expr, binding) is True
+
+# Evaluation
+def plan_query(store, patterns, filters):
+    """Order patterns greedily by estimated selectivity and attach each filter to the
+    first step where all of its variables are bound"""
+    remaining = list(patterns)
+    bound = set()
+    plan = []
+    while remaining:
+        def cost(pattern):
+            s, p, o = pattern
+            connected = not bound or any(isinstance(t, Var) and t.name in bound for t in pattern)
+            estimate = store.estimate(
+                None if isinstance(s, Var) else s,
+                None if isinstance(p, Var) else p,
+                None if isinstance(o, Var) else o,
+                s_bound=isinstance(s, Var) and s.name in bound,
+                o_bound=isinstance(o, Var) and o.name in bound,
+            )
+            # Never pick a cartesian product while a connected pattern is left
+            return (not connected, estimate)
+
+        pattern = min(remaining, key=cost)
+        remaining.remove(pattern)
+        bound |= {t.name for t in pattern if isinstance(t, Var)}
+        plan.append([pattern, []])
+
+    pending = list(filters)
+    bound = set()
+    for step in plan:
+        bound |= {t.name for t in step[0] if isinstance(t, Var)}
+        for expr in list(pending):
+            if _expr_vars(expr) <= bound:
+                step[1].append(expr)
+                pending.remove(expr)
+    return plan, pending
+
+def evaluate(store, query, timeout=EVAL_TIMEOUT, max_solutions=MAX_SOLUTIONS):
+    """Return (variables, solutions) for a parsed query, solutions being a list of dicts of
+    variable name -> term; raises SparqlError when the query exceeds its time or result budget"""
+    plan, final_filters = plan_query(store, query.patterns, query.filters)
+    deadline = time.monotonic() + timeout
+    steps = [0]
+
+    def solve(index, binding):
+        if index == len(plan):
+            if all(_passes(expr, binding) for expr in final_filters):
+                yield binding
+            return
+        pattern, step_filters = plan[index]
+        lookup = [binding.get(t.name) if isinstance(t, Var) else t for t in pattern]
+        for triple in store.triples(*lookup):
+            steps[0] += 1
+            if not steps[0] & 0x3ff and time.monotonic() > deadline:
+                raise SparqlError(f'Query did not finish within {timeout:g} seconds')
+            extended = binding
+            for term, value in zip(pattern, triple):
+                if isinstance(term, Var):
+                    known = extended.get(term.name)
+                    if known is None:
+                        if extended is binding:
+                            extended = dict(binding)
+                        extended[term.name] = value
+                    elif known != value:
+                        break
+            else:
+                if all(_passes(expr, extended) for expr in step_filters):
+                    yield from solve(index + 1, extended)
+
+    variables = query.variables
+    if variables is None:
+        variables = list(dict.fromkeys(t.name for pattern in query.patterns for t in pattern
+                                       if isinstance(t, Var)))
+
+    solutions = ({name: binding[name] for name in variables if name in binding}
+                 for binding in solve(0, {}))
+    if query.distinct:
+        solutions = _distinct(solutions, variables)
+    # Solutions are collected before the response starts, so that errors and
+    # budget overruns still get a proper error status
+    limit = query.limit if query.limit is not None and query.limit <= max_solutions else max_solutions + 1
+    solutions = list(islice(solutions, query.offset, query.offset + limit))
+    if len(solutions) > max_solutions:
+        raise SparqlError(f'Query has more than {max_solutions} solutions; add a LIMIT')
+    return variables, solutions
+
+def _distinct(solutions, variables):
+    seen = set()
+    for solution in solutions:
+        key = tuple(solution.get(name) for name in variables)
+        if key not in seen:
+            seen.add(key)
+            yield solution
+
+# SPARQL 1.1 Query Results JSON, streamed one binding at a time
+def term_to_json(term):
+    if isinstance(term, IRI):
+        return {'type': 'uri', 'value': term.value}
+    result = {'type': 'literal', 'value': literal_lexical(term)}
+    if term.language:
+        result['xml:lang'] = term.language
+    elif term.datatype:
+        result['datatype'] = term.datatype
+    return result
+
+def stream_results_json(variables, solutions):
+    yield '{"head": {"vars": %s}, "results": {"bindings": [' % json.dumps(variables)
+    separator = '\n'
+    for solution in solutions:
+        binding = {name: term_to_json(term) for name, term in solution.items()}
+        yield separator + json.dumps(binding, ensure_ascii=False)
+        separator = ',\n'
+    yield '\n]}}\n'
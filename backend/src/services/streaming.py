@@ -0,0 +1,65 @@
+from flask import current_app
+import zlib
+
+try:
+    import brotli
+except ImportError:  # Optional: without it responses are only gzipped
+    brotli = None
+
+# Write size handed to the WSGI server (and to the compressor)
+STREAM_CHUNK_BYTES = 64 * 1024
+
+def buffered(chunks, size=STREAM_CHUNK_BYTES):
+    """Join small str/bytes chunks into writes of roughly size bytes"""
+    buffer = []
+    buffered_bytes = 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        buffer.append(chunk)
+        buffered_bytes += len(chunk)
+        if buffered_bytes >= size:
+            yield b''.join(buffer)
+            buffer = []
+            buffered_bytes = 0
+    if buffer:
+        yield b''.join(buffer)
+
+def gzip_stream(chunks, level=6):
+    """Gzip a chunk stream on the fly"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in buffered(chunks):
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def brotli_stream(chunks, quality=5):
+    """Brotli-compress a chunk stream on the fly (requires the brotli package)"""
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in buffered(chunks):
+        data = compressor.process(chunk)
+        if data:
+            yield data
+    yield compressor.finish()
+
+def json_list_stream(items, key=None, envelope=None, count_key=None):
+    """Encode a JSON list one element at a time with the app's JSON provider.
+
+    With key the list is wrapped in an object, {**envelope, key: [...]};
+    count_key adds the number of elements after the list, once it is known.
+    """
+    dumps = current_app.json.dumps
+    if key is None:
+        yield '['
+    else:
+        head = dumps(envelope or {})[:-1]
+        yield head + (',' if envelope else '') + dumps(key) + ':['
+    count = 0
+    for item in items:
+        yield (',' if count else '') + dumps(item)
+        count += 1
+    if key is None:
+        yield ']'
+    else:
+        yield ']' + (f',{dumps(count_key)}:{count}' if count_key else '') + '}'
@@ -0,0 +1,266 @@
+from concurrent.futures import ProcessPoolExecutor
+from src.models.archive import db, ArchiveItem, Annotation
+from src.services.graph_cache import archive_key, bump_generations
+from collections import deque
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+
+# created_by of the tagger's annotations; hand-made and imported ones default to 'system'
+TAGGER_USER = 'tagger'
+
+# Terms shorter than this are too ambiguous to tag automatically
+MIN_TERM_LENGTH = 3
+
+# Items per task handed to a worker process
+TAG_CHUNK_ITEMS = 200
+
+# Below this many items the pool start-up costs more than it saves
+PARALLEL_MIN_ITEMS = 400
+
+# Chunks in flight per worker process; later chunks are not read until a slot frees up
+CHUNKS_PER_WORKER = 2
+
+class Automaton:
+    """Aho-Corasick automaton over lower-cased terms.
+
+    goto[state] maps a character to the next state, fail[state] is the
+    longest proper suffix state and output[state] lists the terms (as
+    indexes into terms) that end in that state, fail chain included.
+    """
+
+    def __init__(self, terms):
+        self.terms = terms
+        self.goto = [{}]
+        self.output = [[]]
+        for index, term in enumerate(terms):
+            state = 0
+            for char in term:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.output.append([])
+                state = next_state
+            self.output[state].append(index)
+
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def find(self, text):
+        """(start, end, term index) of every occurrence, in one pass over text"""
+        goto, fail, output, terms = self.goto, self.fail, self.output, self.terms
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for index in output[state]:
+                yield position + 1 - len(terms[index]), position + 1, index
+
+def _lower(text):
+    """Lower-case text without changing its length, so offsets stay valid"""
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    return ''.join(char.lower() if len(char.lower()) == 1 else char for char in text)
+
+def tag_text(automaton, text):
+    """Longest whole-word, non-overlapping matches in text as (start, end, term index)"""
+    if not text:
+        return []
+    matches = []
+    for start, end, index in automaton.find(_lower(text)):
+        if start > 0 and text[start - 1].isalnum():
+            continue
+        if end < len(text) and text[end].isalnum():
+            continue
+        matches.append((start, end, index))
+
+    matches.sort(key=lambda match: (match[0], match[0] - match[1]))
+    selected = []
+    covered = 0
+    for start, end, index in matches:
+        if start >= covered:
+            selected.append((start, end, index))
+            covered = end
+    return selected
+
+# Worker processes
+_worker_automaton = None
+
+def _init_worker(automaton):
+    global _worker_automaton
+    _worker_automaton = automaton
+
+def _tag_chunk(items):
+    """Worker task: [(item_id, content)] -> [(item_id, start, end, term index)]"""
+    return [(item_id, start, end, index)
+            for item_id, content in items
+            for start, end, index in tag_text(_worker_automaton, content)]
+
+def _map_bounded(pool, func, args, window):
+    """Like pool.map, but with at most window tasks submitted and not yet consumed"""
+    in_flight = deque()
+    for arg in args:
+        in_flight.append(pool.submit(func, arg))
+        if len(in_flight) >= window:
+            yield in_flight.popleft().result()
+    while in_flight:
+        yield in_flight.popleft().result()
+
+# Gazetteer
+_automaton_lock = threading.Lock()
+_automaton = None
+_automaton_digest = None
+_gazetteer = None
+
+def load_gazetteer():
+    """Distinct annotated terms as {lower text: (annotation_type, entity_uri, confidence)}.
+
+    A term annotated with several types takes the most frequent one;
+    confidence is that type's share of the term's annotations. The tagger's
+    own annotations (created_by TAGGER_USER) are left out, so runs do not
+    reinforce earlier guesses.
+    """
+    rows = db.session.execute(
+        db.select(db.func.lower(Annotation.text), Annotation.annotation_type, Annotation.entity_uri,
+                  db.func.count())
+          .where(db.or_(Annotation.created_by.is_(None), Annotation.created_by != TAGGER_USER))
+          .group_by(db.func.lower(Annotation.text), Annotation.annotation_type, Annotation.entity_uri)
+    ).all()
+
+    totals = {}
+    best = {}
+    for term, annotation_type, entity_uri, count in rows:
+        term = term.strip()
+        if len(term) < MIN_TERM_LENGTH or term.isdigit():
+            continue
+        totals[term] = totals.get(term, 0) + count
+        if term not in best or (count, annotation_type, entity_uri or '') > best[term][:3]:
+            best[term] = (count, annotation_type, entity_uri or '', entity_uri)
+    return {term: (annotation_type, entity_uri, round(count / totals[term], 3))
+            for term, (count, annotation_type, _, entity_uri) in best.items()}
+
+def get_automaton():
+    """(automaton, gazetteer), rebuilt only when the set of annotated terms changed"""
+    global _automaton, _automaton_digest, _gazetteer
+    gazetteer = load_gazetteer()
+    entries = sorted((term, annotation_type, entity_uri or '')
+                     for term, (annotation_type, entity_uri, _) in gazetteer.items())
+    digest = hashlib.sha1(repr(entries).encode('utf-8')).hexdigest()
+
+    with _automaton_lock:
+        if _automaton is None or digest != _automaton_digest:
+            _automaton = Automaton(sorted(gazetteer))
+            _automaton_digest = digest
+        # Confidences may move without the term set changing
+        _gazetteer = gazetteer
+        return _automaton, _gazetteer
+
+def _existing_spans(item_ids):
+    spans = {}
+    for item_id, start, end in db.session.execute(
+            db.select(Annotation.item_id, Annotation.start_pos, Annotation.end_pos)
+              .where(Annotation.item_id.in_(item_ids), Annotation.start_pos.isnot(None))):
+        spans.setdefault(item_id, []).append((start, end))
+    return spans
+
+def auto_annotate_archive(archive, workers=None, dry_run=False, sample_size=50, progress=None):
+    """Tag every item of an archive with known terms and store the new annotations.
+
+    Content is scanned by worker processes; matches overlapping an existing
+    annotation of the item are dropped, so re-running only adds what is new.
+    progress(fraction, message), if given, is called after every chunk.
+    """
+    started = time.perf_counter()
+    automaton, gazetteer = get_automaton()
+    terms = automaton.terms
+
+    item_ids = db.session.execute(
+        db.select(ArchiveItem.id).where(ArchiveItem.archive_id == archive.id).order_by(ArchiveItem.id)
+    ).scalars().all()
+
+    def chunks():
+        for start in range(0, len(item_ids), TAG_CHUNK_ITEMS):
+            batch = item_ids[start:start + TAG_CHUNK_ITEMS]
+            yield db.session.execute(
+                db.select(ArchiveItem.id, ArchiveItem.content).where(ArchiveItem.id.in_(batch))
+            ).all()
+
+    def collect(chunk_results):
+        results = []
+        for number, chunk_result in enumerate(chunk_results, 1):
+            results.extend(chunk_result)
+            if progress is not None:
+                done = min(number * TAG_CHUNK_ITEMS, len(item_ids))
+                progress(done / len(item_ids), f'Tagged {done} of {len(item_ids)} items')
+        return results
+
+    workers = workers or os.cpu_count() or 1
+    if not terms:
+        results = []
+    elif workers > 1 and len(item_ids) >= PARALLEL_MIN_ITEMS:
+        # Spawned, not forked: the job worker runs several threads, and a forked
+        # child could inherit a lock one of them held
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(automaton,),
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            results = collect(_map_bounded(pool, _tag_chunk, ([tuple(row) for row in chunk] for chunk in chunks()),
+                                           CHUNKS_PER_WORKER * workers))
+    else:
+        _init_worker(automaton)
+        results = collect(_tag_chunk([tuple(row) for row in chunk]) for chunk in chunks())
+
+    # Drop matches that overlap what is already annotated
+    existing = _existing_spans({item_id for item_id, _, _, _ in results})
+    candidates = []
+    for item_id, start, end, index in results:
+        if any(start < span_end and span_start < end for span_start, span_end in existing.get(item_id, ())):
+            continue
+        annotation_type, entity_uri, confidence = gazetteer[terms[index]]
+        candidates.append({
+            'item_id': item_id,
+            'start_pos': start,
+            'end_pos': end,
+            'annotation_type': annotation_type,
+            'entity_uri': entity_uri,
+            'confidence': confidence,
+            'created_by': TAGGER_USER,
+        })
+
+    # Annotation text is the exact span of the content, like hand-made annotations
+    if candidates:
+        contents = dict(db.session.execute(
+            db.select(ArchiveItem.id, ArchiveItem.content)
+              .where(ArchiveItem.id.in_({row['item_id'] for row in candidates}))).all())
+        for row in candidates:
+            row['text'] = contents[row['item_id']][row['start_pos']:row['end_pos']]
+
+    if candidates and not dry_run:
+        db.session.execute(db.insert(Annotation), candidates)
+        bump_generations(db.session.connection(), [archive_key(archive.id)])
+        db.session.commit()
+
+    return {
+        'archive': archive.slug,
+        'items': len(item_ids),
+        'terms': len(terms),
+        'matches': len(results),
+        'annotations': len(candidates),
+        'inserted': 0 if dry_run else len(candidates),
+        'dry_run': dry_run,
+        'sample': candidates[:sample_size] if dry_run else [],
+        'elapsed_seconds': round(time.perf_counter() - started, 3)
+    }
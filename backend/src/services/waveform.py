@@ -0,0 +1,298 @@
+from flask import current_app
+from src.models.archive import db, RecordingWaveform, RecordingWord
+from src.models.media import MediaAsset
+from src.services.media import media_path
+from datetime import datetime
+import numpy as np
+import os
+import re
+import struct
+import unicodedata
+import wave
+
+# Finest level: one min/max pair per 256 samples (~5.8 ms at 44.1 kHz); each level halves it
+SAMPLES_PER_PEAK = 256
+
+# Peaks per tile, and the size at which the pyramid stops
+TILE_PEAKS = 1024
+
+# Frames decoded per read, a multiple of SAMPLES_PER_PEAK so peaks never straddle reads
+READ_FRAMES = SAMPLES_PER_PEAK * 4096
+
+# Peaks file: header, then the peak count of every level, then each level as
+# interleaved int8 (min, max) pairs scaled to -127..127
+PEAKS_MAGIC = b'WVPK'
+PEAKS_VERSION = 1
+PEAKS_HEADER = struct.Struct('<4sHIIHH')  # magic, version, sample rate, samples per peak, channels, levels
+
+# A peak is voiced when its RMS is above this share of the loud (95th percentile) level
+VOICED_RATIO = 0.1
+
+MAX_PHRASE_CANDIDATES = 1000
+
+_WORD_RE = re.compile(r"\w+(?:['’]\w+)*")
+
+class WaveformError(Exception):
+    """Audio that cannot be analysed (not uploaded, not PCM WAV, mismatched timings)"""
+
+# Audio
+def recording_audio_path(recording):
+    """Local file behind a recording's audio_url; only uploaded media (/api/media/<id>) are local"""
+    match = re.fullmatch(r'/api/media/(\d+)', recording.audio_url or '')
+    asset = db.session.get(MediaAsset, int(match.group(1))) if match else None
+    if asset is None or asset.status != 'complete':
+        raise WaveformError('Recording audio is not an uploaded file')
+    return media_path(asset)
+
+def _pcm_to_float(data, width):
+    if width == 1:
+        return (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128) / 128
+    if width == 2:
+        return np.frombuffer(data, dtype='<i2').astype(np.float32) / 32768
+    if width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        return np.where(values & 0x800000, values - 0x1000000, values).astype(np.float32) / 8388608
+    if width == 4:
+        return np.frombuffer(data, dtype='<i4').astype(np.float32) / 2147483648
+    raise WaveformError(f'Unsupported sample width: {width} bytes')
+
+def decode_peaks(path, progress=None):
+    """Finest-level peaks of a PCM WAV file as (sample_rate, channels, frames, mins, maxs, rms).
+
+    The file is read READ_FRAMES at a time, so memory does not grow with its length.
+    """
+    try:
+        wav = wave.open(path, 'rb')
+    except (wave.Error, EOFError) as e:
+        raise WaveformError(f'Not a PCM WAV file: {e}')
+    with wav:
+        channels, width, rate, frames = wav.getnchannels(), wav.getsampwidth(), wav.getframerate(), wav.getnframes()
+        mins, maxs, rms = [], [], []
+        done = 0
+        while True:
+            data = wav.readframes(READ_FRAMES)
+            if not data:
+                break
+            samples = _pcm_to_float(data, width)
+            # All channels of a peak's frames together: the envelope of the mix
+            peak_samples = SAMPLES_PER_PEAK * channels
+            peaks = -(-len(samples) // peak_samples)
+            if len(samples) == peaks * peak_samples:
+                block = samples.reshape(peaks, -1)
+                mins.append(block.min(axis=1))
+                maxs.append(block.max(axis=1))
+                rms.append(np.sqrt((block * block).mean(axis=1)))
+            else:
+                # Last, short read: pad the final peak with NaN, which the nan-reductions ignore
+                padded = np.full(peaks * peak_samples, np.nan, dtype=np.float32)
+                padded[:len(samples)] = samples
+                block = padded.reshape(peaks, -1)
+                mins.append(np.nanmin(block, axis=1))
+                maxs.append(np.nanmax(block, axis=1))
+                rms.append(np.sqrt(np.nanmean(block * block, axis=1)))
+            done += len(samples) // channels
+            if progress is not None and frames:
+                progress(done / frames, f'Decoded {done} of {frames} frames')
+
+    if not mins:
+        return rate, channels, 0, np.zeros(0), np.zeros(0), np.zeros(0)
+    return rate, channels, done, np.concatenate(mins), np.concatenate(maxs), np.concatenate(rms)
+
+def build_levels(mins, maxs):
+    """[(n, 2) int8 array per level], finest first, halving until a level fits in one tile"""
+    level = np.stack([mins, maxs], axis=1)
+    level = np.clip(np.round(level * 127), -127, 127).astype(np.int8)
+    levels = [level]
+    while len(level) > TILE_PEAKS:
+        if len(level) % 2:
+            level = np.concatenate([level, level[-1:]])
+        pairs = level.reshape(-1, 2, 2)
+        level = np.stack([pairs[:, :, 0].min(axis=1), pairs[:, :, 1].max(axis=1)], axis=1)
+        levels.append(level)
+    return levels
+
+def peaks_path(recording_id):
+    return os.path.join(current_app.config['MEDIA_DIR'], f'recording-{recording_id}.peaks')
+
+def write_peaks(path, sample_rate, channels, levels):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'wb') as f:
+        f.write(PEAKS_HEADER.pack(PEAKS_MAGIC, PEAKS_VERSION, sample_rate, SAMPLES_PER_PEAK, channels, len(levels)))
+        f.write(np.array([len(level) for level in levels], dtype='<u4').tobytes())
+        for level in levels:
+            f.write(level.tobytes())
+    os.replace(path + '.tmp', path)
+
+def level_size(waveform, level):
+    return -(-waveform.peak_count // 2 ** level)
+
+def read_peaks(waveform, level, start, count):
+    """(count, 2) int8 peaks of one level, read from the file at a computed offset"""
+    size = level_size(waveform, level)
+    start = min(max(start, 0), size)
+    count = max(min(count, size - start), 0)
+    offset = PEAKS_HEADER.size + 4 * waveform.levels + \
+        2 * sum(level_size(waveform, finer) for finer in range(level)) + 2 * start
+    path = os.path.join(current_app.config['MEDIA_DIR'], waveform.peaks_file)
+    return np.fromfile(path, dtype=np.int8, count=2 * count, offset=offset).reshape(-1, 2)
+
+def peaks_for_range(waveform, start_time, end_time, width):
+    """(level, first peak index, peaks) covering [start_time, end_time] with at least ~width peaks"""
+    seconds_per_peak = waveform.samples_per_peak / waveform.sample_rate
+    span = max(end_time - start_time, seconds_per_peak)
+    ratio = span / seconds_per_peak / max(width, 1)
+    level = int(min(max(np.floor(np.log2(ratio)) if ratio > 1 else 0, 0), waveform.levels - 1))
+    scale = seconds_per_peak * 2 ** level
+    first = int(start_time // scale)
+    count = int(np.ceil(end_time / scale)) - first
+    return level, first, read_peaks(waveform, level, first, count)
+
+# Word timings
+def normalize_word(word):
+    return unicodedata.normalize('NFKC', word).casefold()[:100]
+
+def tokenize(text):
+    """(char start, char end, normalized word) of every word in text"""
+    return [(match.start(), match.end(), normalize_word(match.group())) for match in _WORD_RE.finditer(text or '')]
+
+def estimate_word_times(tokens, rms, seconds_per_peak, duration):
+    """Spread the words over the voiced stretches of the recording, in proportion to their length.
+
+    A rough alignment (no speech recognition involved): silences get no words,
+    so pauses between sentences keep the timings from drifting far.
+    """
+    if not tokens:
+        return np.zeros(0), np.zeros(0)
+    if len(rms) and rms.max() > 0:
+        voiced = rms > VOICED_RATIO * np.percentile(rms, 95)
+    else:
+        voiced = np.ones(max(int(np.ceil(duration / seconds_per_peak)), 1), dtype=bool)
+    if not voiced.any():
+        voiced[:] = True
+    voiced_so_far = np.cumsum(voiced)
+
+    weights = np.array([end - start + 1 for start, end, _ in tokens], dtype=np.float64)
+    edges = np.concatenate([[0.0], np.cumsum(weights)]) / weights.sum() * voiced_so_far[-1]
+    first_peaks = np.searchsorted(voiced_so_far, edges[:-1], side='right')
+    last_peaks = np.searchsorted(voiced_so_far, edges[1:], side='left') + 1
+    starts = np.minimum(first_peaks * seconds_per_peak, duration)
+    ends = np.minimum(np.maximum(last_peaks, first_peaks + 1) * seconds_per_peak, duration)
+    return starts, ends
+
+def _provided_word_times(tokens, words):
+    if len(words) != len(tokens):
+        raise WaveformError(f'Got {len(words)} word timings for {len(tokens)} transcript words')
+    try:
+        starts = np.array([float(word['start']) for word in words])
+        ends = np.array([float(word['end']) for word in words])
+    except (KeyError, TypeError, ValueError):
+        raise WaveformError("Each word timing needs numeric 'start' and 'end'")
+    if not (np.isfinite(starts).all() and np.isfinite(ends).all()):
+        raise WaveformError('Word timings must be finite numbers')
+    if (starts < 0).any() or (starts > ends).any():
+        raise WaveformError("Word timings need 0 <= 'start' <= 'end'")
+    return starts, ends
+
+def ingest_recording(recording, words=None, progress=None):
+    """Compute the peak pyramid and word index of a recording.
+
+    words, if given, are the transcript words' timings ([{"start", "end"}],
+    seconds, in transcript order); otherwise they are estimated from the audio.
+    """
+    rate, channels, frames, mins, maxs, rms = decode_peaks(recording_audio_path(recording), progress)
+    if not frames:
+        raise WaveformError('Recording has no audio frames')
+    levels = build_levels(mins, maxs)
+    path = peaks_path(recording.id)
+    write_peaks(path, rate, channels, levels)
+
+    duration = frames / rate
+    seconds_per_peak = SAMPLES_PER_PEAK / rate
+    tokens = tokenize(recording.transcript)
+    if words is not None:
+        starts, ends = _provided_word_times(tokens, words)
+    else:
+        starts, ends = estimate_word_times(tokens, rms, seconds_per_peak, duration)
+
+    db.session.execute(db.delete(RecordingWord).where(RecordingWord.recording_id == recording.id))
+    if tokens:
+        db.session.execute(db.insert(RecordingWord), [
+            {'recording_id': recording.id, 'position': position, 'word': word, 'char_start': start,
+             'char_end': end, 'start_time': round(float(start_time), 3), 'end_time': round(float(end_time), 3)}
+            for position, ((start, end, word), start_time, end_time) in enumerate(zip(tokens, starts, ends))
+        ])
+
+    waveform = db.session.merge(RecordingWaveform(
+        recording_id=recording.id,
+        peaks_file=os.path.basename(path),
+        sample_rate=rate,
+        channels=channels,
+        samples_per_peak=SAMPLES_PER_PEAK,
+        levels=len(levels),
+        peak_count=len(levels[0]),
+        duration=duration,
+        word_count=len(tokens),
+        timing_source='provided' if words is not None else 'estimated',
+        computed_at=datetime.utcnow()
+    ))
+    if recording.duration is None:
+        recording.duration = round(duration, 3)
+    db.session.commit()
+    return waveform.to_dict()
+
+# Lookups
+def _word_dict(row):
+    return {'position': row.position, 'word': row.word, 'char_start': row.char_start, 'char_end': row.char_end,
+            'start_time': row.start_time, 'end_time': row.end_time}
+
+def word_at(recording_id, seconds):
+    """The word being spoken at a time offset (the last one starting at or before it)"""
+    row = db.session.execute(
+        db.select(RecordingWord)
+          .where(RecordingWord.recording_id == recording_id, RecordingWord.start_time <= seconds)
+          .order_by(RecordingWord.start_time.desc(), RecordingWord.position.desc())
+          .limit(1)
+    ).scalar()
+    return _word_dict(row) if row else None
+
+def find_phrase(recording_id, phrase, limit=20):
+    """Occurrences of a phrase in the transcript with their time span, first occurrence first.
+
+    Candidates come from an index lookup of the phrase's longest word (the
+    most selective one, usually); the other words are then checked by position.
+    """
+    words = [word for _, _, word in tokenize(phrase)]
+    if not words:
+        return []
+    anchor = max(range(len(words)), key=lambda i: len(words[i]))
+    positions = db.session.execute(
+        db.select(RecordingWord.position)
+          .where(RecordingWord.recording_id == recording_id, RecordingWord.word == words[anchor])
+          .order_by(RecordingWord.position)
+          .limit(MAX_PHRASE_CANDIDATES)
+    ).scalars().all()
+    starts = [position - anchor for position in positions if position >= anchor]
+    if not starts:
+        return []
+
+    wanted = {start + offset for start in starts for offset in range(len(words))}
+    rows = {row.position: row for row in db.session.execute(
+        db.select(RecordingWord)
+          .where(RecordingWord.recording_id == recording_id, RecordingWord.position.in_(wanted))
+    ).scalars()}
+
+    matches = []
+    for start in starts:
+        window = [rows.get(start + offset) for offset in range(len(words))]
+        if all(row is not None and row.word == word for row, word in zip(window, words)):
+            matches.append({
+                'position': start,
+                'start_time': window[0].start_time,
+                'end_time': window[-1].end_time,
+                'char_start': window[0].char_start,
+                'char_end': window[-1].char_end
+            })
+            if len(matches) >= limit:
+                break
+    return matches
@@ -0,0 +1,29 @@
+"""
+Background job worker, run next to the web server:
+
+    python -m src.worker --threads 2
+"""
+import argparse
+import logging
+import os
+import signal
+import sys
+# Same import root as main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from src.main import app
+from src.services.jobs import run_worker
+
+def main():
+    parser = argparse.ArgumentParser(description='Run queued archive jobs')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('JOB_WORKER_THREADS', 2)),
+                        help='jobs run concurrently (default 2)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    # docker stop: finish the running jobs, claim no new ones
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    run_worker(app, threads=max(args.threads, 1))
+
+if __name__ == '__main__':
+    main()
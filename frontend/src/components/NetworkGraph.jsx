@@ -50,19 +50,50 @@ const NetworkGraph = ({
       default: '#E8DDD4' // Sand
     }
 
+    // The API lays graphs out server-side (x/y on every node); only run the
+    // force simulation in the browser when positions are missing
+    const precomputed = data.nodes.length > 0 &&
+      data.nodes.every(d => Number.isFinite(d.x) && Number.isFinite(d.y))
+    let nodes = data.nodes
+    let edges = data.edges
+    if (precomputed) {
+      // Fit the layout into the viewport, on copies so the fetched data stays untouched
+      const [minX, maxX] = d3.extent(data.nodes, d => d.x)
+      const [minY, maxY] = d3.extent(data.nodes, d => d.y)
+      const scale = Math.min(
+        (width * 0.9) / ((maxX - minX) || 1),
+        (height * 0.9) / ((maxY - minY) || 1),
+        2
+      )
+      nodes = data.nodes.map(d => ({
+        ...d,
+        x: width / 2 + (d.x - (minX + maxX) / 2) * scale,
+        y: height / 2 + (d.y - (minY + maxY) / 2) * scale
+      }))
+      edges = data.edges.map(e => ({
+        ...e,
+        source: e.source.id ?? e.source,
+        target: e.target.id ?? e.target
+      }))
+    }
+
     // Create simulation
-    const sim = d3.forceSimulation(data.nodes)
-      .force("link", d3.forceLink(data.edges).id(d => d.id).distance(100))
+    const sim = d3.forceSimulation(nodes)
+      .force("link", d3.forceLink(edges).id(d => d.id).distance(100))
       .force("charge", d3.forceManyBody().strength(-300))
       .force("center", d3.forceCenter(width / 2, height / 2))
       .force("collision", d3.forceCollide().radius(30))
 
+    if (precomputed) {
+      sim.stop()
+    }
+
     setSimulation(sim)
 
     // Create links
     const link = g.append("g")
       .selectAll("line")
-      .data(data.edges)
+      .data(edges)
       .enter().append("line")
       .attr("class", "network-link")
       .attr("stroke-width", d => Math.sqrt(d.strength || 1) * 2)
@@ -70,13 +101,15 @@ const NetworkGraph = ({
     // Create nodes
     const node = g.append("g")
       .selectAll("circle")
-      .data(data.nodes)
+      .data(nodes)
       .enter().append("circle")
       .attr("r", d => {
         if (d.type === 'center') return 25
         if (d.type === 'category') return 20
         if (d.type === 'project') return 15
         if (d.type === 'person') return 12
+        // Items are sized by precomputed centrality when the API provides it
+        if (Number.isFinite(d.centrality)) return 8 + 10 * d.centrality
         return 10
       })
       .attr("fill", d => {
@@ -94,7 +127,7 @@ const NetworkGraph = ({
     if (showLabels) {
       const labels = g.append("g")
         .selectAll("text")
-        .data(data.nodes)
+        .data(nodes)
         .enter().append("text")
         .text(d => d.label)
         .attr("font-size", d => {
@@ -142,21 +175,32 @@ const NetworkGraph = ({
       })
     }
 
+    // Draw the precomputed layout once
+    if (precomputed) {
+      sim.on("tick")()
+    }
+
     // Add interactivity
     if (interactive) {
       node
         .call(d3.drag()
           .on("start", (event, d) => {
-            if (!event.active) sim.alphaTarget(0.3).restart()
+            if (!precomputed && !event.active) sim.alphaTarget(0.3).restart()
             d.fx = d.x
             d.fy = d.y
           })
           .on("drag", (event, d) => {
             d.fx = event.x
             d.fy = event.y
+            if (precomputed) {
+              // Static layout: move just the dragged node
+              d.x = event.x
+              d.y = event.y
+              sim.on("tick")()
+            }
           })
           .on("end", (event, d) => {
-            if (!event.active) sim.alphaTarget(0)
+            if (!precomputed && !event.active) sim.alphaTarget(0)
             d.fx = null
             d.fy = null
           }))
@@ -178,6 +222,7 @@ const NetworkGraph = ({
               if (d.type === 'category') return 25
               if (d.type === 'project') return 18
               if (d.type === 'person') return 15
+              if (Number.isFinite(d.centrality)) return 10 + 10 * d.centrality
               return 12
             })
             .attr("stroke-width", 3)
@@ -197,6 +242,7 @@ const NetworkGraph = ({
               if (d.type === 'category') return 20
               if (d.type === 'project') return 15
               if (d.type === 'person') return 12
+              if (Number.isFinite(d.centrality)) return 8 + 10 * d.centrality
               return 10
             })
             .attr("stroke-width", 2)